@@ -151,6 +151,7 @@ def run_with_retry(
     data: Union[xr.DataArray, xr.Dataset],
     user_request: str,
     max_attempts: int = 3,
+    stats: Optional[dict] = None,
 ) -> ExecutionResult:
     """
     Execute LLM-generated code with retry on failure.
@@ -162,11 +163,12 @@ def run_with_retry(
         data: xarray data to operate on
         user_request: Natural language request from user
         max_attempts: Maximum number of attempts (default 3)
+        stats: Optional precomputed variable statistics added to the prompt
         
     Returns:
         ExecutionResult with final success/failure and output
     """
-    prompt_builder = PromptBuilder(data)
+    prompt_builder = PromptBuilder(data, stats=stats)
     executor = CodeExecutor()
     
     # Get domain-specific hints if applicable
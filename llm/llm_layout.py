@@ -142,9 +142,11 @@ class CustomAnalysisUI:
         logger.info(f"Running custom analysis: provider={provider}, source={source_id}, request='{request}'")
         
         # Get source data
+        stats = None
         if source_id == "root":
             data = self.ncdash.data
             parent_node = self.ncdash.tree_root
+            stats = self.ncdash.stats_store.all()
         else:
             node = self.ncdash.tree_root.locate(source_id)
             if node is None:
@@ -170,7 +172,7 @@ class CustomAnalysisUI:
             self.status.object = "🧠 Generating and executing code..."
         
         # Run with retry (up to 3 attempts)
-        result = run_with_retry(llm_client, data, request, max_attempts=3)
+        result = run_with_retry(llm_client, data, request, max_attempts=3, stats=stats)
         
         if not result.success:
             raise RuntimeError(f"Analysis failed after 3 attempts: {result.error_message}")
@@ -13,14 +13,17 @@ from .prompts.base import SYSTEM_PROMPT, ERROR_CORRECTION_PROMPT, SUMMARY_PROMPT
 class PromptBuilder:
     """Builds prompts for LLM code generation from xarray data."""
     
-    def __init__(self, data: Union[xr.DataArray, xr.Dataset]):
+    def __init__(self, data: Union[xr.DataArray, xr.Dataset], stats: Optional[dict] = None):
         """
         Initialize with xarray data.
         
         Args:
             data: xarray DataArray or Dataset to analyze
+            stats: Optional precomputed statistics by variable name
+                (see model/stats_store.py), added to the variable descriptions
         """
         self.data = data
+        self.stats = stats or {}
     
     def _format_list(self, items: list[str]) -> str:
         """Format list as 'a, b and c'."""
@@ -63,11 +66,21 @@ class PromptBuilder:
         for var, info in vars_info.items():
             dims_str = ', '.join([f"{d}={s}" for d, s in zip(info['dims'], info['shape'])])
             info_lines.append(
-                f"  - '{var}': dims=({dims_str}), units='{info['units']}'"
+                f"  - '{var}': dims=({dims_str}), units='{info['units']}'{self._format_stats(var)}"
             )
         
         return var_names, '\n'.join(info_lines)
     
+    def _format_stats(self, var: str) -> str:
+        """Value range and valid fraction of a variable, if precomputed."""
+        stats = self.stats.get(var)
+        if not stats or not stats.get('quantiles') or None in stats['quantiles']:
+            return ''
+        lo, hi = stats['quantiles']
+        return (f", typical range=[{lo:.4g}, {hi:.4g}] (2-98%), "
+                f"min={stats['min']:.4g}, max={stats['max']:.4g}, "
+                f"valid (non-NaN)={stats['valid_fraction']:.0%}")
+
     def _get_coordinates_info(self) -> str:
         """Get detailed coordinate information with shapes."""
         coord_lines = []
@@ -1,24 +1,46 @@
 # AnimationNode — animates through a coordinate dimension with pre-rendered frames.
 
+import os
+import tempfile
+import uuid
+from concurrent.futures import wait
+from functools import partial
+
 import numpy as np
 import holoviews as hv
 import panel as pn
 
 from model.FigureNode import FigureNode
 from model.model_utils import PlotType, Resolutions
+from model.frame_store import get_frame_store
+from model.prefetch import get_prefetcher
+from model.scheduler import Priority, get_scheduler, visible_render
+from model.client_playback import ClientPlayer, shade_stack
+from model.projection import get_mercator_grid, lonlat_to_mercator
+from model.throttle import Viewport, ViewportThrottle
+from model.viewport import ranges_to_lonlat
 
 import cartopy.crs as ccrs
 import geoviews as gv
-from holoviews.operation.datashader import rasterize
 from loguru import logger
 
 # Set tolerance for irregular grids so Image does not warn
 hv.config.image_rtol = 0.1
 
 class AnimationNode(FigureNode):
+    # Pre-rendering reads the cube in chunk-aligned blocks of about this size (MB),
+    # one dask compute per block, and slices the frames out of memory
+    PRERENDER_BLOCK_MB = 256
+    # Reduced (coarsened, cropped) cubes are kept in RAM up to this size (MB) when they fit
+    # in the frame store budget (which they are counted against), in a memory-mapped temp
+    # file otherwise
+    MATERIALIZE_RAM_MB = 512
+    # Folder of the movies written by the export button
+    EXPORT_DIR = 'exports'
+
     def __init__(self, id, data, animation_coord, resolution, title=None, field_name=None, 
                  bbox=None, plot_type=PlotType.ThreeD_Animation, parent=None, cmap=None,
-                 x_range=None, y_range=None):
+                 x_range=None, y_range=None, source_indexers=None, pre_render=True):
 
         super().__init__(id, data, title=title, field_name=field_name, bbox=bbox, 
                          plot_type=plot_type, parent=parent, cmap=cmap)
@@ -26,28 +48,29 @@ class AnimationNode(FigureNode):
 
         self.animation_coord = animation_coord
         self.spatial_res = resolution
+        # isel indexers applied to the parent data to get ``data`` (see update_source)
+        self.source_indexers = source_indexers or {}
         
+        # Store requested viewport
+        self.x_range = x_range
+        self.y_range = y_range
+
         # Coarsen the data if necessary for performance
-        coarsen = 1
+        self.coarsen = 1
         if resolution == Resolutions.MEDIUM.value:
-            coarsen = 4
+            self.coarsen = 4
         if resolution == Resolutions.LOW.value:
-            coarsen = 8
-
-        if coarsen > 1:
-            data = data.coarsen({self.coord_names[-2]: coarsen, self.coord_names[-1]: coarsen}, 
-                                    boundary='trim').mean()
+            self.coarsen = 8
+        if resolution == Resolutions.AUTO.value:
+            self.coarsen = self._auto_coarsen(self._crop_data(data, x_range, y_range))
 
         # Crop data if ranges provided for performance, but with a buffer
-        self.data = self._crop_data(data, x_range, y_range)
+        self.data = self._reduce(data)
         self.anim_coord_name = animation_coord
-        
-        # Store requested viewport
-        self.x_range = x_range
-        self.y_range = y_range
 
         # Initialize Player widget for animation controls
         self.anim_values = self.data[self.anim_coord_name].values
+        self.anim_is_index = np.issubdtype(self.anim_values.dtype, np.integer)
         self.player = pn.widgets.Player(
             name=f'Player {self.id}',
             start=0, end=len(self.anim_values) - 1, value=0,
@@ -57,85 +80,550 @@ class AnimationNode(FigureNode):
         )
 
         # --- Caching and Pre-rendering ---
-        self._cache = {}
+        # Frames live in the process-wide frame store (shared memory budget, compressed);
+        # the element of the frame on screen is kept as is.
+        self._cache = get_frame_store().frames(f"{self.id}:{uuid.uuid4().hex[:8]}")
+        self._shown = None
+        # Rasterized aggregates of the frames at the current viewport and canvas, keyed by
+        # (frame, view); filled in the background so playback skips datashader
+        self._aggregates = get_frame_store().frames(f"{self._cache.owner}:agg")
+        self._aggregate_view = None
         self._is_alive = True
+        # Fraction of the reduced cube materialized so far (1 once playback reads from memory)
+        self.materialized = 0.0
+        self._cube_path = None
+        self._cube_bytes = 0
+        self.memory_pane = pn.pane.Str('', styles={'font-size': '11px', 'color': '#666'},
+                                       margin=(0, 10))
+
+        # Playback on the server (rasterized frame per player tick) or in the browser
+        # (frames shaded once at the viewport and played by JavaScript)
+        self.playback = pn.widgets.RadioButtonGroup(options=['Server', 'Browser'], value='Server',
+                                                    button_type='light', width=160)
+        self.playback.param.watch(self._on_playback, 'value')
+        self.client_pane = pn.pane.Bokeh(None, sizing_mode='stretch_width', min_height=450)
+        # The Bokeh pane mirrors the visibility of its layout, so a container is toggled instead
+        self.client_view = pn.Column(self.client_pane, visible=False, sizing_mode='stretch_width')
+        self._client = None
+        self._client_viewport = (None, None)
+        # Pan/zoom of the browser player, throttled and quantized like the server maps
+        self._client_ranges = hv.streams.RangeXY()
+        self._client_view = Viewport()
+        self._client_throttle = ViewportThrottle(self._client_ranges, self._client_view,
+                                                 self.viewport_throttle_ms, self.viewport_quantize_steps)
+        self._client_view.add_subscriber(self._shade_client_stack)
+        # The stack is shaded on the scheduler; only the latest request is shown
+        self._client_job = None
+        self._client_generation = 0
+        self.player_row = pn.Row(pn.layout.HSpacer(), self.player, pn.layout.HSpacer(), height=80)
+        self.param.watch(self._on_style_change, ['cmap', 'clim'])
         
-        # Start background pre-rendering
-        import threading
-        self._pre_render_thread = threading.Thread(target=self._run_pre_render, daemon=True)
-        self._pre_render_thread.start()
+        # Export to a movie (runs in the background, see model/export.py)
+        self.export_format = pn.widgets.Select(options=['mp4', 'gif'], value='mp4', width=80)
+        self.export_button = pn.widgets.Button(name='Export', button_type='light', width=80)
+        self.export_button.on_click(self._on_export)
+        self.export_status = pn.pane.Str('', styles={'font-size': '11px', 'color': '#666'}, margin=(0, 10))
+        self.export_download = pn.widgets.FileDownload(visible=False, button_type='success', width=160)
+        self._export_job = None
 
-    def _run_pre_render(self):
-        """Background thread to pre-populate the cache with rasterized frames."""
-        logger.info(f"Pre-rendering started for {self.id}")
-        for i in range(len(self.anim_values)):
-            if not self._is_alive:
-                break
+        # Start background pre-rendering (not needed for headless exports)
+        self._pre_render_job = None
+        if pre_render:
+            self._start_pre_render()
+
+    @staticmethod
+    def auto_coarsen_factor(window_shape, canvas, pixel_ratio=1):
+        """
+        Coarsening factor that leaves about one cell per rasterized pixel.
+
+        The field is drawn with its aspect ratio, so the axis with the most cells per
+        pixel sets the displayed resolution; coarsening more would lose detail,
+        coarsening less processes cells that cannot be shown.
+
+        Args:
+            window_shape: (ny, nx) cells of the cropped field.
+            canvas: (height, width) of the plot in screen pixels.
+            pixel_ratio: Oversampling of rasterize.
+        """
+        ny, nx = window_shape
+        height, width = canvas
+        return max(1, int(max(ny / (height * pixel_ratio), nx / (width * pixel_ratio))))
+
+    def _auto_coarsen(self, data):
+        """Coarsening of the cropped data for the canvas of the figure the animation starts from."""
+        size = getattr(self.parent, 'plot_size_stream', None)
+        canvas = (size.height, size.width) if size is not None else (None, None)
+        if None in canvas:
+            canvas = self.DEFAULT_CANVAS
+        window = (data.sizes[self.coord_names[-2]], data.sizes[self.coord_names[-1]])
+        factor = self.auto_coarsen_factor(window, canvas, self.PIXEL_RATIO)
+        logger.info(f"Animation {self.id}: {window} cells for a {canvas} canvas, coarsening by {factor}")
+        return factor
+
+    def _reduce(self, data):
+        """Crops the data to the viewport and coarsens it to the animation resolution."""
+        data = self._crop_data(data, self.x_range, self.y_range)
+        if self.coarsen > 1:
+            data = data.coarsen({self.coord_names[-2]: self.coarsen, self.coord_names[-1]: self.coarsen}, 
+                                    boundary='trim').mean()
+        return data
+
+    def update_source(self, data, stale_steps=None):
+        """
+        Follows new or rewritten steps of the animated data (files added while the server runs).
+        The player range grows in place, only changed frames are dropped from the cache
+        and the new ones are pre-rendered.
+
+        Args:
+            data: The data to animate, as given to the constructor.
+            stale_steps: Indices along the animation coordinate whose frames changed (None = all).
+        """
+        self.data = self._reduce(data)
+        self.anim_values = self.data[self.anim_coord_name].values
+        if stale_steps is None:
+            self._cache.clear()
+        else:
+            for index in stale_steps:
+                self._cache.discard(index)
+        self._release_aggregates()
+        self._shown = None
+        self.player.end = len(self.anim_values) - 1
+        if stale_steps is None or stale_steps & {self.player.value}:
+            self.player.param.trigger('value')
+        if self.playback.value == 'Browser':
+            self._shade_client_stack()
+        if self._is_alive and (self._pre_render_job is None or self._pre_render_job.done()):
+            self._start_pre_render()
+
+    @staticmethod
+    def plan_blocks(n_frames, chunks, frame_bytes, max_bytes):
+        """
+        Split the animation axis into blocks read with one compute each.
+
+        Blocks follow the dask chunks of the axis: small chunks are merged and large
+        ones split so a block stays under ``max_bytes`` (and holds at least one frame).
+
+        Args:
+            n_frames: Length of the animation axis.
+            chunks: Dask chunk sizes along the axis, or None for in-memory/lazy-loaded data.
+            frame_bytes: Size of one (reduced) frame.
+            max_bytes: Target size of a block.
+
+        Returns:
+            List of (start, stop) frame ranges.
+        """
+        per_block = max(1, int(max_bytes // max(frame_bytes, 1)))
+        chunks = tuple(chunks) if chunks else (n_frames,)
+        blocks, start, stop = [], 0, 0
+        for size in chunks:
+            chunk_start, chunk_stop = stop, stop + size
+            if chunk_stop - start > per_block and stop > start:
+                blocks.append((start, stop))
+                start = stop
+            # Chunks larger than a block are split
+            while chunk_stop - start > per_block:
+                blocks.append((start, start + per_block))
+                start += per_block
+            stop = chunk_stop
+        if stop > start:
+            blocks.append((start, stop))
+        return [(b0, min(b1, n_frames)) for b0, b1 in blocks if b0 < n_frames]
+
+    def _allocate_cube(self, data):
+        """
+        float32 array for the reduced cube: in RAM when it is small and the frame store
+        budget has room for it (the cube is then counted against that budget), memory-mapped
+        in a temp file otherwise.
+        """
+        nbytes = data.size * 4
+        self._release_cube()
+        self._cube_bytes = nbytes
+        if (nbytes <= self.MATERIALIZE_RAM_MB * 1024 ** 2
+                and self._cache.store.reserve(f"{self._cache.owner}:cube", nbytes)):
+            return np.empty(data.shape, dtype=np.float32)
+        fd, self._cube_path = tempfile.mkstemp(prefix='ncdashboard_anim_', suffix='.f32')
+        os.close(fd)
+        logger.info(f"Materializing {self.id} ({nbytes / 1024 ** 2:.0f} MB) in {self._cube_path}")
+        return np.memmap(self._cube_path, dtype=np.float32, mode='w+', shape=data.shape)
+
+    def _release_cube(self):
+        """Returns the budget reserved by the cube and removes its temp file."""
+        self._cache.store.unreserve(f"{self._cache.owner}:cube")
+        self._cube_bytes = 0
+        if self._cube_path is not None:
             try:
-                if i not in self._cache:
-                    self._get_frame(i)
-            except Exception as e:
-                logger.error(f"Pre-render error at index {i}: {e}")
+                os.remove(self._cube_path)
+            except OSError:
+                pass
+            self._cube_path = None
+
+    def _start_pre_render(self):
+        """Queues the pre-rendering on the scheduler, one step per block of frames."""
+        self._pre_render_job = get_scheduler().submit_steps(self._pre_render_steps(), Priority.PRERENDER,
+                                                            owner=self._cache.owner)
+
+    def wait_pre_render(self, timeout=None):
+        """Blocks until the pre-rendering is done (or cancelled)."""
+        if self._pre_render_job is not None:
+            wait([self._pre_render_job], timeout=timeout)
+
+    def _pre_render_steps(self):
+        """
+        Background job: materializes the reduced cube and pre-populates the cache.
+
+        The lazy (dask) cube is read once, block by block; each block fills the
+        float32 cube and the frames it contains are stored. Once complete, the cube
+        replaces the lazy data, so playback never re-runs the coarsening. The
+        generator yields after every block, so the scheduler can run more urgent
+        work (or other sessions) in between.
+        """
+        logger.info(f"Pre-rendering started for {self.id}")
+        evictions = self._cache.evictions
+        budget_reached = False
+        data = None
+        # Planned again when update_source swaps the data while blocks are being read
+        while self._is_alive and data is not self.data:
+            data = self.data
+            n_frames = data.sizes[self.anim_coord_name]
+            axis = data.dims.index(self.anim_coord_name)
+            chunks = data.chunks[axis] if data.chunks is not None else None
+            cube = self._allocate_cube(data) if chunks is not None else None
+            self.materialized = 0.0 if cube is not None else 1.0
+            frame_bytes = data.dtype.itemsize * data.size // max(n_frames, 1)
+            blocks = self.plan_blocks(n_frames, chunks, frame_bytes, self.PRERENDER_BLOCK_MB * 1024 ** 2)
+            for start, stop in blocks:
+                if not self._is_alive or data is not self.data:
+                    cube = None
+                    break
+                # Stop storing frames once the memory budget is full rather than
+                # evicting the frames just stored (the cube is still materialized)
+                if not budget_reached and self._cache.evictions > evictions:
+                    logger.warning(f"Frame cache budget reached, pre-rendering of {self.id} stopped at {start}")
+                    budget_reached = True
+                missing = [] if budget_reached else [i for i in range(start, stop) if i not in self._cache]
+                if cube is None and not missing:
+                    continue
+                try:
+                    # One compute for the block (data and coordinates); frames are sliced from memory
+                    first, last = (start, stop) if cube is not None else (missing[0], missing[-1] + 1)
+                    block = data.isel({self.anim_coord_name: slice(first, last)}).compute()
+                    if cube is not None:
+                        target = [slice(None)] * data.ndim
+                        target[axis] = slice(first, last)
+                        cube[tuple(target)] = block.values
+                        self.materialized = last / n_frames
+                    for i in missing:
+                        if not self._is_alive:
+                            break
+                        values, lat_vals, lon_vals = self._read_frame(i - first, block=block)
+                        self._cache.put(i, values, lat_vals, lon_vals)
+                except Exception as e:
+                    logger.error(f"Pre-render error in frames {start}-{stop}: {e}")
+                    if cube is not None:
+                        self._release_cube()
+                    cube = None
+                    self.materialized = 0.0
+                self._update_memory_info()
+                yield
+            if cube is not None and data is self.data and self._is_alive:
+                self.data = data = self._materialized(data, cube)
+                logger.info(f"Materialized the reduced cube of {self.id} {data.shape}")
+        self._update_memory_info()
         logger.info(f"Pre-rendering completed for {self.id}")
 
+    @staticmethod
+    def _materialized(data, cube):
+        """``data`` backed by the materialized cube, with its coordinates loaded."""
+        data = data.copy(data=cube)
+        lazy = {name: c.compute() for name, c in data.coords.items() if c.chunks is not None}
+        return data.assign_coords(lazy) if lazy else data
+
+    def close(self):
+        """Stops pre-rendering and releases the cached frames and the materialized cube."""
+        self._is_alive = False
+        get_scheduler().cancel(self._cache.owner)
+        get_scheduler().cancel(self._client_owner)
+        self._cache.clear()
+        self._release_aggregates()
+        self._shown = None
+        self._release_cube()
+        super().close()
+
     def __del__(self):
         self._is_alive = False
+        if hasattr(self, '_cache'):
+            self._cache.clear()
+        if hasattr(self, '_aggregates'):
+            self._aggregates.clear()
+        if hasattr(self, '_cube_path'):
+            self._release_cube()
+
+    def memory_info(self) -> str:
+        """Frames (and rasterized aggregates) cached for this animation, its cube and the memory they use."""
+        nbytes = self._cache.nbytes + self._aggregates.nbytes
+        info = f"{len(self._cache)}/{len(self.anim_values)} frames cached"
+        if len(self._aggregates):
+            info += f", {len(self._aggregates)} rasterized"
+        info += f", {nbytes / 1024 ** 2:.1f} MB"
+        if self._cube_bytes:
+            info += f", cube {self._cube_bytes / 1024 ** 2:.1f} MB {'on disk' if self._cube_path else 'in RAM'}"
+        if self.materialized < 1:
+            info = f"Loading data {self.materialized:.0%}, {info}"
+        return info
+
+    def _update_memory_info(self):
+        self.memory_pane.object = self.memory_info()
+
+    def _frame_values(self, index):
+        """Values and coordinates of a frame, from the frame store when it is there."""
+        frame = self._cache.get(index)
+        if frame is None:
+            return self._read_frame(index)
+        return frame.values(), frame.lat_vals, frame.lon_vals
+
+    # ------------------------------------------------------- rasterized aggregates
+    def _get_aggregate(self, index, view):
+        """
+        Rasterized frame at ``view``, from the aggregate cache when the background
+        worker already computed it, rasterized live (and stored) otherwise.
+        """
+        if view != self._aggregate_view:
+            # The viewport or canvas changed: aggregates of the old view are useless
+            self._release_aggregates()
+            self._aggregate_view = view
+            self._schedule_aggregates(view, index)
+
+        cached = self._stored_aggregate(self._aggregates.get((index, view)))
+        if cached is not None:
+            return cached
+        agg = self._rasterize(self._get_frame(index), view)
+        self._store_aggregate(index, view, agg)
+        return agg
+
+    def _store_aggregate(self, index, view, agg):
+        if self._is_alive and view == self._aggregate_view:
+            self._aggregates.put((index, view), *self._aggregate_arrays(agg))
+
+    def _schedule_aggregates(self, view, index=0):
+        """Queues the rasterization of every frame at ``view``, in playback order from ``index``."""
+        n_frames = len(self.anim_values)
+        order = [(index + k) % n_frames for k in range(1, n_frames)]
+        get_prefetcher().schedule(self._aggregates.owner,
+                                  [lambda i=i: self._aggregate_job(i, view) for i in order], Priority.PRERENDER)
+
+    def _aggregate_job(self, index, view):
+        """Background job: rasterizes one frame at ``view`` unless the view changed meanwhile."""
+        if not self._is_alive or view != self._aggregate_view or (index, view) in self._aggregates:
+            return
+        self._store_aggregate(index, view, self._rasterize(self._frame_element(index), view))
+        self._update_memory_info()
+
+    def _release_aggregates(self):
+        get_prefetcher().cancel(self._aggregates.owner)
+        self._aggregate_view = None
+        self._aggregates.clear()
+
+    # ------------------------------------------------------------ browser playback
+    def _on_playback(self, event):
+        browser = event.new == 'Browser'
+        if browser and not self._shade_client_stack():
+            self.playback.value = 'Server'
+            return
+        if browser:
+            self.player.pause()
+        elif self._client is not None:
+            self.player.value = self._client.slider.value
+        self._set_server_view(not browser)
+
+    def _set_server_view(self, visible):
+        """Shows the server-rendered figure and player, or the browser player instead."""
+        self.player_row.visible = visible
+        self.client_view.visible = not visible
+        for obj in (self.view_container or []):
+            if isinstance(obj, pn.pane.HoloViews):
+                obj.visible = visible
+
+    def _on_style_change(self, *events):
+        if self.playback.value == 'Browser':
+            self._shade_client_stack(*self._client_viewport)
+
+    def _on_client_ranges(self, event):
+        self._client_ranges.event(x_range=(event.x0, event.x1), y_range=(event.y0, event.y1))
+
+    def _shade_client_stack(self, x_range=None, y_range=None):
+        """
+        Shades every frame at the viewport and sends the stack to the browser player.
+
+        The frames are shaded and encoded by a PRERENDER job on the scheduler (replacing the
+        one still queued, if any); within a session the stack is pushed to the player on the
+        next tick of the document.
+
+        Args:
+            x_range, y_range: Viewport (meters or degrees); defaults to the server figure viewport.
+
+        Returns:
+            False when the grid cannot be played in the browser (curvilinear without regridding,
+            0..360 longitudes).
+        """
+        values, lat_vals, lon_vals = self._frame_values(0)
+        grid = get_mercator_grid(lat_vals, lon_vals)
+        if grid is None:
+            logger.warning(f"Browser playback is not available for the grid of {self.id}")
+            if pn.state.notifications is not None:
+                pn.state.notifications.warning("Browser playback is not available for this grid", duration=3000)
+            return False
+
+        if x_range is None or y_range is None:
+            x_range, y_range = self.range_stream.x_range, self.range_stream.y_range
+        bbox = ranges_to_lonlat(x_range, y_range)
+        if bbox is not None:
+            x0, y0 = lonlat_to_mercator(bbox[0], bbox[2])
+            x1, y1 = lonlat_to_mercator(bbox[1], bbox[3])
+            x_range, y_range = (float(x0), float(x1)), (float(y0), float(y1))
+        else:
+            x_range = y_range = None
+        self._client_viewport = (x_range, y_range)
+
+        size = self.plot_size_stream
+        canvas = (size.height, size.width) if None not in (size.height, size.width) else self.DEFAULT_CANVAS
+        self._client_generation += 1
+        generation = self._client_generation
+        doc = pn.state.curdoc
+        if doc is not None and doc.session_context is None:
+            doc = None
+
+        def encode():
+            if not self._is_alive or generation != self._client_generation:
+                return
+            frames = [values] + [self._frame_values(i)[0] for i in range(1, len(self.anim_values))]
+            clim = self.clim
+            if None in clim:
+                clim = (float(np.nanmin([np.nanmin(f) for f in frames])),
+                        float(np.nanmax([np.nanmax(f) for f in frames])))
+            shaded = shade_stack(frames, grid, x_range, y_range, canvas, self.cmap, clim)
+            if shaded is None or generation != self._client_generation:
+                return
+            if doc is None:
+                self._show_client_stack(shaded, x_range, y_range)
+            else:
+                doc.add_next_tick_callback(lambda: self._show_client_stack(shaded, x_range, y_range, generation))
+
+        scheduler = get_scheduler()
+        scheduler.cancel(self._client_owner)
+        self._client_job = scheduler.submit(encode, Priority.PRERENDER, owner=self._client_owner)
+        return True
+
+    @property
+    def _client_owner(self):
+        return f"{self._cache.owner}:client"
+
+    def _show_client_stack(self, shaded, x_range, y_range, generation=None):
+        """Sends a shaded stack (PNG urls, extent) to the browser player, creating it the first time."""
+        if generation is not None and generation != self._client_generation:
+            return
+        urls, extent = shaded
+        first = self._client is None
+        if first:
+            from bokeh.events import RangesUpdate
+            self._client = ClientPlayer(gv.tile_sources.OSM.data, interval_ms=self.player.interval)
+            self._client.figure.on_event(RangesUpdate, self._on_client_ranges)
+            self._client.set_viewport(x_range or (extent[0], extent[2]), y_range or (extent[1], extent[3]))
+        self._client.update(urls, extent, self.player.value if first else self._client.slider.value)
+        if first:
+            self.client_pane.object = self._client.layout
+        logger.info(f"Shaded {len(urls)} frames of {self.id} for browser playback")
+
+    # ------------------------------------------------------------------ export
+    def _on_export(self, event):
+        self.export_button.disabled = True
+        self.export_download.visible = False
+        self.export_status.object = "Export queued"
+        # Cancelled with the node when it is closed before the export starts
+        self._export_job = get_scheduler().submit(partial(self._run_export, self.export_format.value),
+                                                  Priority.PRERENDER, owner=self.owner)
+
+    def _run_export(self, fmt):
+        """Background job: exports the animation to EXPORT_DIR and offers the file for download."""
+        from model.export import export_animation
+
+        def progress(done, total):
+            self.export_status.object = f"Exporting {done}/{total} frames"
+
+        out_path = os.path.join(self.EXPORT_DIR, f"{self.id}.{fmt}")
+        try:
+            result = export_animation(self, out_path, fmt=fmt, progress=progress)
+            self.export_status.object = f"Exported {result.frames} frames ({result.fps:.1f} frames/s)"
+            self.export_download.param.update(file=result.path, filename=os.path.basename(result.path),
+                                              label=f"Download {fmt.upper()}", visible=True)
+        except Exception as e:
+            logger.error(f"Export of {self.id} failed: {e}")
+            self.export_status.object = f"Export failed: {e}"
+        finally:
+            self.export_button.disabled = False
+
+    def _store_frame(self, index):
+        """Reads a frame and puts it in the frame store."""
+        values, lat_vals, lon_vals = self._read_frame(index)
+        self._cache.put(index, values, lat_vals, lon_vals)
+        return values, lat_vals, lon_vals
 
     def _get_frame(self, index):
         """Internal method to get or compute a specific frame."""
-        if index in self._cache:
-            return self._cache[index]
+        shown = self._shown
+        if shown is not None and shown[0] == index:
+            return shown[1]
 
-        val = self.anim_values[index]
-        
+        img = self._frame_element(index)
+        self._shown = (index, img)
+        return img
+
+    def _frame_element(self, index):
+        """Builds the element of a frame (in Web Mercator when the grid allows it)."""
+        frame = self._cache.get(index)
+        if frame is None:
+            values, lat_vals, lon_vals = self._store_frame(index)
+        else:
+            values, lat_vals, lon_vals = frame.values(), frame.lat_vals, frame.lon_vals
+
+        _, _, lats_coord, lons_coord = self._coords_of(self.data)
+        vdims = [hv.Dimension(self.field_name, label=self.label)]
+        lat_name = lats_coord.name if lats_coord.name else self.coord_names[-2]
+        lon_name = lons_coord.name if lons_coord.name else self.coord_names[-1]
+
+        # Use QuadMesh for curvilinear grids (e.g. WRF), Image otherwise; the grid is
+        # projected to Web Mercator once and shared by every frame
+        return self._geo_element(values, lat_vals, lon_vals, [lon_name, lat_name], vdims)
+
+    def _read_frame(self, index, block=None):
+        """
+        Values and coordinates of a frame, read from the (reduced) data, or sliced
+        from ``block`` (frames already loaded by the pre-render, ``index`` relative to it).
+        """
         # Use isel() for integer/index-based coordinates (e.g. WRF's 'Time' dimension
         # which has no real coordinate values, just 0,1,2,...).
         # sel(method='nearest') on such coords causes xarray to embed
         # {'method': 'nearest'} in the result's metadata, which HoloViews
         # then tries to use as a format-string key → KeyError.
-        coord_vals = self.data[self.anim_coord_name].values
-        coord_is_index = np.issubdtype(coord_vals.dtype, np.integer)
-        
-        if coord_is_index:
+        if block is not None:
+            frame_data = block.isel({self.anim_coord_name: index})
+        elif self.anim_is_index:
             frame_data = self.data.isel({self.anim_coord_name: index})
         else:
-            frame_data = self.data.sel({self.anim_coord_name: val}, method='nearest')
+            frame_data = self.data.sel({self.anim_coord_name: self.anim_values[index]}, method='nearest')
 
         
-        from model.model_utils import get_all_coords
-        _, _, lats_coord, lons_coord = get_all_coords(frame_data)
+        _, _, lats_coord, lons_coord = self._coords_of(frame_data)
         
+        values = frame_data.values
         lat_vals = lats_coord.values
         lon_vals = lons_coord.values
-        
-        if lat_vals.ndim > 1:
-            lat_vals = lat_vals[:, 0]
-        if lon_vals.ndim > 1:
-            lon_vals = lon_vals[0, :]
-        
-        # Format value for title
-        if isinstance(val, (float, np.float32, np.float64)):
-            val_str = f"{val:.2f}"
-        else:
-            val_str = str(val)
 
-        title = self._safe_title(f"{self.title or self.id} - [{index}] {self.anim_coord_name}: {val_str}")
-        
-        vdims = [hv.Dimension(self.field_name, label=self.label)]
-        
-        lat_name = lats_coord.name if lats_coord.name else self.coord_names[-2]
-        lon_name = lons_coord.name if lons_coord.name else self.coord_names[-1]
-
-        # Use QuadMesh for curvilinear grids (e.g. WRF), Image otherwise
+        # Curvilinear grids (e.g. WRF) are regridded to a regular raster (fast Image path)
         if lat_vals.ndim > 1 or lon_vals.ndim > 1:
-            img = gv.QuadMesh((lons_coord, lats_coord, frame_data.values), [lon_name, lat_name],
-                              vdims=vdims, crs=ccrs.PlateCarree())
-        else:
-            img = gv.Image((lon_vals, lat_vals, frame_data.values), [lon_name, lat_name], 
-                           vdims=vdims, crs=ccrs.PlateCarree())
-        
-        self._cache[index] = img
-        return img
+            regridder = self._regridder()
+            if regridder is not None:
+                values, lat_vals, lon_vals = regridder.regrid(values)
+        return values, lat_vals, lon_vals
 
     def _crop_data(self, data, x_range, y_range):
         """Crops the data to the specified ranges with a small buffer."""
@@ -165,8 +653,7 @@ class AnimationNode(FigureNode):
 
             logger.info(f"Cropping data with buffer: Lon({min_lon-lon_buffer:.2f}, {max_lon+lon_buffer:.2f}), Lat({min_lat-lat_buffer:.2f}, {max_lat+lat_buffer:.2f})")
             
-            lats = data[lat_dim].values
-            if len(lats) > 1 and lats[0] > lats[-1]:
+            if self.roles.orders['lat'] < 0:
                 lat_slice = slice(max_lat + lat_buffer, min_lat - lat_buffer)
             else:
                 lat_slice = slice(min_lat - lat_buffer, max_lat + lat_buffer)
@@ -178,11 +665,14 @@ class AnimationNode(FigureNode):
             logger.error(f"Failed to crop data: {e}")
             return data
 
+    @visible_render
     def _render_frame(self, **kwargs):
         """Callback for DynamicMap to render a single frame of the animation."""
         index = kwargs.get('value', 0)
         try:
-            img = self._get_frame(index)
+            view = self._view_key(kwargs.get('x_range'), kwargs.get('y_range'),
+                                  kwargs.get('width'), kwargs.get('height'))
+            img = self._get_aggregate(index, view)
             
             # Recalculate title for the specific frame
             val = self.anim_values[index]
@@ -192,8 +682,9 @@ class AnimationNode(FigureNode):
                 val_str = str(val)
             title = self._safe_title(f"{self.title or self.id} - [{index}] {self.anim_coord_name}: {val_str}")
             self.title_val = title
+            self._update_memory_info()
             
-            # Return styled image. Rasterize is applied at the top level.
+            # Already rasterized at the viewport; styling is applied at the top level.
             return img.opts()
         except Exception as e:
             logger.error(f"Error rendering frame {index}: {e}")
@@ -206,12 +697,16 @@ class AnimationNode(FigureNode):
     def create_figure(self):
         logger.info(f"Creating dynamic animation for {self.id}...")
         
+        # Only the player drives frame rendering; cmap/clim are applied on the
+        # rasterized output so color changes keep every cached frame.
         player_stream = hv.streams.Params(self.player, ['value'])
-        param_stream = hv.streams.Params(self, ['cmap', 'clim'])
-        self.dmap = hv.DynamicMap(self._render_frame, streams=[player_stream, param_stream])
+        # The viewport and canvas size key the rasterized aggregates (and browser playback)
+        self.dmap = hv.DynamicMap(self._render_frame,
+                                  streams=[player_stream, self.range_stream, self.plot_size_stream])
         
-        # Wrap in rasterize: it will render the data into an image server-side
-        self.rasterized = rasterize(self.dmap, pixel_ratio=2).apply.opts(
+        # Frames are rasterized server-side by the callback (from the aggregate cache
+        # when possible), so no rasterize operation wraps the DynamicMap
+        self.rasterized = self.dmap.apply.opts(
             alpha=0.8,
             cmap=self.param.cmap,
             clim=self.param.clim,
@@ -256,7 +751,9 @@ class AnimationNode(FigureNode):
 
     def get_controls(self):
         """Returns the player widget as navigation controls."""
-        return pn.Row(pn.layout.HSpacer(), self.player, pn.layout.HSpacer(), height=80)
+        return pn.Column(self.player_row, self.client_view,
+                         pn.Row(self.playback, self.memory_pane, pn.layout.HSpacer(), self.export_status,
+                                self.export_format, self.export_button, self.export_download, align='center'))
 
     def get_anim_dim_name(self) -> str:
         return self.anim_coord_name
\ No newline at end of file
@@ -1,10 +1,26 @@
 # An enum with the types of plots
+import math
+import time
+import uuid
+
 import holoviews as hv
 import panel as pn
 import xarray as xr
 import numpy as np
-
-from model.model_utils import PlotType, get_all_coords
+import geoviews as gv
+import cartopy.crs as ccrs
+from holoviews.operation.datashader import rasterize
+
+from model.model_utils import PlotType
+from model.coord_roles import get_coord_roles
+from model.viewport import compute_index_window, ranges_to_lonlat
+from model.slice_cache import window_key
+from model.prefetch import get_prefetcher
+from model.scheduler import Priority, get_scheduler
+from model.pyramid import choose_factor, coarsen_coord
+from model.regrid import get_regridder
+from model.projection import MERCATOR, get_mercator_coords, get_mercator_grid
+from model.throttle import DEFAULT_QUANTIZE_STEPS, DEFAULT_THROTTLE_MS, Viewport, ViewportThrottle
 from proj_layout.utils import select_colormap
 
 import param
@@ -22,12 +38,42 @@ class FigureNode(param.Parameterized, metaclass=ParameterizedABC):
     GEO_TOOLS = ['hover', 'pan', 'wheel_zoom', 'save', 'copy', 'reset']
     GEO_ACTIVE_TOOLS = ['pan', 'wheel_zoom']
     DEFAULT_TOOLS = []
+    # Fraction of the viewport added on every side when reading a windowed slice,
+    # so small pans stay inside the data already sent to the browser.
+    VIEWPORT_MARGIN = 0.2
+    # Oversampling used by rasterize (pixels per screen pixel)
+    PIXEL_RATIO = 2
+    # Significant digits of the viewport kept in the key of rasterized aggregates, so
+    # float noise in the reported ranges does not miss the cache
+    AGGREGATE_DIGITS = 6
+    # Canvas (height, width) assumed until the plot reports its size
+    DEFAULT_CANVAS = (500, 800)
+    # Curvilinear (2D lat/lon) slices are regridded to a regular raster with this
+    # method ('nearest', 'bilinear' or None to draw a QuadMesh). Inherited from the parent.
+    REGRID_METHOD = 'bilinear'
+    # Build elements directly in Web Mercator (the tiles' projection) from a per-grid
+    # resampling, instead of letting GeoViews reproject every frame. Inherited from the parent.
+    PROJECT_MERCATOR = True
+    # Pan/zoom events re-render maps at most once per VIEWPORT_THROTTLE_MS, with ranges
+    # quantized to VIEWPORT_QUANTIZE_STEPS cells per range (see model/throttle.py).
+    # Inherited from the parent.
+    VIEWPORT_THROTTLE_MS = DEFAULT_THROTTLE_MS
+    VIEWPORT_QUANTIZE_STEPS = DEFAULT_QUANTIZE_STEPS
+    # Progressive rendering: when reading a slice at full resolution is expected to take
+    # longer than PROGRESSIVE_MS, a strided (or overview) version is shown first and
+    # replaced once the full read is done. 0 disables it. Inherited from the parent.
+    PROGRESSIVE_MS = 100
+    # Read throughput (values/s) assumed until the node has timed a full resolution read
+    DEFAULT_READ_RATE = 20e6
 
     def __init__(self, id, data, title=None, field_name=None, bbox=None, plot_type = PlotType.TwoD, 
                  parent=None,  cmap=None, **params):
         super().__init__(**params)
         self.parent = parent
         self.id = id
+        # Owner of the node's background work in the process-wide prefetcher/scheduler.
+        # Ids are only unique within a session (two sessions may both open "temp").
+        self.owner = f"{id}:{uuid.uuid4().hex[:8]}"
         self.bbox = bbox
         self.children = []
         self.field_name = field_name
@@ -35,12 +81,35 @@ class FigureNode(param.Parameterized, metaclass=ParameterizedABC):
         self.add_node_callback = None
         self.id_generator_callback = None
         self.maximized = False
+        # Shared SliceCache, set by Dashboard for nodes that plot dataset variables
+        self.slice_cache = None
+        # Overview levels of the variable (VariablePyramid), set by Dashboard when enabled.
+        # With pyramid_on_demand, missing levels are written in the background when needed.
+        self.pyramid = None
+        self.pyramid_on_demand = True
+        self._overview_coords = {}
+        self.regrid_method = getattr(parent, 'regrid_method', self.REGRID_METHOD)
+        # Regridder per overview factor (1 = full resolution), None for regular grids
+        self._regridders = {}
+        self.project_mercator = getattr(parent, 'project_mercator', self.PROJECT_MERCATOR)
+        self.viewport_throttle_ms = getattr(parent, 'viewport_throttle_ms', self.VIEWPORT_THROTTLE_MS)
+        self.viewport_quantize_steps = getattr(parent, 'viewport_quantize_steps', self.VIEWPORT_QUANTIZE_STEPS)
+        self.progressive_ms = getattr(parent, 'progressive_ms', self.PROGRESSIVE_MS)
+        # Throughput of the last full resolution read from disk (values/s)
+        self._read_rate = self.DEFAULT_READ_RATE
 
         # Streams shared by all geo nodes:
         # update_stream: triggers DynamicMap re-render (e.g. when slider changes)
         # range_stream: captures current viewport (x/y ranges) for zoom tracking
         self.update_stream = hv.streams.Counter()
         self.range_stream = hv.streams.RangeXY()
+        # view_stream: range_stream throttled and quantized, re-renders maps (see _throttle_viewport)
+        self.view_stream = Viewport()
+        self._viewport_throttle = None
+        # Last rasterized aggregate: template (dims, CRS) of the aggregates rebuilt from a cache
+        self._aggregate_like = None
+        # plot_size_stream: canvas size in pixels, used to pick the overview level
+        self.plot_size_stream = hv.streams.PlotSize()
 
         
         # Background color for relationship tracking
@@ -72,6 +141,8 @@ class FigureNode(param.Parameterized, metaclass=ParameterizedABC):
         self.long_name = field_name
         self.units = 'no units'
         self.data = data
+        # Time/depth/lat/lon roles of the variable, resolved once (the root node holds a Dataset)
+        self.roles = get_coord_roles(data) if isinstance(data, xr.DataArray) else None
         try:
             # If there is a long name, then we use it
             self.long_name = data.long_name.capitalize()
@@ -133,6 +204,242 @@ class FigureNode(param.Parameterized, metaclass=ParameterizedABC):
             y = 0 # Handle potential pole issues
         return x, y
 
+    def _coords_of(self, data):
+        """(times, depth, lats, lons) of the node data or a slice of it, from the cached roles."""
+        roles = self.roles if self.roles is not None else get_coord_roles(data)
+        return roles.coords(data)
+
+    def _crop_to_viewport(self, data, x_range=None, y_range=None):
+        """
+        Restrict a lazily sliced 2D field to the current viewport plus a margin.
+
+        Only the coordinate arrays are inspected here, so no field values are read
+        from disk. The returned DataArray is still lazy and is read by the caller.
+
+        Args:
+            data: DataArray whose last two dims are (lat, lon).
+            x_range: Viewport x range from ``range_stream`` (None = full extent).
+            y_range: Viewport y range from ``range_stream`` (None = full extent).
+
+        Returns:
+            Tuple (windowed DataArray, window) where window is a (lat_slice, lon_slice)
+            tuple, or ``(data, None)`` when the viewport is unknown.
+        """
+        if data.ndim < 2:
+            return data, None
+        _, _, lats, lons = self._coords_of(data)
+        roles = self.roles or get_coord_roles(data)
+        window = compute_index_window(lats.values, lons.values, x_range, y_range,
+                                      margin=self.VIEWPORT_MARGIN,
+                                      orders=(roles.orders['lat'], roles.orders['lon']))
+        if window is None:
+            return data, None
+        lat_dim, lon_dim = data.dims[-2], data.dims[-1]
+        return data.isel({lat_dim: window[0], lon_dim: window[1]}), window
+
+    def _read_values(self, data, window=None, time_idx=None, depth_idx=None):
+        """
+        Read the values of a (windowed) 2D slice, going through the shared slice cache.
+
+        Args:
+            data: Lazy DataArray already restricted to ``window``.
+            window: (lat_slice, lon_slice) over the full slice, or None.
+            time_idx: Index of the time slice (None for 2D fields).
+            depth_idx: Index of the depth slice (None for 2D/3D fields).
+
+        Returns:
+            numpy array with the slice values.
+        """
+        if self.slice_cache is None or self.field_name is None:
+            return data.values
+        slice_key = (self.field_name, time_idx, depth_idx)
+        return self.slice_cache.get_or_load(slice_key, window_key(window), lambda: self._timed_read(data))
+
+    def _timed_read(self, data):
+        """Read ``data`` and record the read throughput (see ``_coarse_stride``)."""
+        start = time.perf_counter()
+        values = data.values
+        self._read_rate = values.size / max(time.perf_counter() - start, 1e-6)
+        return values
+
+    def _read_field(self, data, window, lats, lons, time_idx=None, depth_idx=None, canvas=None):
+        """
+        Read a (windowed) 2D slice and its coordinates, from the coarsest overview
+        level that still fills the canvas when one is available.
+
+        Args:
+            data: Lazy DataArray already restricted to ``window``.
+            window: (lat_slice, lon_slice) over the full slice, or None.
+            lats: Latitude coordinate of ``data`` (1D or 2D).
+            lons: Longitude coordinate of ``data`` (1D or 2D).
+            time_idx: Index of the time slice (None for 2D fields).
+            depth_idx: Index of the depth slice (None for 2D/3D fields).
+            canvas: (height, width) of the plot in screen pixels, or None if unknown.
+
+        Returns:
+            Tuple (values, lat values, lon values) as numpy arrays.
+        """
+        lead_idx = tuple(i for i in (time_idx, depth_idx) if i is not None)
+        overview = self._read_overview(window, lead_idx, canvas)
+        if overview is not None:
+            return overview
+        values = self._read_values(data, window, time_idx=time_idx, depth_idx=depth_idx)
+        if window is None and self.pyramid is not None and self.pyramid_on_demand:
+            # A full slice was just read: its overview levels are cheap to derive now
+            self._schedule_pyramid_build(lead_idx, values)
+        regridder = self._regridder()
+        if regridder is not None:
+            return regridder.regrid(values, window)
+        return values, np.asarray(lats.values), np.asarray(lons.values)
+
+    def _read_overview(self, window, lead_idx, canvas=None):
+        """
+        Read the window from an overview level, or return None when the full
+        resolution is needed (or the level is not built yet).
+        """
+        pyramid = self.pyramid
+        factor = self._overview_factor(window, canvas)
+        if factor == 1:
+            return None
+        if not pyramid.has(lead_idx):
+            if self.pyramid_on_demand:
+                self._schedule_pyramid_build(lead_idx)
+            return None
+
+        return self._read_level(lead_idx, factor, window)
+
+    def _overview_factor(self, window, canvas=None):
+        """Coarsest overview factor that still fills the canvas (1 = full resolution or no pyramid)."""
+        pyramid = self.pyramid
+        if pyramid is None or not pyramid.factors:
+            return 1
+        if window is None:
+            window_shape = (pyramid.ny, pyramid.nx)
+        else:
+            window_shape = (window[0].stop - window[0].start, window[1].stop - window[1].start)
+        height, width = canvas if canvas and None not in canvas else self.DEFAULT_CANVAS
+        return choose_factor(window_shape, (height * self.PIXEL_RATIO, width * self.PIXEL_RATIO),
+                             pyramid.factors)
+
+    def _read_level(self, lead_idx, factor, window):
+        """Read a window of the slice from the overview level ``factor`` (values, lats, lons)."""
+        values, (lat_sl, lon_sl) = self.pyramid.read(lead_idx, factor, window)
+        regridder = self._regridder(factor)
+        if regridder is not None:
+            return regridder.regrid(values, (lat_sl, lon_sl))
+        lats, lons = self._coarse_coords(factor)
+        if lats.ndim > 1 or lons.ndim > 1:
+            return values, lats[lat_sl, lon_sl], lons[lat_sl, lon_sl]
+        return values, lats[lat_sl], lons[lon_sl]
+
+    def _coarse_stride(self, data, window, time_idx=None, depth_idx=None, canvas=None):
+        """
+        Stride of the first pass of a progressive render, or None when the slice is read
+        at once: progressive rendering off, slice already in memory or served from an
+        overview level, or a full resolution read expected to take less than
+        ``progressive_ms`` at the last measured throughput.
+        """
+        if not self.progressive_ms or data.ndim < 2:
+            return None
+        if self.slice_cache is not None and self.field_name is not None and self.slice_cache.contains(
+                (self.field_name, time_idx, depth_idx), window_key(window)):
+            return None
+        lead_idx = tuple(i for i in (time_idx, depth_idx) if i is not None)
+        if self._overview_factor(window, canvas) > 1 and self.pyramid.has(lead_idx):
+            return None
+        budget = self._read_rate * self.progressive_ms / 1000
+        cells = data.shape[-2] * data.shape[-1]
+        if cells <= budget:
+            return None
+        return max(2, math.ceil(math.sqrt(cells / budget)))
+
+    def _read_coarse(self, data, window, stride, time_idx=None, depth_idx=None):
+        """
+        First pass of a progressive render: the slice from an overview level when it is
+        built, otherwise read with a stride along lat and lon.
+
+        Returns:
+            Tuple (values, lat values, lon values) as numpy arrays.
+        """
+        lead_idx = tuple(i for i in (time_idx, depth_idx) if i is not None)
+        pyramid = self.pyramid
+        if pyramid is not None and pyramid.factors and pyramid.has(lead_idx):
+            factor = min((f for f in pyramid.factors if f >= stride), default=max(pyramid.factors))
+            return self._read_level(lead_idx, factor, window)
+        lat_dim, lon_dim = data.dims[-2], data.dims[-1]
+        coarse = data.isel({lat_dim: slice(None, None, stride), lon_dim: slice(None, None, stride)})
+        _, _, lats, lons = self._coords_of(coarse)
+        return coarse.values, np.asarray(lats.values), np.asarray(lons.values)
+
+    def _coarse_coords(self, factor):
+        """Block-mean lat/lon coordinates of an overview level (computed once per factor)."""
+        if factor not in self._overview_coords:
+            _, _, lats, lons = self._coords_of(self.data)
+            self._overview_coords[factor] = (coarsen_coord(lats.values, factor),
+                                             coarsen_coord(lons.values, factor))
+        return self._overview_coords[factor]
+
+    def _regridder(self, factor=1):
+        """
+        Regridder of the node grid (or of an overview level) to a regular raster.
+        Returns None for regular grids or when regridding is disabled.
+        """
+        if not self.regrid_method:
+            return None
+        if factor not in self._regridders:
+            _, _, lats, lons = self._coords_of(self.data)
+            regridder = None
+            if lats.ndim > 1 or lons.ndim > 1:
+                lat_vals, lon_vals = self._coarse_coords(factor) if factor > 1 else (lats.values, lons.values)
+                regridder = get_regridder(lat_vals, lon_vals, self.regrid_method)
+            self._regridders[factor] = regridder
+        return self._regridders[factor]
+
+    def _geo_element(self, values, lat_vals, lon_vals, kdims, vdims, **kwargs):
+        """
+        Geo element of a (lat, lon) slice: gv.Image for 1D coordinates, gv.QuadMesh for 2D ones.
+
+        With ``project_mercator`` the coordinates are projected once per grid (shared by all
+        nodes and frames) and the element is built in Web Mercator, so GeoViews does not
+        reproject it. Otherwise, or when the grid cannot be projected (e.g. 0..360 longitudes),
+        the element is in PlateCarree.
+        """
+        curvilinear = lat_vals.ndim > 1 or lon_vals.ndim > 1
+        element = gv.QuadMesh if curvilinear else gv.Image
+        if self.project_mercator:
+            if curvilinear:
+                projected = get_mercator_coords(lat_vals, lon_vals)
+                if projected is not None:
+                    x, y = projected
+                    return element((x, y, values), kdims, vdims=vdims, crs=MERCATOR, **kwargs)
+            else:
+                grid = get_mercator_grid(lat_vals, lon_vals)
+                if grid is not None:
+                    x, y, values = grid.project(values)
+                    return element((x, y, values), kdims, vdims=vdims, crs=MERCATOR, **kwargs)
+        return element((lon_vals, lat_vals, values), kdims, vdims=vdims, crs=ccrs.PlateCarree(), **kwargs)
+
+    def _schedule_pyramid_build(self, lead_idx, values=None):
+        """
+        Write the overview levels of one slice in the background.
+
+        Args:
+            lead_idx: Indices over the leading dims, () for 2D fields.
+            values: Full slice if it was already read (otherwise it is read by the job).
+        """
+        pyramid = self.pyramid
+        if pyramid.has(lead_idx):
+            return
+
+        def job():
+            if pyramid.has(lead_idx):
+                return
+            full = values if values is not None else self.data[lead_idx].values
+            pyramid.write(lead_idx, full)
+
+        # Only the latest requested slice matters: older queued builds are dropped
+        get_prefetcher().schedule(f"{self.owner}:pyramid", [job], Priority.PRERENDER)
+
     def _build_marker_overlay(self):
         """Build a DynamicMap for the tap marker overlay."""
         def _get_marker(x, y):
@@ -176,7 +483,107 @@ class FigureNode(param.Parameterized, metaclass=ParameterizedABC):
             for child in self.children:
                 child.remove_id(id)
 
+    def close(self):
+        '''Stops background work of the node and its children and releases their caches'''
+        get_scheduler().cancel(self.owner)
+        prefetcher = get_prefetcher()
+        prefetcher.cancel(self.owner)
+        prefetcher.cancel(f"{self.owner}:pyramid")
+        for child in self.children:
+            child.close()
+
     # -------- Plotting methods ---------
+    def _view_key(self, x_range, y_range, width, height):
+        """
+        Viewport and canvas an aggregate is rasterized for: ranges rounded to
+        AGGREGATE_DIGITS significant digits (None = full extent) and the canvas
+        size in rasterized pixels.
+        """
+        def rounded(bounds):
+            if bounds is None or None in bounds:
+                return None
+            return tuple(float(f"{float(b):.{self.AGGREGATE_DIGITS}g}") for b in bounds)
+
+        if width is None or height is None:
+            height, width = self.DEFAULT_CANVAS
+        return (rounded(x_range), rounded(y_range),
+                int(width * self.PIXEL_RATIO), int(height * self.PIXEL_RATIO))
+
+    def _rasterize(self, element, view):
+        """
+        Datashader aggregate of an element at ``view`` (see ``_view_key``).
+
+        The view ranges are in Web Mercator: elements left in PlateCarree by ``_geo_element``
+        (0..360 longitudes, ``project_mercator`` off, curvilinear grids that cannot be
+        projected) are rasterized in lon/lat (see ``_rasterize_lonlat``).
+        """
+        x_range, y_range, width, height = view
+        if not isinstance(element.crs, type(MERCATOR)):
+            agg = self._rasterize_lonlat(element, x_range, y_range, width, height)
+            self._aggregate_like = agg
+            return agg
+        ranges = {}
+        if x_range is not None:
+            ranges['x_range'] = x_range
+        if y_range is not None:
+            ranges['y_range'] = y_range
+        # The canvas of the view already includes PIXEL_RATIO: no further device scaling
+        agg = rasterize(element, dynamic=False, width=width, height=height, pixel_ratio=1, **ranges)
+        self._aggregate_like = agg
+        return agg
+
+    @staticmethod
+    def _rasterize_lonlat(element, x_range, y_range, width, height):
+        """
+        Aggregate of a PlateCarree element at a Web Mercator view, in Web Mercator.
+
+        The view is converted to the longitude convention of the element (0..360 or
+        -180..180), the element is rasterized in lon/lat and the (regular) aggregate is
+        resampled to Web Mercator like the grids of ``_geo_element``.
+        """
+        ranges = {}
+        bbox = ranges_to_lonlat(x_range, y_range)
+        if bbox is not None:
+            lon0, lon1, lat0, lat1 = bbox
+            # Views west of Greenwich over data in 0..360 longitudes
+            if lon1 < 0 and element.range(0)[1] > 180:
+                lon0, lon1 = lon0 + 360, lon1 + 360
+            ranges = dict(x_range=(lon0, lon1), y_range=(lat0, lat1))
+        agg = rasterize(element, dynamic=False, width=width, height=height, pixel_ratio=1, **ranges)
+        lons = agg.dimension_values(0, expanded=False)
+        lats = agg.dimension_values(1, expanded=False)
+        if lons.size and np.nanmin(lons) > 180:
+            lons = lons - 360
+        grid = get_mercator_grid(lats, lons)
+        if grid is None:
+            return agg
+        x, y, values = grid.project(agg.dimension_values(2, flat=False))
+        return gv.Image((x, y, values), kdims=agg.kdims, vdims=agg.vdims, crs=MERCATOR, group=agg.group)
+
+    def _stored_aggregate(self, stored):
+        """Aggregate rebuilt from a StoredFrame of the frame store (None before any rasterization)."""
+        like = self._aggregate_like
+        if stored is None or like is None:
+            return None
+        return type(like)((stored.lon_vals, stored.lat_vals, stored.values()),
+                          kdims=like.kdims, vdims=like.vdims, crs=like.crs, group=like.group)
+
+    @staticmethod
+    def _aggregate_arrays(agg):
+        """(values, y, x) of an aggregate, as stored in the frame store."""
+        return (agg.dimension_values(2, flat=False), agg.dimension_values(1, expanded=False),
+                agg.dimension_values(0, expanded=False))
+
+    def _throttle_viewport(self, dmap):
+        """
+        Links ``range_stream`` to the plot of ``dmap`` without re-rendering it, and feeds
+        ``view_stream`` from it, throttled and quantized. Renderers depend on ``view_stream``.
+        """
+        self.range_stream.source = dmap
+        if self._viewport_throttle is None:
+            self._viewport_throttle = ViewportThrottle(self.range_stream, self.view_stream,
+                                                       self.viewport_throttle_ms, self.viewport_quantize_steps)
+
     @abstractmethod
     def create_figure(self):
         pass
@@ -207,7 +614,7 @@ class FigureNode(param.Parameterized, metaclass=ParameterizedABC):
         '''
         animation_coords = []
         if self.plot_type.can_request_animation():
-            times, zaxis, _, _= get_all_coords(self.data)
+            times, zaxis, _, _= self._coords_of(self.data)
             if times.size > 1:
                 animation_coords.append(times.dims[0].capitalize()) # type: ignore
             if zaxis.size > 1:
@@ -249,6 +656,18 @@ class FigureNode(param.Parameterized, metaclass=ParameterizedABC):
     def set_data(self, data):
         self.data = data
 
+    def update_data(self, data, stale_steps=None):
+        """
+        Swap in a new version of the node data after files were added to the dataset.
+
+        Args:
+            data: The variable from the reopened dataset.
+            stale_steps: Indices along the first dim whose values changed (None = all).
+        """
+        self.data = data
+        self.roles = get_coord_roles(data)
+        self._overview_coords = {}
+
     def set_parent(self, parent):
         self.parent = parent
 
@@ -5,10 +5,10 @@ import holoviews as hv
 import geoviews as gv
 import cartopy.crs as ccrs
 import panel as pn
-from holoviews.operation.datashader import rasterize
 
 from model.ThreeDNode import ThreeDNode
-from model.model_utils import PlotType, get_all_coords
+from model.model_utils import PlotType
+from model.scheduler import visible_render
 from loguru import logger
 import param
 
@@ -25,6 +25,12 @@ class FourDNode(ThreeDNode):
         self.depth_coord_name = data.coords[self.coord_names[1]].name
         logger.info(f"Created FourDNode: id={id}, shape={data.shape}, coords={self.coord_names}")
 
+    def _slice_for(self, time_idx, depth_idx=None):
+        """Lazy 2D slice of the field at the given time and depth indices."""
+        if depth_idx is None:
+            depth_idx = self.depth_idx
+        return self.data[time_idx, depth_idx, :, :]
+
     def _animate_callback(self, animation_coord, data=None):
         """
         Overrides animation callback to slice 4D data into 3D before animation.
@@ -34,72 +40,53 @@ class FourDNode(ThreeDNode):
         # self.coord_names[1] is Depth (depth_idx)
         
         sliced_data = self.data
+        source_indexers = {}
         
         if animation_coord == self.coord_names[0]: # Animating Time
              # Fix Depth to current index
              depth_dim = self.coord_names[1]
              # Select returns a new dataset with that dimension removed (if drop=True which is default for simple index selection in xarray? No, wait)
              # .isel(depth=0) reduces dimension.
-             sliced_data = self.data.isel({depth_dim: self.depth_idx})
+             source_indexers = {depth_dim: self.depth_idx}
+             sliced_data = self.data.isel(source_indexers)
              logger.info(f"Animating Time. Sliced Depth at index {self.depth_idx}. New shape: {sliced_data.shape}")
              
         elif animation_coord == self.coord_names[1]: # Animating Depth
              # Fix Time to current index
              time_dim = self.coord_names[0]
-             sliced_data = self.data.isel({time_dim: self.third_coord_idx})
+             source_indexers = {time_dim: self.third_coord_idx}
+             sliced_data = self.data.isel(source_indexers)
              logger.info(f"Animating Depth. Sliced Time at index {self.third_coord_idx}. New shape: {sliced_data.shape}")
         
         # Call parent with sliced data
-        super()._animate_callback(animation_coord, data=sliced_data)
+        super()._animate_callback(animation_coord, data=sliced_data, source_indexers=source_indexers)
 
+    @visible_render
     def _render_plot(self, counter=0, **kwargs):
-        # Retrieve params from kwargs (stream) or self (fallback)
-        cmap = kwargs.get('cmap_val', self.cmap)
-        clim = kwargs.get('clim_val', self.clim)
-
-        data = self.data  
-        times_coord, z_coord, lats_coord, lons_coord = get_all_coords(data)
-        
-        current_slice = data[self.third_coord_idx, self.depth_idx,:,:]
+        # Colormap and color range are applied downstream on the rasterized output
+        # (see create_figure), so changing them never re-reads the slice.
+        generation = self._nav_generation
+        time_idx, depth_idx = self.third_coord_idx, self.depth_idx
+        times_coord, z_coord, _, _ = self._coords_of(self.data)
 
         # Build Title Dynamic names
         t_name = times_coord.name if times_coord.name else self.coord_names[0]
         z_name = z_coord.name if z_coord.name else self.coord_names[1]
-        
-        title = self._safe_title(f'{self.title} at {t_name.capitalize()} {self.third_coord_idx} and {z_name.capitalize()} {self.depth_idx}')
-        self.title_val = title
-        
-        # Use geoviews Image for geographic plotting
-        vdims = [hv.Dimension(self.field_name, label=self.label)]
-        lat_name = lats_coord.name if lats_coord.name else self.coord_names[-2]
-        lon_name = lons_coord.name if lons_coord.name else self.coord_names[-1]
-
-        group_name = f"Group_{self.id}"
-        
-        # Check if coordinates are multidimensional (Curvilinear grid)
-        if lats_coord.ndim > 1 or lons_coord.ndim > 1:
-            img = gv.QuadMesh((lons_coord, lats_coord, current_slice.values), [lon_name, lat_name], 
-                             vdims=vdims, crs=ccrs.PlateCarree(), group=group_name)
-        else:
-            lat_vals = lats_coord.values
-            lon_vals = lons_coord.values
-            img = gv.Image((lon_vals, lat_vals, current_slice.values), [lon_name, lat_name], 
-                           vdims=vdims, crs=ccrs.PlateCarree(), group=group_name)
-
-        return img.opts(cmap=cmap, clim=clim)
+        title = self._safe_title(f'{self.title} at {t_name.capitalize()} {time_idx} and {z_name.capitalize()} {depth_idx}')
+        return self._render_slice(self._slice_for(time_idx, depth_idx), title, kwargs, generation,
+                                  time_idx, depth_idx)
 
     def create_figure(self):
-        # Create a stream that watches for cmap and clim (color range) changes
-        self.param_stream = hv.streams.Params(self, ['cmap', 'clim'],
-                                              rename={'cmap': 'cmap_val', 'clim': 'clim_val'})
-
-        # Return a DynamicMap that updates when update_stream or range_stream is triggered
-        # We also watch param_stream so the title (which shows the scale) updates
+        # Return a DynamicMap that updates when update_stream or view_stream (the throttled
+        # range_stream) is triggered.
+        # cmap/clim are deliberately not streams here: they only re-shade the rasterized output.
         self.dmap = hv.DynamicMap(self._render_plot, 
-                                  streams=[self.update_stream, self.range_stream, self.param_stream])
+                                  streams=[self.update_stream, self.view_stream, self.plot_size_stream])
+        self._throttle_viewport(self.dmap)
 
-        # Wrap in rasterize: it will render the data into an image server-side
-        styled_dmap = rasterize(self.dmap, pixel_ratio=2).apply.opts(
+        # Slices are rasterized server-side by the callback (from the aggregate cache when
+        # the view was already shown), so no rasterize operation wraps the DynamicMap
+        styled_dmap = self.dmap.apply.opts(
             alpha=0.8,
             cmap=self.param.cmap,
             clim=self.param.clim,
@@ -129,30 +116,37 @@ class FourDNode(ThreeDNode):
     # Next time and depth functions are used to update the time and depth indices.
     def next_depth(self):
         self.depth_idx = (self.depth_idx + 1) % len(self.data[self.depth_coord_name])
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
+        self._prefetch_neighbours('depth', +1)
         return self.depth_idx
     
     def prev_depth(self):
         self.depth_idx = (self.depth_idx - 1) % len(self.data[self.depth_coord_name])
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
+        self._prefetch_neighbours('depth', -1)
         return self.depth_idx
 
     def first_depth(self):
         self.depth_idx = 0
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
+        self._prefetch_neighbours('depth', +1)
         return self.depth_idx
 
     def last_depth(self):
         self.depth_idx = len(self.data[self.depth_coord_name]) - 1
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
+        self._prefetch_neighbours('depth', -1)
         return self.depth_idx
 
     def set_depth_idx(self, depth_idx):
         self.depth_idx = depth_idx
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
     
     def get_depth_idx(self):
         return self.depth_idx
+
+    def _nav_index(self, coord):
+        return self.depth_idx if coord == self.coord_names[1] else self.third_coord_idx
     
     def get_controls(self):
         # Time controls from parent (specifying animate_coord)
@@ -1,17 +1,27 @@
+import uuid
+
+import numpy as np
 import holoviews as hv
 import geoviews as gv
 import panel as pn
 import cartopy.crs as ccrs
-from holoviews.operation.datashader import rasterize
 from holoviews import streams
 from loguru import logger
 
 from model.FigureNode import FigureNode
 from model.AnimationNode import AnimationNode
-from model.model_utils import PlotType, Resolutions, get_all_coords
+from model.frame_store import get_frame_store
+from model.model_utils import PlotType, Resolutions
+from model.prefetch import get_prefetcher
+from model.scheduler import Priority, get_scheduler, visible_render
+from model.slice_cache import window_key
+from model.watcher import is_stale
 import param
 
 class ThreeDNode(FigureNode):
+    # Navigation clicks within this delay (ms) are rendered once, at the latest index
+    NAV_DEBOUNCE_MS = 100
+
     # This is the constructor for the AnimationNode class. It calls its parent's constructor.
     # It also sets the animation coordinate and the resolution of the animation.
     # Eventhough the 1st dimensions may not be time, we are still calling it like that. 
@@ -30,24 +40,107 @@ class ThreeDNode(FigureNode):
         self.transect_path = None
         self.transect_stream = None
 
+        # Navigation direction (+1 forward, -1 backward) and how many slices to read ahead.
+        # The window of the last render is reused so prefetched slices match the viewport.
+        self.prefetch_depth = 0
+        self._last_window = None
+
+        # Navigation generation, bumped on every index change. Clicks are coalesced into
+        # one render of the latest index, and renders started for an older index return
+        # the element on screen instead of reading their (stale) slice.
+        self._nav_generation = 0
+        self._rendered_generation = -1
+        self._render_pending = False
+        self._last_element = None
+        # Index labels of the navigation controls, by coordinate
+        self._nav_labels = {}
+        # Rasterized aggregates of the slices shown, keyed by (variable, time index, depth
+        # index, view), in the frame store: going back to a viewport (e.g. reset) skips both
+        # the read and datashader. The one on screen is kept uncompressed (its key in
+        # _raw_aggregate_key) and compressed once another one is shown.
+        self._aggregates = get_frame_store().frames(f"{self.id}:{uuid.uuid4().hex[:8]}:agg")
+        self._raw_aggregate_key = None
+        # Key of the latest render, and background full resolution pass of a progressive
+        # render (see _coarse_pass)
+        self._render_key = None
+        self._fine_owner = f"{self._aggregates.owner}:fine"
+        self._fine_pass = None
+
+    def _slice_for(self, time_idx, depth_idx=None):
+        """Lazy 2D slice of the field at the given indices (depth is ignored for 3D)."""
+        return self.data[time_idx, :, :]
+
+    def _prefetch_neighbours(self, axis, direction):
+        """
+        Queue background reads of the next slices in the navigation direction.
+
+        Args:
+            axis: 'time' (first dim) or 'depth' (second dim, FourDNode only).
+            direction: +1 when stepping forward, -1 when stepping backward.
+        """
+        if self.slice_cache is None or self.prefetch_depth <= 0 or direction == 0:
+            return
+
+        time_idx = self.third_coord_idx
+        depth_idx = getattr(self, 'depth_idx', None)
+        if axis == 'depth':
+            n = len(self.data[self.depth_coord_name])
+            targets = [(time_idx, (depth_idx + k * direction) % n) for k in range(1, self.prefetch_depth + 1)]
+        else:
+            n = len(self.data[self.coord_names[0]])
+            targets = [((time_idx + k * direction) % n, depth_idx) for k in range(1, self.prefetch_depth + 1)]
+
+        window = self._last_window
+        cache = self.slice_cache
+
+        def make_job(t, z):
+            def job():
+                if cache.contains((self.field_name, t, z), window_key(window)):
+                    return
+                data = self._slice_for(t, z)
+                if window is not None:
+                    data = data.isel({data.dims[-2]: window[0], data.dims[-1]: window[1]})
+                # A render asking for this slice meanwhile waits for this read (and vice versa)
+                cache.get_or_load((self.field_name, t, z), window_key(window), lambda: data.values)
+            return job
+
+        get_prefetcher().schedule(self.owner, [make_job(t, z) for t, z in targets if (t, z) != (time_idx, depth_idx)])
+
+    @visible_render
     def _render_plot(self, counter=0, **kwargs):
-        # Retrieve params from kwargs (stream) or self (fallback)
-        # We renamed stream params to avoid auto-mapping conflicts in HoloViews
-        cmap = kwargs.get('cmap_val', self.cmap)
-        clim = kwargs.get('clim_val', self.clim)
-
-        data = self.data
-        if self.plot_type == PlotType.ThreeD:
-            # We assume logical structure [time, lat, lon] for 3D
-            # Select the time slice
-            data = self.data[self.third_coord_idx, :, :]
-
-        # Use centralized coordinate extraction
-        times_coord, _, lats_coord, lons_coord = get_all_coords(data)
-        
+        # Colormap and color range are applied downstream on the rasterized output
+        # (see create_figure), so changing them never re-reads the slice.
+        generation = self._nav_generation
+        time_idx = self.third_coord_idx
+        # We assume logical structure [time, lat, lon] for 3D
+        data = self._slice_for(time_idx)
+
         # Get the name of the coordinate being sliced (Time/Depth)
+        times_coord = self._coords_of(data)[0]
         slice_coord_name = times_coord.name if times_coord.name else self.coord_names[0]
-        title = self._safe_title(f'{self.title} at {slice_coord_name.capitalize()} {self.third_coord_idx}')
+        title = self._safe_title(f'{self.title} at {slice_coord_name.capitalize()} {time_idx}')
+        return self._render_slice(data, title, kwargs, generation, time_idx)
+
+    def _render_slice(self, data, title, kwargs, generation, time_idx, depth_idx=None):
+        """
+        Render flow shared by the 3D and 4D maps: crops the slice to the viewport and returns
+        its aggregate from the cache, a coarse first pass on a slow (cold) read, or the full
+        resolution read.
+
+        Args:
+            data: Lazy 2D slice at ``time_idx`` (and ``depth_idx``).
+            title: Title of the plot at these indices.
+            kwargs: Stream values of the DynamicMap (viewport and canvas).
+            generation: Navigation generation when the render was requested.
+            time_idx, depth_idx: Indices of the slice (depth_idx is None for 3D fields).
+
+        Returns:
+            The element to show.
+        """
+        # Only keep the part of the slice that is visible (plus a margin) before reading it
+        data, window = self._crop_to_viewport(data, kwargs.get('x_range'), kwargs.get('y_range'))
+        self._last_window = window
+        _, _, lats_coord, lons_coord = self._coords_of(data)
         self.title_val = title
 
         # Use geoviews Image for geographic plotting
@@ -55,31 +148,49 @@ class ThreeDNode(FigureNode):
         lat_name = lats_coord.name if lats_coord.name else self.coord_names[-2]
         lon_name = lons_coord.name if lons_coord.name else self.coord_names[-1]
 
-        # Check if coordinates are multidimensional (Curvilinear grid)
-        if lats_coord.ndim > 1 or lons_coord.ndim > 1:
-            img = gv.QuadMesh((lons_coord, lats_coord, data.values), [lon_name, lat_name], 
-                             vdims=vdims, crs=ccrs.PlateCarree(), group=f"Group_{self.id}")
-        else:
-            lat_vals = lats_coord.values
-            lon_vals = lons_coord.values
-            img = gv.Image((lon_vals, lat_vals, data.values), [lon_name, lat_name], 
-                           vdims=vdims, crs=ccrs.PlateCarree(), group=f"Group_{self.id}")
+        # Read the slice (from the slice cache when it was already on screen, or from an
+        # overview level when zoomed out), unless a newer index was requested meanwhile
+        if self._superseded(generation):
+            return self._last_element
+        key = self._aggregate_key(kwargs, depth_idx=depth_idx)
+        self._render_key = key
+        cached = self._cached_aggregate(key)
+        if cached is not None:
+            return self._rendered(cached, generation)
 
-        return img.opts(cmap=cmap, clim=clim)
+        def element_of(values, lat_vals, lon_vals):
+            # Image for regular grids, QuadMesh for curvilinear ones, in Web Mercator when possible
+            return self._geo_element(values, lat_vals, lon_vals, [lon_name, lat_name], vdims,
+                                     group=f"Group_{self.id}")
 
-    def create_figure(self):
-        # Create a stream that watches for cmap and clim (color range) changes
-        # Rename parameters to prevent duplicate/conflicting application by HoloViews
-        self.param_stream = hv.streams.Params(self, ['cmap', 'clim'], 
-                                              rename={'cmap': 'cmap_val', 'clim': 'clim_val'})
+        canvas = (kwargs.get('height'), kwargs.get('width'))
 
-        # Return a DynamicMap that updates when update_stream or range_stream is triggered
-        # We also watch param_stream so the title (which shows the scale) updates
+        def read():
+            return self._read_field(data, window, lats_coord, lons_coord, time_idx=time_idx,
+                                    depth_idx=depth_idx, canvas=canvas)
+
+        # On a slow (cold) read, a coarse version is shown first
+        coarse = self._coarse_pass(key, data, window, read, element_of, generation, time_idx, depth_idx,
+                                   canvas=canvas)
+        if coarse is not None:
+            return self._rendered(coarse, generation)
+        values, lat_vals, lon_vals = read()
+
+        if self._superseded(generation):
+            return self._last_element
+        return self._rendered(self._store_aggregate(key, element_of(values, lat_vals, lon_vals)), generation)
+
+    def create_figure(self):
+        # Return a DynamicMap that updates when update_stream or view_stream (the throttled
+        # range_stream) is triggered.
+        # cmap/clim are deliberately not streams here: they only re-shade the rasterized output.
         self.dmap = hv.DynamicMap(self._render_plot, 
-                                  streams=[self.update_stream, self.range_stream, self.param_stream])
+                                  streams=[self.update_stream, self.view_stream, self.plot_size_stream])
+        self._throttle_viewport(self.dmap)
         
-        # Wrap in rasterize: it will render the data into an image server-side
-        styled_dmap = rasterize(self.dmap, pixel_ratio=2).apply.opts(
+        # Slices are rasterized server-side by the callback (from the aggregate cache when
+        # the view was already shown), so no rasterize operation wraps the DynamicMap
+        styled_dmap = self.dmap.apply.opts(
             alpha=0.8,
             cmap=self.param.cmap,
             clim=self.param.clim,
@@ -107,34 +218,206 @@ class ThreeDNode(FigureNode):
 
     def next_slice(self):
         self.third_coord_idx = (self.third_coord_idx + 1) % len(self.data[self.coord_names[0]])
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
+        self._prefetch_neighbours('time', +1)
         return self.third_coord_idx
     
     def prev_slice(self):
         self.third_coord_idx = (self.third_coord_idx - 1) % len(self.data[self.coord_names[0]])
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
+        self._prefetch_neighbours('time', -1)
         return self.third_coord_idx
 
     def set_third_coord_idx(self, third_coord_idx):
         self.third_coord_idx = third_coord_idx
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
         
     def get_third_coord_idx(self):
         return self.third_coord_idx
 
+    def _request_render(self):
+        """
+        Shows the new index in the navigation labels right away and renders it:
+        immediately outside a server session, otherwise after NAV_DEBOUNCE_MS so a
+        burst of clicks renders only the latest index.
+        """
+        self._nav_generation += 1
+        self._update_nav_labels()
+        doc = pn.state.curdoc
+        if doc is None or doc.session_context is None or self.NAV_DEBOUNCE_MS <= 0:
+            self._flush_render()
+        elif not self._render_pending:
+            self._render_pending = True
+            doc.add_timeout_callback(self._flush_render, self.NAV_DEBOUNCE_MS)
+
+    def _flush_render(self):
+        self._render_pending = False
+        # A render triggered meanwhile (e.g. a pan) may already show the latest index
+        if self._rendered_generation != self._nav_generation:
+            self.update_stream.event(counter=self.update_stream.counter + 1)
+
+    def _superseded(self, generation):
+        """True when the index changed since a render started (and there is an element to keep)."""
+        return generation != self._nav_generation and self._last_element is not None
+
+    def _rendered(self, element, generation):
+        self._last_element = element
+        self._rendered_generation = generation
+        return element
+
+    def _aggregate_key(self, kwargs, depth_idx=None):
+        """
+        Key of the aggregate of the current slice at the viewport and canvas of the stream
+        values (the view last); the regridding and projection settings shape the element too.
+        """
+        view = self._view_key(kwargs.get('x_range'), kwargs.get('y_range'),
+                              kwargs.get('width'), kwargs.get('height'))
+        return (self.field_name, self.third_coord_idx, depth_idx,
+                self.regrid_method, self.project_mercator, view)
+
+    def _store_aggregate(self, key, element):
+        """Rasterizes ``element`` at the view of ``key`` and keeps the aggregate."""
+        agg = self._rasterize(element, key[-1])
+        self._aggregates.put(key, *self._aggregate_arrays(agg), compression='none')
+        self._keep_raw(key)
+        return agg
+
+    def _cached_aggregate(self, key):
+        """Aggregate of ``key`` from the frame store (None on a miss), uncompressed while shown."""
+        stored = self._aggregates.get(key)
+        if stored is None:
+            return None
+        if stored.codec != 'none':
+            self._aggregates.put(key, stored.values(), stored.lat_vals, stored.lon_vals, compression='none')
+            stored = self._aggregates.get(key) or stored
+        self._keep_raw(key)
+        return self._stored_aggregate(stored)
+
+    def _keep_raw(self, key):
+        """Makes ``key`` the aggregate kept uncompressed, compressing the previous one."""
+        previous, self._raw_aggregate_key = self._raw_aggregate_key, key
+        if previous is not None and previous != key:
+            self._aggregates.demote(previous)
+
+    def _coarse_pass(self, key, data, window, read, element_of, generation, time_idx,
+                     depth_idx=None, canvas=None):
+        """
+        First pass of a progressive render, in a server session: the aggregate of a strided
+        (or overview) version of the slice, while the full resolution is read on the
+        scheduler and shown once done. The full pass is dropped when another index or view
+        is requested meanwhile.
+
+        Args:
+            key: Aggregate key of the render (see ``_aggregate_key``).
+            data: Lazy slice, already restricted to ``window``.
+            window: (lat_slice, lon_slice) over the full slice, or None.
+            read: Reads the full resolution (values, lat values, lon values).
+            element_of: Builds the geo element of (values, lat values, lon values).
+            generation: Navigation generation of the render.
+            time_idx, depth_idx: Indices of the slice.
+            canvas: (height, width) of the plot in screen pixels.
+
+        Returns:
+            The coarse aggregate, or None when the slice should be read at once (see ``_coarse_stride``).
+        """
+        doc = pn.state.curdoc
+        if doc is None or doc.session_context is None:
+            return None
+        stride = self._coarse_stride(data, window, time_idx, depth_idx, canvas)
+        if stride is None:
+            return None
+        coarse = element_of(*self._read_coarse(data, window, stride, time_idx, depth_idx))
+
+        def moved_on():
+            return generation != self._nav_generation or key != self._render_key
+
+        def fine():
+            if moved_on():
+                return False
+            element = element_of(*read())
+            if moved_on():
+                return False
+            self._store_aggregate(key, element)
+            doc.add_next_tick_callback(lambda: self._show_fine(key))
+            return True
+
+        scheduler = get_scheduler()
+        scheduler.cancel(self._fine_owner)
+        self._fine_pass = scheduler.submit(fine, Priority.VISIBLE, owner=self._fine_owner)
+        return self._rasterize(coarse, key[-1])
+
+    def _show_fine(self, key):
+        """Re-renders (from the aggregate cache) once the full resolution of ``key`` is ready."""
+        if key == self._render_key:
+            self.update_stream.event(counter=self.update_stream.counter + 1)
+
+    def _nav_index(self, coord):
+        """Current index along a navigation coordinate."""
+        return self.third_coord_idx
+
+    def _nav_label(self, coord):
+        """Value and position of the current index along ``coord``, e.g. ``2020-01-03T00:00 (3/31)``."""
+        values = self.data[coord].values
+        idx = self._nav_index(coord)
+        value = values[idx]
+        if np.issubdtype(values.dtype, np.datetime64):
+            text = np.datetime_as_string(value, unit='m')
+        elif np.issubdtype(values.dtype, np.floating):
+            text = f"{value:g}"
+        else:
+            text = str(value)
+        return f"{text} ({idx + 1}/{len(values)})"
+
+    def _update_nav_labels(self):
+        for coord, pane in self._nav_labels.items():
+            pane.object = self._nav_label(coord)
+
     def first_slice(self):
         self.third_coord_idx = 0
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
+        # From the first slice the only way to go is forward
+        self._prefetch_neighbours('time', +1)
         return self.third_coord_idx
 
     def last_slice(self):
         self.third_coord_idx = len(self.data[self.coord_names[0]]) - 1
-        self.update_stream.event(counter=self.update_stream.counter + 1)
+        self._request_render()
+        self._prefetch_neighbours('time', -1)
         return self.third_coord_idx
 
-    def _animate_callback(self, animation_coord, data=None):
+    def update_data(self, data, stale_steps=None):
+        """
+        Swap in the grown/rewritten variable: navigation bounds follow the new length,
+        the current slice is re-rendered only if it changed and animations are extended.
+        """
+        super().update_data(data, stale_steps)
+        for child in self.children:
+            if not isinstance(child, AnimationNode):
+                continue
+            indexers = child.source_indexers
+            fixed_step = indexers.get(self.coord_names[0])
+            if fixed_step is None:
+                child_stale = stale_steps
+            else:
+                # Animation over depth at a fixed time: only that time step matters
+                child_stale = None if is_stale(stale_steps, fixed_step) else set()
+            child.update_source(self.data.isel(indexers) if indexers else self.data, child_stale)
+        # Aggregates are keyed by index, not by content
+        self._aggregates.clear()
+        if is_stale(stale_steps, self.third_coord_idx):
+            self.update_stream.event(counter=self.update_stream.counter + 1)
+
+    def close(self):
+        get_scheduler().cancel(self._fine_owner)
+        self._aggregates.clear()
+        super().close()
+
+    def _animate_callback(self, animation_coord, data=None, source_indexers=None):
         """
         Creates an AnimationNode and adds it to the dashboard via callback.
+
+        source_indexers: isel indexers that turn self.data into ``data`` (FourDNode
+        fixes the depth or time index), used to extend the animation when new files arrive.
         """
         if self.add_node_callback is None:
             logger.warning("No add_node_callback found for animation callback")
@@ -154,12 +437,12 @@ class ThreeDNode(FigureNode):
         else:
             node_id = f"{self.id}_anim"
 
-        # Create Animation Node (High Resolution, PlateCarree)
+        # Create Animation Node (resolution adapted to the visible extent and the canvas)
         # Using self as parent allows the animation node to be aware of its origin
-        anim_node = AnimationNode(node_id, data_to_use, animation_coord, Resolutions.HIGH.value, 
+        anim_node = AnimationNode(node_id, data_to_use, animation_coord, Resolutions.AUTO.value, 
                                   title=self.title, field_name=self.field_name, 
                                   bbox=self.bbox, parent=self, cmap=self.cmap,
-                                  x_range=x_range, y_range=y_range)
+                                  x_range=x_range, y_range=y_range, source_indexers=source_indexers)
         
         # Trigger callback to add node to layout
         self.add_node_callback(anim_node)
@@ -278,13 +561,20 @@ class ThreeDNode(FigureNode):
             btn_anim.on_click(lambda e: self._animate_callback(anim_coord))
         else:
              btn_anim.disabled = True
-        
+
         row_content = [pn.layout.HSpacer()]
         if label:
             # Removed default margin to prevent vertical offset
             row_content.append(pn.pane.Markdown(f"**{label}:**", align='center', margin=(0, 10, 0, 0), styles={'line-height': f'{btn_height}px'}))
         # Add navigation and animation buttons to the row
-        row_content.extend([btn_first, btn_prev, btn_next, btn_last, btn_anim, pn.layout.HSpacer()])
+        row_content.extend([btn_first, btn_prev, btn_next, btn_last])
+        if anim_coord:
+            # Current index, updated on click while the slice renders once the clicks settle
+            index_label = pn.pane.Str(self._nav_label(anim_coord), align='center', margin=(0, 8),
+                                      styles={'font-size': '12px', 'line-height': f'{btn_height}px'})
+            self._nav_labels[anim_coord] = index_label
+            row_content.append(index_label)
+        row_content.extend([btn_anim, pn.layout.HSpacer()])
         
         return pn.Row(*row_content, align='center', sizing_mode='stretch_width')
 
@@ -8,6 +8,7 @@ from holoviews import streams
 
 from model.FigureNode import FigureNode
 from model.model_utils import PlotType
+from model.scheduler import visible_render
 from loguru import logger
 
 class TwoDNode(FigureNode):
@@ -26,41 +27,30 @@ class TwoDNode(FigureNode):
         self.transect_path = None
         self.transect_stream = None
 
-    def create_figure(self):
-        # Use centralized coordinate extraction
-        from model.model_utils import get_all_coords
-        _, _, lats, lons = get_all_coords(self.data)
-        
+    @visible_render
+    def _get_image(self, x_range=None, y_range=None, width=None, height=None, **kwargs):
+        """Build the geo element for the visible window of the field (plus a margin)."""
+        data, window = self._crop_to_viewport(self.data, x_range, y_range)
+        _, _, lats, lons = self._coords_of(data)
+        values, lat_vals, lon_vals = self._read_field(data, window, lats, lons, canvas=(height, width))
+
         vdims = [hv.Dimension(self.field_name, label=self.label)]
         lat_name = lats.name if lats.name else self.coord_names[-2]
         lon_name = lons.name if lons.name else self.coord_names[-1]
 
-        # Check if coordinates are multidimensional (Curvilinear grid)
-        # Set title='' to prevent HoloViews from formatting '{label} {group}' with WRF metadata
-        if lats.ndim > 1 or lons.ndim > 1:
-            logger.info(f"Using QuadMesh for curvilinear grid in {self.id}")
-            self.img = gv.QuadMesh((lons, lats, self.data), [lon_name, lat_name], 
-                                  vdims=vdims, crs=ccrs.PlateCarree())
-        else:
-            # Standard regular grid - use Image for better performance
-            lat_vals = lats.values
-            lon_vals = lons.values
-            self.img = gv.Image((lon_vals, lat_vals, self.data), [lon_name, lat_name], 
-                                vdims=vdims, crs=ccrs.PlateCarree())
+        # Image for regular grids, QuadMesh for curvilinear ones, in Web Mercator when possible
+        return self._geo_element(values, lat_vals, lon_vals, [lon_name, lat_name], vdims)
 
-        # We wrap in a DynamicMap to allow reactive updates to cmap 
-        # without replacing the entire figure object in the UI.
-        def _get_image(cmap, clim):
-            return self.img.opts(cmap=cmap, clim=clim)
-        
-        # Create stream for cmap and clim (color range)
-        self.param_stream = hv.streams.Params(self, ['cmap', 'clim'])
-        self.dmap = hv.DynamicMap(_get_image, streams=[self.param_stream])
+    def create_figure(self):
+        # We wrap in a DynamicMap driven by the range stream so only the visible window
+        # of the field is read. cmap/clim are bound on the rasterized output below, so
+        # color changes re-shade the existing raster without re-reading the data.
+        self.dmap = hv.DynamicMap(self._get_image, streams=[self.range_stream, self.plot_size_stream])
 
         # Wrap in rasterize: it will render the data into an image server-side.
         # We bind cmap and clim reactively to the styled plot using the .apply.opts pattern
         # This ensures the colormap and range update when the node parameters change.
-        styled_dmap = rasterize(self.dmap, pixel_ratio=2).apply.opts(
+        styled_dmap = rasterize(self.dmap, pixel_ratio=self.PIXEL_RATIO).apply.opts(
             alpha=0.8,
             cmap=self.param.cmap,
             clim=self.param.clim,
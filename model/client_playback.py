@@ -0,0 +1,172 @@
+"""
+Browser-side animation playback.
+
+The server shades every frame of an animation once, at the current viewport and
+canvas size, into PNG images (RGBA, missing values transparent). The stack is
+sent to the browser in one go and played by a small JavaScript callback over the
+map tiles, so playback does not go through the websocket or rasterize. The
+server only shades again when the viewport, colormap or color range changes.
+"""
+from __future__ import annotations
+
+import base64
+import io
+from typing import Optional, Sequence
+
+import matplotlib
+import numpy as np
+from matplotlib.colors import Colormap, LinearSegmentedColormap
+
+from model.projection import MercatorGrid
+from proj_layout.utils import get_cmap_object
+
+DEFAULT_INTERVAL_MS = 250
+
+
+def colormap_lut(cmap, n: int = 256) -> np.ndarray:
+    """
+    Lookup table of a colormap given as a matplotlib colormap, a name or a list of colors.
+
+    Returns:
+        (n, 4) uint8 RGBA table.
+    """
+    cmap = get_cmap_object(cmap)
+    if isinstance(cmap, str):
+        import colorcet as cc
+        cmap = cc.cm[cmap] if cmap in cc.cm else matplotlib.colormaps[cmap]
+    elif not isinstance(cmap, Colormap):
+        cmap = LinearSegmentedColormap.from_list('cmap', list(cmap))
+    return (cmap(np.linspace(0, 1, n)) * 255).astype(np.uint8)
+
+
+def shade(values: np.ndarray, clim: tuple[float, float], lut: np.ndarray) -> np.ndarray:
+    """Map values to RGBA through ``lut`` over ``clim``; missing values are transparent."""
+    lo, hi = clim
+    scaled = (np.asarray(values, dtype=np.float32) - lo) / ((hi - lo) or 1.0)
+    finite = np.isfinite(scaled)
+    idx = np.clip(np.nan_to_num(scaled) * (len(lut) - 1), 0, len(lut) - 1).astype(np.intp)
+    rgba = lut[idx]
+    rgba[~finite] = 0
+    return rgba
+
+
+def encode_png(rgba: np.ndarray) -> str:
+    """PNG data URL of an RGBA image whose first row is the southernmost."""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(rgba[::-1]), 'RGBA').save(buffer, format='PNG', optimize=False)
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def viewport_window(x: np.ndarray, y: np.ndarray, x_range: Optional[Sequence[float]],
+                    y_range: Optional[Sequence[float]], canvas: tuple[int, int]):
+    """
+    Cells of a uniform Mercator grid inside the viewport, with the stride that keeps
+    at most about one cell per canvas pixel.
+
+    Returns:
+        Tuple (rows, cols) of slices, or None when the viewport does not overlap the grid.
+    """
+    def axis_slice(axis, bounds):
+        if bounds is None or None in bounds:
+            return 0, axis.size
+        lo, hi = sorted(float(b) for b in bounds)
+        if hi < axis[0] or lo > axis[-1]:
+            return 0, 0
+        start = max(int(np.searchsorted(axis, lo, side='right')) - 1, 0)
+        stop = min(int(np.searchsorted(axis, hi, side='left')) + 1, axis.size)
+        return start, stop
+
+    r0, r1 = axis_slice(y, y_range)
+    c0, c1 = axis_slice(x, x_range)
+    if r1 - r0 < 1 or c1 - c0 < 1:
+        return None
+    height, width = canvas
+    stride = max(1, int(max((r1 - r0) / height, (c1 - c0) / width)))
+    return slice(r0, r1, stride), slice(c0, c1, stride)
+
+
+def shade_stack(frames, grid: MercatorGrid, x_range, y_range, canvas: tuple[int, int],
+                cmap, clim: tuple[float, float]):
+    """
+    Shade frames at the viewport for browser playback.
+
+    Args:
+        frames: Iterable of 2D (lat, lon) values on the grid of ``grid``.
+        grid: Mercator resampling of the frames grid.
+        x_range, y_range: Viewport in Web Mercator meters (None for the whole grid).
+        canvas: (height, width) in pixels.
+        cmap: Colormap (object, name or list of colors).
+        clim: Color range.
+
+    Returns:
+        Tuple (urls, extent) with one PNG data URL per frame and the (x0, y0, x1, y1)
+        extent of the images in meters; None when the viewport is outside the grid.
+    """
+    window = viewport_window(grid.x, grid.y, x_range, y_range, canvas)
+    if window is None:
+        return None
+    rows, cols = window
+    lut = colormap_lut(cmap)
+    urls = [encode_png(shade(grid.project(values)[2][rows, cols], clim, lut)) for values in frames]
+    x, y = grid.x[cols], grid.y[rows]
+    # Images cover the cells, half a (strided) cell beyond the outer centers
+    dx = (x[-1] - x[0]) / max(x.size - 1, 1) / 2 if x.size > 1 else 1.0
+    dy = (y[-1] - y[0]) / max(y.size - 1, 1) / 2 if y.size > 1 else 1.0
+    return urls, (x[0] - dx, y[0] - dy, x[-1] + dx, y[-1] + dy)
+
+
+# Plays the stack: the slider picks the image, the toggle advances the slider on a timer
+_SHOW_FRAME_JS = """
+source.data = Object.assign({}, source.data, {url: [stack.data.url[slider.value]]});
+"""
+_PLAY_JS = """
+const key = '_ncd_player_' + slider.id;
+if (window[key]) { clearInterval(window[key]); window[key] = null; }
+if (toggle.active) {
+    window[key] = setInterval(() => {
+        const n = stack.data.url.length;
+        if (n) { slider.value = (slider.value + 1) % n; }
+    }, interval);
+}
+"""
+
+
+class ClientPlayer:
+    """Bokeh figure (tiles and an image) and controls that play a frame stack in the browser."""
+
+    def __init__(self, tile_url: str, interval_ms: int = DEFAULT_INTERVAL_MS):
+        from bokeh.layouts import column, row
+        from bokeh.models import (ColumnDataSource, CustomJS, Slider, Toggle, WMTSTileSource)
+        from bokeh.plotting import figure
+
+        self.source = ColumnDataSource({'url': [], 'x': [], 'y': [], 'w': [], 'h': []})
+        self.stack = ColumnDataSource({'url': []})
+        self.figure = figure(x_axis_type='mercator', y_axis_type='mercator', sizing_mode='stretch_both',
+                             tools='pan,wheel_zoom,reset,save', active_scroll='wheel_zoom',
+                             min_height=300, match_aspect=True)
+        self.figure.add_tile(WMTSTileSource(url=tile_url))
+        self.figure.image_url(url='url', x='x', y='y', w='w', h='h', anchor='bottom_left',
+                              global_alpha=0.8, source=self.source)
+        self.slider = Slider(start=0, end=1, value=0, step=1, title='Frame', sizing_mode='stretch_width')
+        self.toggle = Toggle(label='▶ Play', active=False, width=90)
+        args = dict(source=self.source, stack=self.stack, slider=self.slider, toggle=self.toggle)
+        self.slider.js_on_change('value', CustomJS(args=args, code=_SHOW_FRAME_JS))
+        self.toggle.js_on_change('active', CustomJS(args=dict(args, interval=int(interval_ms)), code=_PLAY_JS))
+        self.layout = column(self.figure, row(self.toggle, self.slider, sizing_mode='stretch_width'),
+                             sizing_mode='stretch_both')
+
+    def update(self, urls: list[str], extent: tuple[float, float, float, float], index: int = 0) -> None:
+        """Send a new stack to the browser (replaces the previous one)."""
+        x0, y0, x1, y1 = extent
+        index = min(max(index, 0), len(urls) - 1)
+        self.stack.data = {'url': urls}
+        self.slider.end = max(len(urls) - 1, 1)
+        self.slider.value = index
+        self.source.data = {'url': [urls[index]], 'x': [x0], 'y': [y0], 'w': [x1 - x0], 'h': [y1 - y0]}
+
+    def set_viewport(self, x_range, y_range) -> None:
+        if x_range is not None and y_range is not None and None not in (*x_range, *y_range):
+            self.figure.x_range.start, self.figure.x_range.end = sorted(x_range)
+            self.figure.y_range.start, self.figure.y_range.end = sorted(y_range)
@@ -0,0 +1,232 @@
+"""
+Coordinate roles (time, depth, latitude, longitude) of each variable.
+
+Roles are resolved once per variable and kept in a process-wide registry, so
+renderers do not run the name heuristics on every frame. CF attributes
+(``axis``, ``standard_name``, ``units``, ``positive``) are used first, then the
+usual names (WRF, NEMO, ROMS, ...), then the position of the dims, as
+``get_all_coords`` always did.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import xarray as xr
+
+ROLES = ('time', 'depth', 'lat', 'lon')
+# Attributes read by the CF detection (part of the registry key)
+CF_ATTRS = ('axis', 'standard_name', 'units', 'positive')
+# Variables (and slices of them with their own coordinate layout) whose roles are kept
+MAX_REGISTERED = 256
+
+CF_AXIS = {'T': 'time', 'Z': 'depth', 'Y': 'lat', 'X': 'lon'}
+CF_STANDARD_NAMES = {
+    'time': 'time',
+    'latitude': 'lat', 'grid_latitude': 'lat',
+    'longitude': 'lon', 'grid_longitude': 'lon',
+    'depth': 'depth', 'height': 'depth', 'altitude': 'depth', 'air_pressure': 'depth',
+    'model_level_number': 'depth', 'ocean_sigma_coordinate': 'depth',
+    'ocean_s_coordinate': 'depth', 'ocean_s_coordinate_g1': 'depth', 'ocean_s_coordinate_g2': 'depth',
+    'atmosphere_sigma_coordinate': 'depth', 'atmosphere_hybrid_sigma_pressure_coordinate': 'depth',
+}
+CF_LAT_UNITS = {'degrees_north', 'degree_north', 'degree_n', 'degrees_n', 'degreen', 'degreesn'}
+CF_LON_UNITS = {'degrees_east', 'degree_east', 'degree_e', 'degrees_e', 'degreee', 'degreese'}
+
+
+def _cf_role(coord: xr.DataArray) -> Optional[str]:
+    """Role of a coordinate from its CF attributes, or None."""
+    attrs = coord.attrs
+    axis = str(attrs.get('axis', '')).upper()
+    if axis in CF_AXIS:
+        return CF_AXIS[axis]
+    role = CF_STANDARD_NAMES.get(str(attrs.get('standard_name', '')).lower())
+    if role is not None:
+        return role
+    units = str(attrs.get('units', '')).lower()
+    if units in CF_LAT_UNITS:
+        return 'lat'
+    if units in CF_LON_UNITS:
+        return 'lon'
+    if ' since ' in units:
+        return 'time'
+    if str(attrs.get('positive', '')).lower() in ('up', 'down'):
+        return 'depth'
+    return None
+
+
+def _name_role(name: str) -> Optional[str]:
+    """Role of a coordinate from its name (same heuristics as before CF detection)."""
+    name = name.lower()
+    if name in ['lat', 'latitude', 'xlat', 'nav_lat', 'yc'] or 'lat' in name:
+        return 'lat'
+    if name in ['lon', 'longitude', 'xlong', 'nav_lon', 'xc'] or 'lon' in name:
+        return 'lon'
+    if name in ['time', 'xtime', 'times', 't']:
+        return 'time'
+    if name in ['depth', 'z', 'lev', 'level', 'bottom_top', 'pressure'] or 'depth' in name:
+        return 'depth'
+    return None
+
+
+def _order(values: np.ndarray) -> int:
+    """+1 for strictly increasing values, -1 for strictly decreasing, 0 otherwise."""
+    if values.ndim != 1 or values.size < 2 or not np.issubdtype(values.dtype, np.number):
+        return 0
+    diffs = np.diff(values)
+    if np.all(diffs > 0):
+        return 1
+    if np.all(diffs < 0):
+        return -1
+    return 0
+
+
+@dataclass(frozen=True)
+class CoordRoles:
+    """Names, dim positions and ordering of the time/depth/lat/lon coordinates of a variable."""
+    dims: tuple
+    # role -> coordinate (or dimension) name, None when the variable has no such coordinate
+    names: dict = field(default_factory=dict)
+    # role -> position in ``dims`` of the dimension the coordinate runs along (None for 2D coords)
+    positions: dict = field(default_factory=dict)
+    # role -> +1 increasing / -1 decreasing / 0 not monotonic (or not 1D)
+    orders: dict = field(default_factory=dict)
+    # CF 'positive' attribute of the vertical coordinate ('up' or 'down')
+    depth_positive: Optional[str] = None
+
+    @property
+    def time(self) -> Optional[str]:
+        return self.names.get('time')
+
+    @property
+    def depth(self) -> Optional[str]:
+        return self.names.get('depth')
+
+    @property
+    def lat(self) -> Optional[str]:
+        return self.names.get('lat')
+
+    @property
+    def lon(self) -> Optional[str]:
+        return self.names.get('lon')
+
+    def coord(self, data: xr.DataArray, role: str) -> xr.DataArray:
+        """
+        The coordinate with ``role`` in ``data`` (the variable or a slice of it).
+
+        Returns:
+            The coordinate, or an empty DataArray when ``data`` does not have it.
+        """
+        name = self.names.get(role)
+        if name is not None:
+            if name in data.coords:
+                return data.coords[name]
+            if name in data.dims:
+                return data[name]
+        return xr.DataArray(np.empty(0))
+
+    def coords(self, data: xr.DataArray) -> tuple:
+        """(times, depth, lats, lons) of ``data``, like ``get_all_coords``."""
+        return tuple(self.coord(data, role) for role in ROLES)
+
+
+def resolve_coord_roles(data: xr.DataArray) -> CoordRoles:
+    """
+    Identify the time, depth, latitude and longitude coordinates of a variable.
+
+    Only coordinates whose dims are a subset of the variable dims are considered.
+
+    Args:
+        data: The variable.
+
+    Returns:
+        The resolved roles.
+    """
+    dims = tuple(data.dims)
+    data_dims = set(dims)
+    relevant = [data.coords[c] for c in data.coords if set(data.coords[c].dims).issubset(data_dims)]
+
+    names = {}
+    # 1. CF attributes, 2. names; the first coordinate found for a role wins
+    for resolve in (_cf_role, lambda c: _name_role(str(c.name))):
+        for c in relevant:
+            role = resolve(c)
+            if role is not None and role not in names and c.name not in names.values():
+                names[role] = c.name
+
+    # 3. Fallbacks based on dimension position
+    if 'lat' not in names and len(dims) >= 2:
+        names['lat'] = dims[-2]
+    if 'lon' not in names and len(dims) >= 1:
+        names['lon'] = dims[-1]
+    if 'time' not in names and len(dims) >= 3:
+        names['time'] = dims[0]
+    if 'depth' not in names and len(dims) == 4:
+        names['depth'] = dims[1]
+
+    positions, orders = {}, {}
+    depth_positive = None
+    for role, name in names.items():
+        coord_dims = data.coords[name].dims if name in data.coords else (name,)
+        positions[role] = dims.index(coord_dims[0]) if len(coord_dims) == 1 and coord_dims[0] in dims else None
+        orders[role] = _order(np.asarray(data.coords[name].values)) if name in data.coords else 1
+        if role == 'depth' and name in data.coords:
+            positive = str(data.coords[name].attrs.get('positive', '')).lower()
+            depth_positive = positive if positive in ('up', 'down') else None
+
+    return CoordRoles(dims=dims, names={r: names.get(r) for r in ROLES},
+                      positions={r: positions.get(r) for r in ROLES},
+                      orders={r: orders.get(r, 0) for r in ROLES},
+                      depth_positive=depth_positive)
+
+
+def _roles_key(data: xr.DataArray) -> tuple:
+    """
+    Registry key: variable name, dims and the names, dims, shape, dtype and CF attributes of
+    its coordinates. No coordinate values are read; the direction of indexed coordinates
+    comes from their (cached) pandas index.
+    """
+    coords = []
+    indexes = data.indexes
+    for name in data.coords:
+        c = data.coords[name]
+        attrs = tuple(str(c.attrs.get(a, '')) for a in CF_ATTRS)
+        entry = (str(name), c.dims, c.shape, str(c.dtype), attrs)
+        if name in indexes:
+            index = indexes[name]
+            entry += (index.is_monotonic_increasing, index.is_monotonic_decreasing)
+        coords.append(entry)
+    return (data.name, data.dims, tuple(sorted(coords, key=lambda e: e[0])))
+
+
+_registry: OrderedDict = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def get_coord_roles(data: xr.DataArray) -> CoordRoles:
+    """Return the cached roles of a variable, resolving them the first time it is seen."""
+    key = _roles_key(data)
+    with _registry_lock:
+        roles = _registry.get(key)
+        if roles is not None:
+            _registry.move_to_end(key)
+            return roles
+    roles = resolve_coord_roles(data)
+    with _registry_lock:
+        _registry[key] = roles
+        while len(_registry) > MAX_REGISTERED:
+            _registry.popitem(last=False)
+    return roles
+
+
+def register_dataset(data: xr.Dataset) -> dict[str, CoordRoles]:
+    """
+    Resolve the roles of every variable of a dataset (done once when the dashboard loads).
+
+    Returns:
+        Dict variable name -> roles.
+    """
+    return {name: get_coord_roles(data[name]) for name in data.data_vars if data[name].ndim > 0}
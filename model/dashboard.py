@@ -1,6 +1,7 @@
+import threading
+from functools import partial
 import xarray as xr
 from loguru import logger
-from os.path import join
 from model.AnimationNode import AnimationNode
 from model.FourDNode import FourDNode
 from model.OneDNode import OneDNode
@@ -13,44 +14,58 @@ import holoviews as hv
 from model.model_utils import PlotType, select_profile, select_spatial_location
 from proj_layout.utils import select_colormap, get_available_cmaps, get_cmap_object, CMAP_GROUPS, get_cmap_html_preview, get_cmap_css_gradient
 from model import state as state_module
+from model.slice_cache import get_slice_cache
+from model.scheduler import get_scheduler
+from model.stats import estimate_quantiles, sample_quantiles
+from model.stats_store import get_stats_store
+from model.pyramid import get_pyramid_store
+from model.frame_store import get_frame_store
+from model.data_loader import open_dataset
+from model.coord_roles import register_dataset
+from model.viewport import point_to_lonlat
 
 class Dashboard:
-    def __init__(self, path, regex, preloaded_data=None):
+    def __init__(self, path, regex, preloaded_data=None, perf_config=None, watcher=None):
         self.path = path
         self.regex = regex
+        # 'performance' section of ncdashboard_config.yml (cache budgets, etc.)
+        self.perf_config = perf_config or {}
+
+        # Slice cache shared by every session that opens the same files
+        self.slice_cache = get_slice_cache(f"{self.path}|{self.regex}",
+                                           self.perf_config.get('slice_cache_mb'))
+        # Pre-rendered animation frames of every session, under one memory budget
+        get_frame_store(self.perf_config.get('frame_cache_mb'), self.perf_config.get('frame_compression'))
+        # One pool of background workers (prefetch, pre-rendering, statistics) for every
+        # session, by priority class and taking sessions in turn
+        get_scheduler(self.perf_config.get('background_workers', self.perf_config.get('prefetch_workers')))
+        # Per-variable statistics persisted next to the data (filled in the background)
+        self.stats_store = get_stats_store(self.path, self.regex)
 
         if preloaded_data is not None:
             logger.info(f"Reusing preloaded dataset for {self.path}")
             data = preloaded_data
         else:
             logger.info(f"Opening files in {self.path} with regex {self.regex}")
-            if isinstance(self.path, list):
-                data = xr.open_mfdataset(self.path, decode_times=False)
-            else:
-                data = xr.open_mfdataset(join(self.path, self.regex), decode_times=False)
+            data = open_dataset(self.path, self.regex,
+                                use_zarr_copy=self.perf_config.get('use_zarr_copy', True),
+                                use_index=self.perf_config.get('dataset_index', True))
 
-        # --- WRF-specific Coordinate Handling ---
-        # Automatically identify and assign latitude/longitude coordinates
-        potential_coords = {}
-        for var_name in data.variables:
-            name_lower = var_name.lower()
-            # Look for latitude/longitude variables
-            is_l = 'lat' in name_lower or 'xlat' in name_lower
-            is_o = 'lon' in name_lower or 'xlong' in name_lower or 'nav_lon' in name_lower
-            
-            if is_l or is_o:
-                c_var = data[var_name]
-                # If it has Time, take the first slice to use as a static geographic coordinate
-                if 'Time' in c_var.dims:
-                    potential_coords[var_name] = c_var.isel(Time=0, drop=True)
-                else:
-                    potential_coords[var_name] = c_var
-        
-        if potential_coords:
-            logger.info(f"Assigning detected coordinates: {list(potential_coords.keys())}")
-            data = data.assign_coords(potential_coords)
+        data = self._assign_coordinates(data)
+        # Time/depth/lat/lon roles of every variable, resolved once and read by the nodes
+        self.coord_roles = register_dataset(data)
 
         self.tree_root = TwoDNode('root', data=data, parent=None)
+        # Figures inherit the regridding of curvilinear grids from their parent
+        regrid = self.perf_config.get('regrid', FigureNode.REGRID_METHOD)
+        self.tree_root.regrid_method = None if regrid in (None, 'off') else regrid
+        # ... and whether elements are built directly in Web Mercator
+        self.tree_root.project_mercator = bool(self.perf_config.get('project_mercator', FigureNode.PROJECT_MERCATOR))
+        # ... and the throttling/quantization of pan and zoom re-renders
+        self.tree_root.viewport_throttle_ms = float(self.perf_config.get('viewport_throttle_ms', FigureNode.VIEWPORT_THROTTLE_MS) or 0)
+        self.tree_root.viewport_quantize_steps = int(self.perf_config.get('viewport_quantize_steps', FigureNode.VIEWPORT_QUANTIZE_STEPS) or 0)
+        # ... and the latency target of progressive (coarse, then full resolution) rendering
+        self.tree_root.progressive_ms = float(self.perf_config.get('progressive_ms', FigureNode.PROGRESSIVE_MS) or 0)
         
         # Identify field dimensions
         self.four_d = []
@@ -75,6 +90,79 @@ class Dashboard:
         
         self.data = data
 
+        # Live append: the server-wide watcher publishes new versions of the dataset
+        self.watcher = watcher
+        self._doc = pn.state.curdoc
+        if watcher is not None:
+            watcher.subscribe(self._on_dataset_update)
+            if self._doc is not None:
+                pn.state.on_session_destroyed(lambda ctx: watcher.unsubscribe(self._on_dataset_update))
+        if self._doc is not None:
+            pn.state.on_session_destroyed(self._on_session_destroyed)
+
+    def _on_session_destroyed(self, session_context):
+        """Stops the background work of the session and releases the caches of its figures."""
+        cancelled = get_scheduler().cancel_session(session_context.id)
+        self.tree_root.close()
+        logger.info(f"Session {session_context.id} closed, {cancelled} background tasks cancelled")
+
+    @staticmethod
+    def _assign_coordinates(data):
+        """Identify latitude/longitude variables and assign them as coordinates."""
+        potential_coords = {}
+        for var_name in data.variables:
+            name_lower = var_name.lower()
+            # Look for latitude/longitude variables
+            is_l = 'lat' in name_lower or 'xlat' in name_lower
+            is_o = 'lon' in name_lower or 'xlong' in name_lower or 'nav_lon' in name_lower
+            
+            if is_l or is_o:
+                c_var = data[var_name]
+                # If it has Time, take the first slice to use as a static geographic coordinate
+                if 'Time' in c_var.dims:
+                    potential_coords[var_name] = c_var.isel(Time=0, drop=True)
+                else:
+                    potential_coords[var_name] = c_var
+
+        if potential_coords:
+            logger.info(f"Assigning detected coordinates: {list(potential_coords.keys())}")
+            data = data.assign_coords(potential_coords)
+
+        return data
+
+    def _on_dataset_update(self, update):
+        """Watcher callback (background thread): apply the update on this session's document."""
+        if self._doc is not None:
+            self._doc.add_next_tick_callback(partial(self._apply_dataset_update, update))
+        else:
+            self._apply_dataset_update(update)
+
+    def _apply_dataset_update(self, update):
+        '''
+        Swap the reopened dataset into the open figures. Nodes plotting a dataset
+        variable keep their state (indices, zoom, colours); only the slices that
+        changed are re-read.
+        '''
+        data = self._assign_coordinates(update.data)
+        self.coord_roles = register_dataset(data)
+        self.data = data
+        self.tree_root.set_data(data)
+        for node in self.tree_root.get_children():
+            field = node.get_field_name()
+            # Derived figures (profiles, transects, custom analysis) are snapshots
+            if node.slice_cache is None or field not in data:
+                continue
+            dims = data[field].dims
+            if update.step_dim is None or dims[:1] == (update.step_dim,):
+                stale = update.stale_steps
+            else:
+                # Variables without the grown dim did not change, others shifted
+                stale = None if update.step_dim in dims else set()
+            node.update_data(data[field], stale)
+        if update.step_dim and pn.state.notifications is not None:
+            added = update.new_steps - update.old_steps
+            pn.state.notifications.info(f"{added} new {update.step_dim} steps available", duration=4000)
+
     def _cmap_from_name(self, name: str):
         """Resolve colormap name (cmocean or matplotlib) to object."""
         return get_cmap_object(name)
@@ -237,6 +325,7 @@ class Dashboard:
         except Exception:
             logger.info(f"Creating new plot - Dimensions: {dims_str}, Field: {c_field}, Shape: Unknown (not in root dataset)")
 
+        from_dataset = new_node is None
         if new_node is None:
             id = state.get("id", self.id_generator(c_field)) if state else self.id_generator(c_field)
             third_coord_idx = state.get("third_coord_idx", 0) if state else 0
@@ -256,6 +345,17 @@ class Dashboard:
                 new_node = TwoDNode(id, self.data[c_field], plot_type=plot_type, field_name=c_field, 
                                         parent=self.tree_root)
 
+            # Nodes that plot a dataset variable read their slices through the shared cache
+            new_node.slice_cache = self.slice_cache
+            if hasattr(new_node, 'prefetch_depth'):
+                new_node.prefetch_depth = int(self.perf_config.get('prefetch_depth', 2))
+            # Zoomed-out views read from block-mean overview levels when enabled
+            pyramid_mode = self.perf_config.get('pyramid', 'on_demand')
+            if pyramid_mode != 'off' and new_node.data.ndim >= 2:
+                store = get_pyramid_store(self.path, self.regex, root=self.perf_config.get('pyramid_dir'))
+                if store is not None:
+                    new_node.pyramid = store.variable(c_field, new_node.data)
+                    new_node.pyramid_on_demand = pyramid_mode == 'on_demand'
             self.tree_root.add_child(new_node)
 
         # Apply saved state (cmap, indices) when loading
@@ -273,6 +373,8 @@ class Dashboard:
             def tap_callback(x, y):
                 if x is None or y is None: 
                     return
+                # Elements drawn in Web Mercator report taps in meters
+                x, y = point_to_lonlat(x, y)
                 # Update marker list and stream
                 new_node.clicked_points.append((x, y))
                 new_node.marker_stream.event(x=x, y=y)
@@ -368,39 +470,23 @@ class Dashboard:
             if name in get_available_cmaps():
                 initial_cmap = name
 
-        # Determine initial color range
-        try:
-            sample_data = new_node.data
-            if hasattr(sample_data, 'size') and sample_data.size > 1000000:
-                sample_data = sample_data.thin(5)
-            computed_data = sample_data.compute()
-            if computed_data.size > 1:
-                q = computed_data.quantile([0.02, 0.98]).values
-                dmin, dmax = float(q[0]), float(q[1])
-            elif computed_data.size == 1:
-                val = float(computed_data.values.item())
-                dmin, dmax = val - 0.1, val + 0.1
-            else:
-                dmin, dmax = 0, 1
-            if dmin == dmax:
-                dmin -= 0.1 * abs(dmin) if dmin != 0 else 0.1
-                dmax += 0.1 * abs(dmax) if dmax != 0 else 0.1
-        except Exception as e:
-            logger.warning(f"Failed to calculate robust clim: {e}. Falling back to simple range.")
-            try:
-                if 'computed_data' in locals():
-                    dmin = float(computed_data.min())
-                    dmax = float(computed_data.max())
-                else:
-                    dmin = float(new_node.data.min().compute())
-                    dmax = float(new_node.data.max().compute())
-            except:
-                dmin, dmax = 0, 1
+        # Determine initial color range: a provisional range from the slice on screen,
+        # refined in the background by a streaming quantile sketch (see _refine_clim_async)
+        dataset_stats = self.get_field_stats(c_field) if from_dataset else None
+        stats_q = dataset_stats.get('quantiles') if dataset_stats else None
+        if stats_q and None not in stats_q and stats_q[0] < stats_q[1]:
+            # Precomputed for the whole variable: no need to read or refine anything
+            dmin, dmax = stats_q
+        else:
+            dataset_stats = None
+            dmin, dmax = self._provisional_clim(new_node)
 
         initial_clim = getattr(new_node, 'clim', (dmin, dmax))
+        needs_refine = False
         if initial_clim == (None, None) or initial_clim == (0, 0):
             initial_clim = (round(dmin, 1), round(dmax, 1))
             new_node.clim = initial_clim
+            needs_refine = dataset_stats is None
         else:
             initial_clim = (round(initial_clim[0], 1), round(initial_clim[1], 1))
 
@@ -409,16 +495,22 @@ class Dashboard:
         min_input = pn.widgets.FloatInput(name='', value=initial_clim[0], width=85, height=30, align='center', margin=(0, 2), format='0.0', stylesheets=[input_style])
         max_input = pn.widgets.FloatInput(name='', value=initial_clim[1], width=85, height=30, align='center', margin=(0, 2), format='0.0', stylesheets=[input_style])
 
+        # 'auto' is set while the background sketch updates the inputs, so we can tell
+        # its updates apart from the user's (which stop the refinement).
+        clim_state = {'auto': False, 'stop': threading.Event()}
+
         def update_clim(event):
+            # Only re-shades the rasterized output: no data re-read, cached frames are kept
+            if not clim_state['auto']:
+                clim_state['stop'].set()
             new_node.clim = (min_input.value, max_input.value)
-            if hasattr(new_node, '_cache'):
-                new_node._cache.clear()
-            if hasattr(new_node, 'player'):
-                new_node.player.param.trigger('value')
 
         min_input.param.watch(update_clim, 'value')
         max_input.param.watch(update_clim, 'value')
 
+        if needs_refine:
+            self._refine_clim_async(new_node, min_input, max_input, clim_state)
+
         # --- Visual Colormap Gallery ---
         gallery_container = pn.FlexBox(
             sizing_mode='stretch_width', 
@@ -431,13 +523,6 @@ class Dashboard:
              # Update preview on the button
              cmap_btn.object = get_cmap_html_preview(cmap_name, width='80px')
              gallery_container.visible = False
-             
-             # Clear cache for animations
-             if hasattr(new_node, '_cache'):
-                 new_node._cache.clear()
-             # For animations, we still trigger the UI sync
-             if hasattr(new_node, 'player'):
-                 new_node.player.param.trigger('value')
 
         # Build gallery items
         for group, names in CMAP_GROUPS.items():
@@ -498,13 +583,6 @@ class Dashboard:
              new_node.cmap = get_cmap_object(cmap_name)
              update_toggle_btn_style(cmap_name)
              gallery_container.visible = False
-             
-             # Clear cache for animations
-             if hasattr(new_node, '_cache'):
-                 new_node._cache.clear()
-             # For animations, we still trigger the UI sync
-             if hasattr(new_node, 'player'):
-                 new_node.player.param.trigger('value')
 
         # Clear and rebuild gallery with V2 callback
         gallery_container.clear()
@@ -564,7 +642,9 @@ class Dashboard:
             else:
                 container.visible = False
             
-            # Remove from tree
+            # Stop background work for this figure and remove it from the tree
+            clim_state['stop'].set()
+            new_node.close()
             self.tree_root.remove_id(new_node.id) 
 
         close_btn.on_click(close_action)
@@ -599,6 +679,72 @@ class Dashboard:
         
         return container
 
+    def _provisional_clim(self, node):
+        '''
+        Quick 2-98% color range from the slice currently on screen (strided read).
+        Returns (dmin, dmax), widened when the slice is constant.
+        '''
+        try:
+            data = node.data
+            if hasattr(node, '_slice_for') and data.ndim > 2:
+                data = node._slice_for(node.third_coord_idx)
+            if data.size == 1:
+                val = float(data.values.item())
+                dmin, dmax = val - 0.1, val + 0.1
+            else:
+                q = sample_quantiles(data, max_samples=int(self.perf_config.get('clim_provisional_samples', 250_000)))
+                dmin, dmax = (float(q[0]), float(q[1])) if q is not None else (0, 1)
+        except Exception as e:
+            logger.warning(f"Failed to calculate provisional clim: {e}. Falling back to (0, 1).")
+            dmin, dmax = 0, 1
+
+        if dmin == dmax:
+            dmin -= 0.1 * abs(dmin) if dmin != 0 else 0.1
+            dmax += 0.1 * abs(dmax) if dmax != 0 else 0.1
+        return dmin, dmax
+
+    def _refine_clim_async(self, node, min_input, max_input, clim_state):
+        '''
+        Refine the node color range in the background with a streaming quantile sketch
+        over the whole variable. Updates stop as soon as the user edits the range or
+        the figure is closed.
+        '''
+        data = node.data
+        if not hasattr(data, 'ndim') or data.ndim <= 2:
+            return  # The provisional range already covers the whole field
+
+        doc = pn.state.curdoc
+
+        def apply(lo, hi):
+            if clim_state['stop'].is_set():
+                return
+            clim_state['auto'] = True
+            try:
+                node.clim = (lo, hi)
+                min_input.value = lo
+                max_input.value = hi
+            finally:
+                clim_state['auto'] = False
+
+        def on_update(q, fraction):
+            lo, hi = round(q[0], 1), round(q[1], 1)
+            if lo == hi or (lo, hi) == tuple(node.clim):
+                return
+            logger.debug(f"Refined clim for {node.id}: ({lo}, {hi}) after {fraction:.0%} of slices")
+            if doc is not None:
+                doc.add_next_tick_callback(partial(apply, lo, hi))
+            else:
+                apply(lo, hi)
+
+        cfg = self.perf_config
+        # Cancelled with the node when it is closed
+        estimate_quantiles(data,
+                           time_limit=float(cfg.get('clim_sketch_time_limit', 10.0)),
+                           sample_budget=int(cfg.get('clim_sketch_samples', 2_000_000)),
+                           on_update=on_update,
+                           stop_event=clim_state['stop'],
+                           owner=node.owner)
+
     def close_figure(self, node_id, prev_children, patch):
         """Removes a node from the tree and generates a Dash patch to remove it from UI."""
         logger.info(f"Closing figure: {node_id}")
@@ -668,6 +814,13 @@ class Dashboard:
             
         return results
 
+    def get_field_stats(self, field_name):
+        '''
+        Precomputed statistics of a dataset variable (see model/stats_store.py),
+        or None while they are not available.
+        '''
+        return self.stats_store.get(field_name) if field_name is not None else None
+
     def id_generator(self, field_name):
         new_id = field_name
         count = 2
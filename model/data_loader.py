@@ -0,0 +1,227 @@
+"""
+Helpers to locate, open and convert the files of a dataset.
+
+The fingerprint is used as a key for anything persisted next to the data
+(statistics, indexes, Zarr copies, ...): it changes as soon as a file is
+added, removed, rewritten or touched.
+
+``open_dataset`` is the single entry point used by the server and the
+dashboard sessions: it transparently uses a rechunked Zarr copy written by
+``ncdashboard.py --convert-zarr`` when that copy is up to date.
+"""
+from __future__ import annotations
+
+import glob
+import hashlib
+import os
+import shutil
+import time
+from typing import Optional, Sequence, Union
+
+import xarray as xr
+from loguru import logger
+
+PathLike = Union[str, list]
+
+# Sidecars go here when the folder of the data is unknown or read-only
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ncdashboard')
+
+
+def resolve_files(path: PathLike, regex: str = '') -> list[str]:
+    """
+    Return the sorted list of files that ``open_mfdataset`` would open.
+
+    Args:
+        path: Directory, single file, glob pattern or list of files.
+        regex: File pattern (e.g. "*.nc") when path is a directory.
+
+    Returns:
+        Sorted list of absolute file paths (may be empty).
+    """
+    if isinstance(path, (list, tuple)):
+        files = [str(p) for p in path]
+    elif regex:
+        files = glob.glob(os.path.join(str(path), regex))
+    else:
+        files = glob.glob(str(path))
+    return sorted(os.path.abspath(f) for f in files if os.path.isfile(f))
+
+
+def dataset_fingerprint(files: list[str]) -> str:
+    """
+    Hash of the file paths, sizes and modification times.
+
+    Args:
+        files: Files as returned by ``resolve_files``.
+
+    Returns:
+        Hex digest (sha1).
+    """
+    h = hashlib.sha1()
+    for f in files:
+        try:
+            st = os.stat(f)
+            h.update(f"{f}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+        except OSError:
+            h.update(f"{f}|missing\n".encode())
+    return h.hexdigest()
+
+
+def dataset_directory(files: list[str], path: PathLike = '') -> str:
+    """
+    Directory where sidecar files for the dataset are written.
+
+    This is the folder of the first file, or ``path`` itself when it is a
+    directory. In-memory datasets (no files) fall back to ``CACHE_DIR`` so
+    that nothing is written to the working directory.
+    """
+    if files:
+        return os.path.dirname(files[0])
+    if isinstance(path, str) and os.path.isdir(path):
+        return path
+    return CACHE_DIR
+
+
+# Chunking of the Zarr copy. 'map' favours reading whole 2D slices (one time/depth
+# step per chunk), 'timeseries' favours reading all steps at a few points.
+ZARR_LAYOUTS = ('map', 'timeseries')
+MAP_CHUNK = 2048
+TIMESERIES_CHUNK = 64
+
+
+def _source(path: PathLike, regex: str = ''):
+    """What to pass to ``open_mfdataset`` for a path/regex pair."""
+    if isinstance(path, (list, tuple)):
+        return list(path)
+    return os.path.join(path, regex) if regex else path
+
+
+def zarr_copy_path(path: PathLike, regex: str = '', files: Optional[list[str]] = None) -> str:
+    """Location of the Zarr copy of a dataset (in the folder of its first file)."""
+    files = resolve_files(path, regex) if files is None else files
+    name_hash = hashlib.sha1('\n'.join(files).encode()).hexdigest()[:12]
+    return os.path.join(dataset_directory(files, path), f".ncdashboard_copy_{name_hash}.zarr")
+
+
+def zarr_chunks(data: xr.DataArray, layout: str = 'map') -> dict:
+    """
+    Chunk sizes for one variable of the Zarr copy.
+
+    Args:
+        data: Variable to write (spatial dims last).
+        layout: 'map' (one 2D slice per chunk) or 'timeseries' (all steps of small tiles).
+
+    Returns:
+        Dict dim -> chunk size.
+    """
+    if layout not in ZARR_LAYOUTS:
+        raise ValueError(f"Unknown Zarr layout '{layout}', expected one of {ZARR_LAYOUTS}")
+    dims = data.dims
+    if data.ndim < 2:
+        return {d: data.sizes[d] for d in dims}
+    spatial, lead = dims[-2:], dims[:-2]
+    if layout == 'map':
+        chunks = {d: 1 for d in lead}
+        chunks.update({d: min(data.sizes[d], MAP_CHUNK) for d in spatial})
+    else:
+        chunks = {d: data.sizes[d] for d in lead[:1]}
+        chunks.update({d: 1 for d in lead[1:]})
+        chunks.update({d: min(data.sizes[d], TIMESERIES_CHUNK) for d in spatial})
+    return chunks
+
+
+def convert_to_zarr(path: PathLike, regex: str = '', variables: Optional[Sequence[str]] = None,
+                    layout: str = 'map', num_workers: Optional[int] = None) -> str:
+    """
+    Write a rechunked local Zarr copy of selected variables (in parallel with dask).
+
+    The copy is written to a temporary folder and moved in place once complete,
+    so a dashboard never opens a half-written copy.
+
+    Args:
+        path: Dataset path (directory, file or list of files).
+        regex: File pattern when path is a directory.
+        variables: Variables to copy (defaults to all data variables).
+        layout: Chunking, see ``zarr_chunks``.
+        num_workers: Dask threads (defaults to the number of CPUs).
+
+    Returns:
+        Path of the Zarr copy.
+    """
+    import dask
+
+    files = resolve_files(path, regex)
+    target = zarr_copy_path(path, regex, files)
+    with xr.open_mfdataset(_source(path, regex), decode_times=False) as data:
+        names = list(variables) if variables else list(data.data_vars)
+        missing = [v for v in names if v not in data.data_vars]
+        if missing:
+            raise ValueError(f"Variables not in dataset: {missing}")
+
+        out = data[names]
+        for name in names:
+            out[name] = out[name].chunk(zarr_chunks(out[name], layout))
+            # Drop the NetCDF chunking so Zarr uses the new one
+            out[name].encoding.pop('chunks', None)
+            out[name].encoding.pop('preferred_chunks', None)
+        for name in out.coords:
+            out[name].encoding.pop('chunks', None)
+            out[name].encoding.pop('preferred_chunks', None)
+        out.attrs['ncdashboard_fingerprint'] = dataset_fingerprint(files)
+        out.attrs['ncdashboard_layout'] = layout
+        # Lets open_dataset skip the source files when every variable was copied
+        out.attrs['ncdashboard_complete'] = int(set(names) == set(data.data_vars))
+
+        tmp = f"{target}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        start = time.monotonic()
+        logger.info(f"Writing {names} to {target} ({layout} layout)")
+        with dask.config.set(scheduler='threads', num_workers=num_workers):
+            out.to_zarr(tmp, mode='w')
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    logger.info(f"Zarr copy written in {time.monotonic() - start:.1f}s: {target}")
+    return target
+
+
+def _open_source(path: PathLike, regex: str = '', use_index: bool = True) -> xr.Dataset:
+    """Open the source files, through the persisted metadata index when enabled."""
+    if use_index:
+        from model.dataset_index import open_indexed
+        return open_indexed(path, regex)
+    return xr.open_mfdataset(_source(path, regex), decode_times=False)
+
+
+def open_dataset(path: PathLike, regex: str = '', use_zarr_copy: bool = True,
+                 use_index: bool = True) -> xr.Dataset:
+    """
+    Open a dataset, reading the variables of an up-to-date Zarr copy from that copy.
+
+    Variables that are not in the copy are still read from the source files.
+
+    Args:
+        path: Dataset path (directory, file or list of files).
+        regex: File pattern when path is a directory.
+        use_zarr_copy: Set to False to always read the source files.
+        use_index: Open the source files through the persisted metadata index
+            (see model/dataset_index.py) so only new or changed files are scanned.
+
+    Returns:
+        The (lazy) dataset, opened with ``decode_times=False``.
+    """
+    if use_zarr_copy:
+        files = resolve_files(path, regex)
+        store = zarr_copy_path(path, regex, files)
+        if os.path.isdir(store):
+            copy = xr.open_zarr(store, decode_times=False)
+            if copy.attrs.get('ncdashboard_fingerprint') == dataset_fingerprint(files):
+                logger.info(f"Reading {list(copy.data_vars)} from Zarr copy {store}")
+                if copy.attrs.get('ncdashboard_complete'):
+                    return copy
+                source = _open_source(path, regex, use_index)
+                return source.assign({v: copy[v] for v in copy.data_vars})
+            copy.close()
+            logger.warning(f"Zarr copy {store} is older than the source files, ignoring it "
+                           f"(re-run --convert-zarr to refresh it)")
+    return _open_source(path, regex, use_index)
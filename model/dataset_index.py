@@ -0,0 +1,373 @@
+"""
+Persisted metadata index of multi-file datasets.
+
+``xr.open_mfdataset`` opens every file and combines their coordinates before
+the server can start, which takes minutes for hundreds of files. The index
+keeps, per file, its size/mtime, dims, variable schemas and the values of its
+(small) 1D index coordinates in a JSON sidecar. On startup only files that are
+new or changed since the index was written are opened; the dataset is then
+assembled lazily from the index (see ``open_indexed``).
+
+Only the common layout is handled (files with the same schema, concatenated
+along one dimension, like ``open_mfdataset``'s default combine). Anything else
+falls back to ``open_mfdataset``.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import numpy as np
+import xarray as xr
+from loguru import logger
+from xarray.backends import BackendArray
+from xarray.core import indexing
+
+from model.data_loader import CACHE_DIR, PathLike, dataset_directory, resolve_files
+
+INDEX_VERSION = 1
+# 1D index coordinates up to this size are stored in full (time steps of a file);
+# larger ones (lat/lon) are only stored as a hash to detect changes.
+MAX_STORED_COORD = 10_000
+MAX_OPEN_FILES = 64
+
+
+class _FileHandles:
+    """
+    Small LRU of opened files, shared by all lazily indexed variables.
+
+    Handles are reference counted while they are read (see ``reading``): a handle
+    evicted from the LRU, or dropped because its file was rewritten, is closed by
+    its last reader instead of under a concurrent read.
+    """
+
+    def __init__(self, max_open: int = MAX_OPEN_FILES):
+        self.max_open = max_open
+        self._handles: OrderedDict = OrderedDict()
+        # id(handle) -> [handle, readers], for the handles being read
+        self._readers: dict[int, list] = {}
+        # Handles out of the LRU, closed when their last reader is done
+        self._retired: set[int] = set()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def reading(self, path: str) -> Iterator[xr.Dataset]:
+        """Opened dataset of ``path``, kept open until the block exits."""
+        ds = self._acquire(path)
+        try:
+            yield ds
+        finally:
+            self._release(ds)
+
+    def _acquire(self, path: str) -> xr.Dataset:
+        with self._lock:
+            ds = self._handles.get(path)
+            if ds is not None:
+                self._handles.move_to_end(path)
+            else:
+                ds = xr.open_dataset(path, decode_times=False)
+                self._handles[path] = ds
+            self._readers.setdefault(id(ds), [ds, 0])[1] += 1
+            while len(self._handles) > self.max_open:
+                _, old = self._handles.popitem(last=False)
+                self._retire(old)
+            return ds
+
+    def _release(self, ds: xr.Dataset) -> None:
+        with self._lock:
+            entry = self._readers[id(ds)]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._readers[id(ds)]
+                if id(ds) in self._retired:
+                    self._retired.discard(id(ds))
+                    ds.close()
+
+    def _retire(self, ds: xr.Dataset) -> None:
+        """Close a handle out of the LRU now, or once its readers are done (lock held)."""
+        if id(ds) in self._readers:
+            self._retired.add(id(ds))
+        else:
+            ds.close()
+
+    def close(self, path: str) -> None:
+        """Close the handle of a file that was rewritten, so the next read reopens it."""
+        with self._lock:
+            ds = self._handles.pop(path, None)
+            if ds is not None:
+                self._retire(ds)
+
+
+_handles = _FileHandles()
+
+
+def _hash_values(values: np.ndarray) -> str:
+    return hashlib.sha1(np.ascontiguousarray(values).tobytes()).hexdigest()
+
+
+def scan_file(path: str) -> dict:
+    """
+    Read the header of one file (and its small 1D index coordinates).
+
+    Returns:
+        Index record with size, mtime, dims, variable schemas and coordinates.
+    """
+    st = os.stat(path)
+    with xr.open_dataset(path, decode_times=False) as ds:
+        index_coords = {}
+        for dim in ds.dims:
+            if dim not in ds.coords or ds[dim].ndim != 1:
+                continue
+            values = ds[dim].values
+            entry = {'size': int(values.size), 'dtype': str(values.dtype), 'hash': _hash_values(values)}
+            if values.size <= MAX_STORED_COORD and np.issubdtype(values.dtype, np.number):
+                entry['values'] = values.tolist()
+            index_coords[dim] = entry
+        return {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'dims': {d: int(n) for d, n in ds.sizes.items()},
+            'variables': {name: {'dims': list(var.dims), 'dtype': str(var.dtype)}
+                          for name, var in ds.data_vars.items()},
+            'index_coords': index_coords,
+        }
+
+
+class DatasetIndex:
+    """Per-file metadata of a dataset, persisted next to the data."""
+
+    def __init__(self, path: PathLike, regex: str = ''):
+        """
+        Args:
+            path: Dataset path (directory, file or list of files).
+            regex: File pattern when path is a directory.
+        """
+        self.path = path
+        self.regex = regex
+        self.files = resolve_files(path, regex)
+        # Named after path/regex (not the file list) so added files update the same index
+        name_hash = hashlib.sha1(f"{path}|{regex}".encode()).hexdigest()[:12]
+        directory = dataset_directory(self.files, path)
+        if not os.access(directory, os.W_OK):
+            directory = CACHE_DIR
+        self.index_path = os.path.join(directory, f".ncdashboard_index_{name_hash}.json")
+        self.records: dict[str, dict] = {}
+        self._load()
+
+    def _load(self) -> None:
+        for candidate in (self.index_path, os.path.join(CACHE_DIR, os.path.basename(self.index_path))):
+            if not os.path.exists(candidate):
+                continue
+            try:
+                with open(candidate, 'r') as f:
+                    content = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable dataset index {candidate}: {e}")
+                continue
+            if content.get('version') == INDEX_VERSION:
+                self.records = content.get('files', {})
+                return
+
+    def save(self) -> None:
+        """Write the index atomically (falls back to the user cache folder)."""
+        content = {'version': INDEX_VERSION, 'files': self.records}
+        for directory in (os.path.dirname(self.index_path), CACHE_DIR):
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(content, f)
+                target = os.path.join(directory, os.path.basename(self.index_path))
+                os.replace(tmp, target)
+                self.index_path = target
+                return
+            except OSError as e:
+                logger.warning(f"Could not write dataset index in {directory}: {e}")
+
+    def refresh(self) -> int:
+        """
+        Scan new or changed files, drop removed ones and save the index if anything changed.
+
+        Returns:
+            Number of files that were (re)scanned.
+        """
+        self.files = resolve_files(self.path, self.regex)
+        current = set(self.files)
+        removed = [f for f in self.records if f not in current]
+        for f in removed:
+            del self.records[f]
+            _handles.close(f)
+
+        scanned = 0
+        for f in self.files:
+            st = os.stat(f)
+            record = self.records.get(f)
+            if record is not None and record['size'] == st.st_size and record['mtime_ns'] == st.st_mtime_ns:
+                continue
+            _handles.close(f)
+            self.records[f] = scan_file(f)
+            scanned += 1
+        if scanned or removed:
+            self.save()
+        return scanned
+
+    def concat_dim(self) -> Optional[str]:
+        """
+        The dimension the files are concatenated along, or None if the layout is not supported.
+
+        It is the only 1D index coordinate whose values differ between files;
+        every file must otherwise share the same dims sizes and variable schemas.
+        """
+        records = [self.records[f] for f in self.files]
+        if len(records) < 2:
+            return None
+        first = records[0]
+        varying = {dim for rec in records[1:] for dim, entry in rec['index_coords'].items()
+                   if first['index_coords'].get(dim, {}).get('hash') != entry['hash']}
+        if len(varying) != 1:
+            return None
+        dim = varying.pop()
+        for rec in records:
+            if 'values' not in rec['index_coords'].get(dim, {}):
+                return None
+            if {d: n for d, n in rec['dims'].items() if d != dim} != \
+                    {d: n for d, n in first['dims'].items() if d != dim}:
+                return None
+            if rec['variables'] != first['variables']:
+                return None
+        return dim
+
+
+class _MultiFileArray(BackendArray):
+    """
+    Lazy view of one variable concatenated over several files.
+
+    Variables that do not have the concatenation dimension in the files are
+    broadcast along it, as ``open_mfdataset`` does with ``data_vars='all'``.
+    """
+
+    def __init__(self, name: str, files: list[str], counts: list[int], file_shape: tuple,
+                 dtype, axis: int, has_axis: bool):
+        self.name = name
+        self.files = files
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.axis = axis
+        self.has_axis = has_axis
+        shape = list(file_shape)
+        if has_axis:
+            shape[axis] = int(self.offsets[-1])
+        else:
+            shape.insert(axis, int(self.offsets[-1]))
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(key, self.shape, indexing.IndexingSupport.BASIC,
+                                                  self._getitem)
+
+    def _read(self, file_idx: int, key: tuple, local) -> np.ndarray:
+        """Read ``key`` from one file, with ``local`` the index along the concat axis."""
+        with _handles.reading(self.files[file_idx]) as ds:
+            variable = ds[self.name].variable
+            if self.has_axis:
+                return np.asarray(variable[key[:self.axis] + (local,) + key[self.axis + 1:]].values)
+            values = np.asarray(variable[key[:self.axis] + key[self.axis + 1:]].values)
+        if isinstance(local, (int, np.integer)):
+            return values
+        n = len(range(*local.indices(int(self.offsets[file_idx + 1] - self.offsets[file_idx]))))
+        out_axis = self.axis - sum(isinstance(k, (int, np.integer)) for k in key[:self.axis])
+        return np.repeat(np.expand_dims(values, out_axis), n, axis=out_axis)
+
+    def _getitem(self, key: tuple) -> np.ndarray:
+        k = key[self.axis]
+        if isinstance(k, (int, np.integer)):
+            f = int(np.searchsorted(self.offsets, k, side='right') - 1)
+            return self._read(f, key, int(k - self.offsets[f]))
+
+        idx = np.arange(*k.indices(self.shape[self.axis]))
+        out_axis = self.axis - sum(isinstance(i, (int, np.integer)) for i in key[:self.axis])
+        if idx.size == 0:
+            shape = [len(range(*s.indices(n))) for s, n in zip(key, self.shape) if isinstance(s, slice)]
+            return np.empty(shape, dtype=self.dtype)
+        # explicit_indexing_adapter only hands us slices with a positive step
+        step = k.step or 1
+        file_ids = np.searchsorted(self.offsets, idx, side='right') - 1
+        parts = []
+        for f in np.unique(file_ids):
+            local = idx[file_ids == f] - self.offsets[f]
+            parts.append(self._read(int(f), key, slice(int(local[0]), int(local[-1]) + 1, step)))
+        return np.concatenate(parts, axis=out_axis) if len(parts) > 1 else parts[0]
+
+
+def build_dataset(index: DatasetIndex, concat_dim: str) -> xr.Dataset:
+    """
+    Assemble the combined dataset from the index without opening every file.
+
+    Static coordinates and attributes come from the first file; the data of
+    each variable (and of the other coordinates along ``concat_dim``) is read
+    lazily from the right file when indexed, with one dask chunk per file
+    along ``concat_dim`` (like ``open_mfdataset``).
+    """
+    files = sorted(index.files, key=lambda f: index.records[f]['index_coords'][concat_dim]['values'][0])
+    records = [index.records[f] for f in files]
+    counts = [rec['dims'][concat_dim] for rec in records]
+    concat_entry = records[0]['index_coords'][concat_dim]
+    concat_values = np.concatenate([np.asarray(rec['index_coords'][concat_dim]['values'],
+                                               dtype=concat_entry['dtype']) for rec in records])
+
+    def lazy(name, var, dims):
+        has_axis = concat_dim in var.dims
+        dims = list(dims) if has_axis else [concat_dim] + list(dims)
+        backend = _MultiFileArray(name, files, counts, var.shape, var.dtype, dims.index(concat_dim), has_axis)
+        return xr.Variable(dims, indexing.LazilyIndexedArray(backend), attrs=var.attrs, encoding=var.encoding)
+
+    with _handles.reading(files[0]) as first:
+        # Static coordinates are loaded: the handle of the first file may be closed later
+        coords = {name: coord.variable.compute() for name, coord in first.coords.items()
+                  if concat_dim not in coord.dims}
+        coords[concat_dim] = xr.Variable(concat_dim, concat_values, attrs=first[concat_dim].attrs)
+        # Coordinates along concat_dim (e.g. a forecast reference time per step) are read
+        # lazily from every file, like the variables
+        for name, coord in first.coords.items():
+            if concat_dim in coord.dims and name != concat_dim:
+                coords[name] = lazy(name, coord.variable, coord.dims)
+        variables = {name: lazy(name, first[name].variable, schema['dims'])
+                     for name, schema in records[0]['variables'].items()}
+        attrs = dict(first.attrs)
+
+    data = xr.Dataset(variables, coords=coords, attrs=attrs)
+    return data.chunk({concat_dim: tuple(counts)})
+
+
+def open_indexed(path: PathLike, regex: str = '') -> xr.Dataset:
+    """
+    Open a multi-file dataset using (and refreshing) its persisted index.
+
+    Falls back to ``xr.open_mfdataset`` for a single file or when the files
+    cannot be combined along a single dimension from the index alone.
+
+    Args:
+        path: Dataset path (directory, file or list of files).
+        regex: File pattern when path is a directory.
+    """
+    source = list(path) if isinstance(path, (list, tuple)) else (os.path.join(path, regex) if regex else path)
+    start = time.monotonic()
+    try:
+        index = DatasetIndex(path, regex)
+        scanned = index.refresh()
+        concat_dim = index.concat_dim()
+        if concat_dim is not None:
+            data = build_dataset(index, concat_dim)
+            logger.info(f"Opened {len(index.files)} files from index {index.index_path} "
+                        f"({scanned} scanned) in {time.monotonic() - start:.1f}s")
+            return data
+    except Exception as e:
+        logger.warning(f"Dataset index unavailable ({e}), opening every file")
+    return xr.open_mfdataset(source, decode_times=False)
@@ -0,0 +1,248 @@
+"""
+Headless export of animations to MP4, GIF or PNG sequences.
+
+Frames use the same data as the ``AnimationNode`` (cropped and coarsened), and its
+colormap and color range. The main process reads the cube in chunk-aligned blocks
+(see ``AnimationNode.plan_blocks``). A process pool draws the frames with
+matplotlib (Agg), each worker reusing one figure for a batch of frames. The PNGs
+are then encoded with ffmpeg (MP4) or Pillow (GIF).
+
+Used by the export button of animations and by ``ncdashboard.py --state <file> --export``.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+from loguru import logger
+
+EXPORT_FORMATS = ('mp4', 'gif', 'png')
+DEFAULT_FPS = 8
+DEFAULT_SIZE = (720, 1280)  # (height, width) in pixels
+# Frames drawn by a worker per task (amortizes figure setup and pickling)
+FRAMES_PER_TASK = 8
+
+
+@dataclass
+class ExportResult:
+    """Output of an export and its throughput."""
+    path: str
+    frames: int
+    seconds: float
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.seconds if self.seconds > 0 else float('inf')
+
+
+def _frame_label(value) -> str:
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def _render_frames(frame_dir, start, values, lats, lons, lut, clim, titles, label, size):
+    """
+    Worker: draw consecutive frames to ``frame_dir/frame_<index>.png``.
+
+    Args:
+        frame_dir: Output folder.
+        start: Index of the first frame of the batch.
+        values: (n, ny, nx) frame values.
+        lats, lons: 1D or 2D coordinates of the frames.
+        lut: (256, 4) uint8 colormap table.
+        clim: Color range.
+        titles: Title of each frame.
+        label: Colorbar label.
+        size: (height, width) in pixels.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
+
+    dpi = 100
+    fig, ax = plt.subplots(figsize=(size[1] / dpi, size[0] / dpi), dpi=dpi)
+    mesh = ax.pcolormesh(lons, lats, np.ma.masked_invalid(values[0]), shading='auto',
+                         cmap=ListedColormap(lut / 255.0), vmin=clim[0], vmax=clim[1])
+    fig.colorbar(mesh, ax=ax, label=label)
+    ax.set_aspect('equal' if np.ndim(lats) == 1 else 'auto')
+    try:
+        for k in range(values.shape[0]):
+            mesh.set_array(np.ma.masked_invalid(values[k]).ravel())
+            ax.set_title(titles[k])
+            fig.savefig(os.path.join(frame_dir, f"frame_{start + k:06d}.png"), dpi=dpi)
+    finally:
+        plt.close(fig)
+    return values.shape[0]
+
+
+def _encode(frame_dir: str, n_frames: int, out_path: str, fmt: str, fps: float) -> str:
+    """Assemble the PNG frames into the output; returns the path written."""
+    if fmt == 'png':
+        os.makedirs(out_path, exist_ok=True)
+        for name in sorted(os.listdir(frame_dir)):
+            shutil.move(os.path.join(frame_dir, name), os.path.join(out_path, name))
+        return out_path
+    if fmt == 'gif':
+        from PIL import Image
+        frames = [Image.open(os.path.join(frame_dir, f"frame_{i:06d}.png")).convert('P', palette=Image.ADAPTIVE)
+                  for i in range(n_frames)]
+        frames[0].save(out_path, save_all=True, append_images=frames[1:],
+                       duration=int(1000 / fps), loop=0, optimize=False)
+        return out_path
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        try:
+            import imageio_ffmpeg
+            ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
+        except ImportError:
+            raise RuntimeError("MP4 export needs ffmpeg (install ffmpeg or imageio-ffmpeg), "
+                               "or export to 'gif' or 'png'") from None
+    # Even dimensions are required by yuv420p
+    cmd = [ffmpeg, '-y', '-loglevel', 'error', '-framerate', str(fps),
+           '-i', os.path.join(frame_dir, 'frame_%06d.png'),
+           '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-pix_fmt', 'yuv420p', out_path]
+    subprocess.run(cmd, check=True)
+    return out_path
+
+
+def export_animation(node, out_path: str, fmt: Optional[str] = None, fps: float = DEFAULT_FPS,
+                     workers: Optional[int] = None, size: tuple[int, int] = DEFAULT_SIZE,
+                     progress: Optional[Callable[[int, int], None]] = None) -> ExportResult:
+    """
+    Render every frame of an animation and encode them.
+
+    Args:
+        node: The AnimationNode (its data is already cropped and coarsened).
+        out_path: Output file (MP4/GIF) or folder (PNG sequence).
+        fmt: 'mp4', 'gif' or 'png'; guessed from ``out_path`` when None.
+        fps: Frames per second of the movie.
+        workers: Processes drawing frames (default: number of CPUs).
+        size: (height, width) of the frames in pixels.
+        progress: Called with (frames done, total).
+
+    Returns:
+        The ExportResult (path, frames, seconds, frames/sec).
+    """
+    from model.client_playback import colormap_lut
+
+    fmt = (fmt or os.path.splitext(out_path)[1].lstrip('.') or 'png').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {EXPORT_FORMATS}")
+
+    data = node.data
+    anim_dim = node.anim_coord_name
+    n_frames = data.sizes[anim_dim]
+    axis = data.dims.index(anim_dim)
+    _, _, lats, lons = node._coords_of(data.isel({anim_dim: 0}))
+    lats, lons = np.asarray(lats.values), np.asarray(lons.values)
+    clim = tuple(node.clim)
+    if None in clim:
+        sample = data.isel({anim_dim: np.unique(np.linspace(0, n_frames - 1, min(n_frames, 10)).astype(int))})
+        clim = tuple(float(q) for q in np.nanpercentile(sample.values, [2, 98]))
+    lut = colormap_lut(node.cmap)
+    label = node.label if getattr(node, 'label', None) else str(node.field_name)
+    name = node.title or node.id
+    titles = [f"{name} - [{i}] {anim_dim}: {_frame_label(v)}" for i, v in enumerate(node.anim_values)]
+
+    chunks = data.chunks[axis] if data.chunks is not None else None
+    frame_bytes = data.dtype.itemsize * data.size // max(n_frames, 1)
+    blocks = node.plan_blocks(n_frames, chunks, frame_bytes, node.PRERENDER_BLOCK_MB * 1024 ** 2)
+    workers = workers or os.cpu_count() or 1
+
+    t0 = time.perf_counter()
+    done = 0
+    frame_dir = tempfile.mkdtemp(prefix='ncdashboard_export_')
+    # spawn: workers must not inherit the dask/panel threads of the server
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            pending = set()
+            for start, stop in blocks:
+                block = np.moveaxis(data.isel({anim_dim: slice(start, stop)}).values, axis, 0)
+                for first in range(0, stop - start, FRAMES_PER_TASK):
+                    batch = block[first:first + FRAMES_PER_TASK]
+                    index = start + first
+                    pending.add(pool.submit(_render_frames, frame_dir, index, batch, lats, lons, lut, clim,
+                                            titles[index:index + len(batch)], label, size))
+                    # Bound the frames held in memory waiting for a worker
+                    while len(pending) >= 2 * workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            done += future.result()
+                        if progress is not None:
+                            progress(done, n_frames)
+            for future in pending:
+                done += future.result()
+        if progress is not None:
+            progress(done, n_frames)
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        path = _encode(frame_dir, n_frames, out_path, fmt, fps)
+    finally:
+        shutil.rmtree(frame_dir, ignore_errors=True)
+
+    result = ExportResult(path, n_frames, time.perf_counter() - t0)
+    logger.info(f"Exported {result.frames} frames of {node.id} to {result.path} "
+                f"in {result.seconds:.1f} s ({result.fps:.1f} frames/s, {workers} workers)")
+    return result
+
+
+def export_state(state: dict, data, out_dir: str, figure_id: Optional[str] = None, **kwargs) -> list[ExportResult]:
+    """
+    Export the animations of a saved dashboard state.
+
+    Args:
+        state: State dict (see model/state.py).
+        data: The dataset of the state (coordinates already assigned).
+        out_dir: Output folder; files are named after the figure ids.
+        figure_id: Only export this figure (default: every animation of the state).
+        **kwargs: fmt, fps, workers, size (see ``export_animation``).
+    """
+    from model.AnimationNode import AnimationNode
+    from model.model_utils import PlotType, Resolutions
+    from proj_layout.utils import get_cmap_object
+
+    figures = {fig.get('id'): fig for fig in state.get('figures', [])}
+    fmt = kwargs.pop('fmt', None) or 'mp4'
+    results = []
+    for fig in figures.values():
+        plot_type = getattr(PlotType, str(fig.get('plot_type')), None)
+        if plot_type is None or not plot_type.is_animation():
+            continue
+        if figure_id is not None and fig.get('id') != figure_id:
+            continue
+        field = data[fig['field_name']]
+        anim_coord = fig.get('animation_coord')
+        # 4D fields: the other leading dim is fixed at the index of the parent figure
+        if field.ndim == 4:
+            parent = figures.get(fig.get('parent_id'), {})
+            other = [d for d in field.dims[:2] if d != anim_coord][0]
+            if other == field.dims[1]:
+                idx = parent.get('depth_idx')
+            else:
+                # FourDNode saves its time index as third_coord_idx
+                idx = parent.get('third_coord_idx', parent.get('time_idx'))
+            idx = idx or 0
+            field = field.isel({other: idx})
+        node = AnimationNode(fig['id'], field, anim_coord, fig.get('spatial_res', Resolutions.HIGH.value),
+                             field_name=fig['field_name'], x_range=fig.get('x_range'),
+                             y_range=fig.get('y_range'), pre_render=False)
+        if fig.get('cmap'):
+            node.cmap = get_cmap_object(fig['cmap'])
+        if fig.get('clim'):
+            node.clim = tuple(fig['clim'])
+        suffix = '' if fmt == 'png' else f'.{fmt}'
+        results.append(export_animation(node, os.path.join(out_dir, f"{fig['id']}{suffix}"), fmt=fmt, **kwargs))
+        node.close()
+    if not results:
+        logger.warning("No animation to export in the state" + (f" with id '{figure_id}'" if figure_id else ""))
+    return results
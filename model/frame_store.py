@@ -0,0 +1,314 @@
+"""
+Process-wide store of pre-rendered animation frames with a memory budget.
+
+Every ``AnimationNode`` keeps its frames here instead of in its own dict, so
+one byte budget covers all the animations of the process and the least
+recently used frames (of any animation) are evicted first. Buffers held
+outside the store (the materialized cube of an animation) can reserve part of
+the budget, so the frames make room for them.
+
+Frames are kept as the 2D values plus their coordinates (the element is
+rebuilt when the frame is shown, which is cheap). Values are stored as float32
+and, optionally, compressed:
+
+* ``zstd``: lossless Blosc/zstd (needs ``numcodecs``, installed with zarr).
+* ``quantize``: 16-bit linear quantization over the frame range (lossy, error
+  below range / 65534, which is invisible once colormapped).
+* ``none``: raw float32.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import numpy as np
+from loguru import logger
+
+DEFAULT_FRAME_CACHE_MB = 1024
+DEFAULT_FRAME_COMPRESSION = 'zstd'
+FRAME_COMPRESSIONS = ('zstd', 'quantize', 'none')
+# Share of the budget that reservations (materialized cubes) may take, the rest is left to frames
+MAX_RESERVED_FRACTION = 0.5
+# Quantized value reserved for missing values
+_QUANT_NAN = np.iinfo(np.uint16).max
+
+
+class StoredFrame:
+    """Values of one frame (compressed or not) and its coordinates."""
+
+    __slots__ = ('payload', 'shape', 'codec', 'offset', 'scale', 'lat_vals', 'lon_vals')
+
+    def __init__(self, payload, shape, codec, lat_vals, lon_vals, offset=0.0, scale=1.0):
+        self.payload = payload
+        self.shape = shape
+        self.codec = codec
+        self.offset = offset
+        self.scale = scale
+        self.lat_vals = lat_vals
+        self.lon_vals = lon_vals
+
+    @property
+    def nbytes(self) -> int:
+        size = len(self.payload) if isinstance(self.payload, bytes) else self.payload.nbytes
+        return size + self.lat_vals.nbytes + self.lon_vals.nbytes
+
+    def values(self) -> np.ndarray:
+        """Decompressed float32 values."""
+        if self.codec == 'zstd':
+            return np.frombuffer(_blosc().decode(self.payload), dtype=np.float32).reshape(self.shape)
+        if self.codec == 'quantize':
+            q = self.payload
+            values = q.astype(np.float32) * np.float32(self.scale) + np.float32(self.offset)
+            values[q == _QUANT_NAN] = np.nan
+            return values
+        return self.payload
+
+
+_codec = None
+
+
+def _blosc():
+    global _codec
+    if _codec is None:
+        from numcodecs import Blosc
+        _codec = Blosc(cname='zstd', clevel=3, shuffle=Blosc.SHUFFLE)
+    return _codec
+
+
+def encode_frame(values: np.ndarray, lat_vals: np.ndarray, lon_vals: np.ndarray,
+                 compression: str = 'none') -> StoredFrame:
+    """
+    Pack the values of a frame for storage.
+
+    Args:
+        values: 2D frame values.
+        lat_vals, lon_vals: Coordinates of the frame (kept as they are).
+        compression: One of ``FRAME_COMPRESSIONS``.
+    """
+    values = np.ascontiguousarray(values, dtype=np.float32)
+    if compression == 'zstd':
+        return StoredFrame(bytes(_blosc().encode(values)), values.shape, 'zstd', lat_vals, lon_vals)
+    if compression == 'quantize':
+        finite = np.isfinite(values)
+        lo = float(values[finite].min()) if finite.any() else 0.0
+        hi = float(values[finite].max()) if finite.any() else 0.0
+        scale = (hi - lo) / (_QUANT_NAN - 1) or 1.0
+        q = np.full(values.shape, _QUANT_NAN, dtype=np.uint16)
+        q[finite] = np.rint((values[finite] - lo) / scale).astype(np.uint16)
+        return StoredFrame(q, values.shape, 'quantize', lat_vals, lon_vals, offset=lo, scale=scale)
+    values.setflags(write=False)
+    return StoredFrame(values, values.shape, 'none', lat_vals, lon_vals)
+
+
+class FrameStore:
+    """Thread-safe LRU of animation frames shared by every animation, with a byte budget."""
+
+    def __init__(self, max_bytes: int = DEFAULT_FRAME_CACHE_MB * 1024 ** 2,
+                 compression: str = DEFAULT_FRAME_COMPRESSION):
+        """
+        Args:
+            max_bytes: Memory budget. Least recently used frames are evicted above it.
+            compression: One of ``FRAME_COMPRESSIONS`` (zstd falls back to none without numcodecs).
+        """
+        if compression not in FRAME_COMPRESSIONS:
+            raise ValueError(f"Unknown frame compression '{compression}', expected one of {FRAME_COMPRESSIONS}")
+        if compression == 'zstd':
+            try:
+                _blosc()
+            except ImportError:
+                logger.warning("numcodecs is not installed, animation frames are stored uncompressed")
+                compression = 'none'
+        self.max_bytes = int(max_bytes)
+        self.compression = compression
+        self.current_bytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        # Per owner: bytes held, frame count and frames lost to eviction
+        self._usage: dict[Hashable, list] = {}
+        # Bytes reserved by buffers held outside the store, per owner
+        self._reserved: dict[Hashable, int] = {}
+        self.reserved_bytes = 0
+        self._lock = threading.RLock()
+
+    def frames(self, owner: Hashable) -> 'AnimationFrames':
+        """Handle on the frames of one animation."""
+        return AnimationFrames(self, owner)
+
+    def get(self, owner: Hashable, index: int) -> Optional[StoredFrame]:
+        with self._lock:
+            frame = self._entries.get((owner, index))
+            if frame is not None:
+                self._entries.move_to_end((owner, index))
+            return frame
+
+    def contains(self, owner: Hashable, index: int) -> bool:
+        with self._lock:
+            return (owner, index) in self._entries
+
+    def put(self, owner: Hashable, index: int, values: np.ndarray,
+            lat_vals: np.ndarray, lon_vals: np.ndarray, compression: Optional[str] = None) -> None:
+        """
+        Compress and store a frame, evicting least recently used frames to stay within budget.
+        Frames larger than the unreserved budget are not stored.
+
+        ``compression`` overrides the store's one, e.g. 'none' for a frame read often
+        that is compressed later with ``demote``.
+        """
+        frame = encode_frame(values, lat_vals, lon_vals, compression or self.compression)
+        if frame.nbytes > self.max_bytes - self.reserved_bytes:
+            return
+        with self._lock:
+            self._remove((owner, index))
+            self._entries[(owner, index)] = frame
+            usage = self._usage.setdefault(owner, [0, 0, 0])
+            usage[0] += frame.nbytes
+            usage[1] += 1
+            self.current_bytes += frame.nbytes
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.current_bytes + self.reserved_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            if key[0] in self._usage:
+                self._usage[key[0]][2] += 1
+
+    def demote(self, owner: Hashable, index: int) -> bool:
+        """
+        Compress a frame stored with another compression (see ``put``) with the store's
+        one. The frame keeps its place in the LRU order.
+
+        Returns:
+            True when the frame was re-encoded.
+        """
+        with self._lock:
+            frame = self._entries.get((owner, index))
+        if frame is None or frame.codec == self.compression:
+            return False
+        encoded = encode_frame(frame.values(), frame.lat_vals, frame.lon_vals, self.compression)
+        with self._lock:
+            if self._entries.get((owner, index)) is not frame:
+                return False
+            self._entries[(owner, index)] = encoded
+            self.current_bytes += encoded.nbytes - frame.nbytes
+            self._usage[owner][0] += encoded.nbytes - frame.nbytes
+            return True
+
+    def reserve(self, owner: Hashable, nbytes: int) -> bool:
+        """
+        Count a buffer held outside the store against the budget, evicting frames to make room.
+        A new reservation of ``owner`` replaces its previous one.
+
+        Returns:
+            False (and nothing is reserved) when the reservations would exceed
+            ``MAX_RESERVED_FRACTION`` of the budget.
+        """
+        with self._lock:
+            self.unreserve(owner)
+            if self.reserved_bytes + nbytes > self.max_bytes * MAX_RESERVED_FRACTION:
+                return False
+            self._reserved[owner] = int(nbytes)
+            self.reserved_bytes += int(nbytes)
+            self._evict()
+            return True
+
+    def unreserve(self, owner: Hashable) -> None:
+        """Release the reservation of ``owner``, if any."""
+        with self._lock:
+            self.reserved_bytes -= self._reserved.pop(owner, 0)
+
+    def _remove(self, key) -> bool:
+        frame = self._entries.pop(key, None)
+        if frame is None:
+            return False
+        self.current_bytes -= frame.nbytes
+        usage = self._usage[key[0]]
+        usage[0] -= frame.nbytes
+        usage[1] -= 1
+        return True
+
+    def discard(self, owner: Hashable, index: int) -> bool:
+        with self._lock:
+            return self._remove((owner, index))
+
+    def release(self, owner: Hashable) -> None:
+        """Drop every frame of an animation (e.g. when its figure is closed)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == owner]:
+                self._remove(key)
+            self._usage.pop(owner, None)
+
+    def usage(self, owner: Hashable) -> tuple[int, int, int]:
+        """(bytes, frames, evicted frames) of one animation."""
+        with self._lock:
+            return tuple(self._usage.get(owner, (0, 0, 0)))
+
+    def stats(self) -> dict:
+        """Return memory usage of the whole store."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "animations": len(self._usage),
+                "bytes": self.current_bytes,
+                "reserved_bytes": self.reserved_bytes,
+                "max_bytes": self.max_bytes,
+                "compression": self.compression,
+            }
+
+
+class AnimationFrames:
+    """Dict-like view of the frames of one animation in a ``FrameStore``."""
+
+    def __init__(self, store: FrameStore, owner: Hashable):
+        self.store = store
+        self.owner = owner
+
+    def __contains__(self, index) -> bool:
+        return self.store.contains(self.owner, index)
+
+    def __len__(self) -> int:
+        return self.store.usage(self.owner)[1]
+
+    def get(self, index: int) -> Optional[StoredFrame]:
+        return self.store.get(self.owner, index)
+
+    def put(self, index: int, values, lat_vals, lon_vals, compression: Optional[str] = None) -> None:
+        self.store.put(self.owner, index, values, lat_vals, lon_vals, compression)
+
+    def demote(self, index: int) -> bool:
+        return self.store.demote(self.owner, index)
+
+    def discard(self, index: int) -> None:
+        self.store.discard(self.owner, index)
+
+    def clear(self) -> None:
+        self.store.release(self.owner)
+
+    @property
+    def nbytes(self) -> int:
+        return self.store.usage(self.owner)[0]
+
+    @property
+    def evictions(self) -> int:
+        return self.store.usage(self.owner)[2]
+
+
+_store: Optional[FrameStore] = None
+_store_lock = threading.Lock()
+
+
+def get_frame_store(max_mb: Optional[float] = None, compression: Optional[str] = None) -> FrameStore:
+    """
+    Return the process-wide frame store, creating it if needed.
+
+    Args:
+        max_mb: Memory budget in MB used when the store is created.
+        compression: Compression used when the store is created.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            budget = DEFAULT_FRAME_CACHE_MB if max_mb is None else max_mb
+            _store = FrameStore(int(budget * 1024 ** 2), compression or DEFAULT_FRAME_COMPRESSION)
+            logger.info(f"Created animation frame store ({budget} MB, {_store.compression})")
+        return _store
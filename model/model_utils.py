@@ -2,6 +2,7 @@ from enum import Enum
 import numpy as np
 from collections import deque
 import xarray as xr
+from model.coord_roles import get_coord_roles
 
 def select_spatial_location(data, lat, lon, coord_names) -> xr.DataArray:
     '''
@@ -52,54 +53,9 @@ def get_all_coords(data):
     """
     Intelligently identifies time, depth, latitude, and longitude coordinates.
     Prioritizes coordinates that match the dimensions of the input DataArray.
+    Roles are cached per variable (see model/coord_roles.py); nodes keep theirs in ``node.roles``.
     """
-    lats = xr.DataArray(np.empty(0))
-    lons = xr.DataArray(np.empty(0))
-    times = xr.DataArray(np.empty(0))
-    depth = xr.DataArray(np.empty(0))
-
-    data_dims = set(data.dims)
-
-    def is_lat(v):
-        name = v.name.lower()
-        return name in ['lat', 'latitude', 'xlat', 'nav_lat', 'yc'] or 'lat' in name
-    
-    def is_lon(v):
-        name = v.name.lower()
-        return name in ['lon', 'longitude', 'xlong', 'nav_lon', 'xc'] or 'lon' in name
-
-    def is_time(v):
-        name = v.name.lower()
-        return name in ['time', 'xtime', 'times', 't']
-    
-    def is_depth(v):
-        name = v.name.lower()
-        return name in ['depth', 'z', 'lev', 'level', 'bottom_top', 'pressure'] or 'depth' in name
-
-    # 1. Filter coordinates that belong to this variable
-    # We prioritize those whose dimensions are a SUBSET of the variable's dimensions.
-    relevant_coords = [data.coords[c] for c in data.coords if set(data.coords[c].dims).issubset(data_dims)]
-    
-    # 2. Assign by name matching from relevant coords
-    for c in relevant_coords:
-        if is_lat(c) and lats.size == 0: lats = c
-        elif is_lon(c) and lons.size == 0: lons = c
-        elif is_time(c) and times.size == 0: times = c
-        elif is_depth(c) and depth.size == 0: depth = c
-
-    # 3. Fallbacks based on dimension position if not found by name
-    dims = list(data.dims)
-    if lats.size == 0 and len(dims) >= 2:
-        lats = data[dims[-2]]
-    if lons.size == 0 and len(dims) >= 1:
-        lons = data[dims[-1]]
-
-    if times.size == 0 and len(dims) >= 3:
-        times = data[dims[0]]
-    if depth.size == 0 and len(dims) == 4:
-        depth = data[dims[1]]
-
-    return times, depth, lats, lons
+    return get_coord_roles(data).coords(data)
 
 def print_tree(node, level=0, prefix="Root: "):
     print(" " * (level * 4) + prefix + str(node.id))
@@ -128,6 +84,9 @@ class PlotType(Enum):
         return self.value in {3, 4}
 
 class Resolutions(Enum):
+    # Values are stored in saved states, so they are kept as they are
     LOW = "high"
     MEDIUM = "medium"
-    HIGH = "low"
\ No newline at end of file
+    HIGH = "low"
+    # Coarsening picked from the cropped extent and the canvas size
+    AUTO = "auto"
\ No newline at end of file
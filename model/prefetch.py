@@ -0,0 +1,94 @@
+"""
+Background prefetch of neighbouring slices.
+
+Nodes tell the prefetcher which slices they expect to need next (based on the
+direction the user is stepping in); the jobs run on the process-wide scheduler
+(see model/scheduler.py) and fill the shared slice cache, so the next click is
+served from memory.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, wait
+from functools import partial
+from typing import Callable, Hashable, Iterable, Optional
+
+from loguru import logger
+
+from model.scheduler import Priority, RenderScheduler, get_scheduler
+
+
+class SlicePrefetcher:
+    """Queues prefetch jobs on the scheduler, keeping only the latest batch per owner."""
+
+    def __init__(self, scheduler: Optional[RenderScheduler] = None):
+        """
+        Args:
+            scheduler: Scheduler running the jobs (default: the process-wide one).
+        """
+        self._scheduler = scheduler or get_scheduler()
+        self._pending: dict[Hashable, list[Future]] = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, owner: Hashable, jobs: Iterable[Callable[[], None]],
+                 priority: Priority = Priority.PREFETCH) -> list[Future]:
+        """
+        Queue a new batch of jobs for ``owner``, dropping its queued (not started) jobs.
+
+        When the user changes direction, the slices queued for the old direction
+        are no longer useful, so they are cancelled before they hit the disk.
+
+        Args:
+            owner: Usually the node id.
+            jobs: Callables that load one slice each into the cache.
+            priority: Priority class of the jobs (PREFETCH for navigation, PRERENDER
+                for work that is not needed by the next click).
+
+        Returns:
+            Futures of the jobs (cancelled when a newer batch replaces them).
+        """
+        with self._lock:
+            self._cancel_locked(owner)
+            futures = [self._scheduler.submit(partial(self._run, job), priority, owner=owner) for job in jobs]
+            self._pending[owner] = futures
+            return list(futures)
+
+    def wait(self, owner: Hashable, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the latest batch of ``owner`` is done (run or cancelled).
+
+        Returns:
+            False if ``timeout`` (seconds) expired first.
+        """
+        with self._lock:
+            futures = list(self._pending.get(owner, []))
+        return not wait(futures, timeout=timeout).not_done
+
+    def cancel(self, owner: Hashable) -> None:
+        """Cancel every queued job of ``owner`` (running jobs finish normally)."""
+        with self._lock:
+            self._cancel_locked(owner)
+
+    def _cancel_locked(self, owner: Hashable) -> None:
+        for future in self._pending.pop(owner, []):
+            future.cancel()
+
+    @staticmethod
+    def _run(job: Callable[[], None]) -> None:
+        try:
+            job()
+        except Exception as e:
+            logger.warning(f"Prefetch job failed: {e}")
+
+
+_prefetcher: Optional[SlicePrefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> SlicePrefetcher:
+    """Return the process-wide prefetcher, creating it on first use."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = SlicePrefetcher()
+        return _prefetcher
@@ -0,0 +1,131 @@
+"""
+Web Mercator projection of grids, computed once per grid.
+
+Geographic figures are drawn over map tiles in Web Mercator. Elements built in
+lon/lat (PlateCarree) are warped by cartopy on every frame; elements already in
+Web Mercator are used as they are. A ``MercatorGrid`` holds, for a regular
+lon/lat grid, the uniform Mercator axes and the row/column indices that
+resample a slice onto them (nearest neighbour), so projecting a frame is a
+single fancy index. Grids are shared by every node and animation frame through
+a small process-wide LRU.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cartopy.crs as ccrs
+import numpy as np
+
+# Half the width of the Web Mercator world in meters (same as model/viewport.py)
+MERCATOR_EXTENT = 20037508.34
+MAX_LAT = 85.05112878
+MERCATOR = ccrs.GOOGLE_MERCATOR
+MAX_GRIDS = 256
+
+
+def lonlat_to_mercator(lons, lats) -> tuple[np.ndarray, np.ndarray]:
+    """Vectorized lon/lat (degrees) to Web Mercator x/y (meters)."""
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_LAT, MAX_LAT)
+    x = lons * MERCATOR_EXTENT / 180.0
+    y = np.log(np.tan(np.pi / 4 + np.radians(lats) / 2)) * MERCATOR_EXTENT / np.pi
+    return x, y
+
+
+def _resample_axis(projected: np.ndarray) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Uniform, ascending axis spanning ``projected`` and the source index of each of its cells.
+
+    Returns:
+        Tuple (axis, index); index is None when the source is already uniform and ascending.
+    """
+    n = projected.size
+    if n < 2:
+        return projected, None
+    steps = np.diff(projected)
+    if np.all(steps > 0) and np.allclose(steps, steps[0], rtol=1e-3):
+        return projected, None
+    order = np.argsort(projected)
+    ordered = projected[order]
+    axis = np.linspace(ordered[0], ordered[-1], n)
+    pos = np.clip(np.searchsorted(ordered, axis), 1, n - 1)
+    nearest = np.where(axis - ordered[pos - 1] <= ordered[pos] - axis, pos - 1, pos)
+    return axis, order[nearest]
+
+
+class MercatorGrid:
+    """Resampling of a regular lon/lat grid onto uniform Web Mercator axes."""
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray):
+        """
+        Args:
+            lats: 1D latitudes (any order).
+            lons: 1D longitudes (any order, within -180..180).
+        """
+        x, _ = lonlat_to_mercator(lons, np.zeros_like(lons, dtype=np.float64))
+        _, y = lonlat_to_mercator(np.zeros_like(lats, dtype=np.float64), lats)
+        self.x, self.cols = _resample_axis(x)
+        self.y, self.rows = _resample_axis(y)
+
+    def project(self, values: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Resample a (lat, lon) slice onto the Mercator axes.
+
+        Returns:
+            Tuple (x, y, values) ready for an element with ``crs=MERCATOR``.
+        """
+        if self.rows is not None:
+            values = values[self.rows]
+        if self.cols is not None:
+            values = values[:, self.cols]
+        return self.x, self.y, values
+
+
+def _signature(*arrays: np.ndarray) -> tuple:
+    """Cheap key of coordinate arrays: shape, first/last values and sum."""
+    key = ()
+    for a in arrays:
+        flat = a.reshape(-1)
+        key += (a.shape, float(flat[0]), float(flat[-1]), float(np.nansum(flat)))
+    return key
+
+
+_grids: OrderedDict = OrderedDict()
+_grids_lock = threading.Lock()
+
+
+def _cached(key: tuple, build):
+    with _grids_lock:
+        value = _grids.get(key)
+        if value is not None:
+            _grids.move_to_end(key)
+            return value
+    value = build()
+    with _grids_lock:
+        _grids[key] = value
+        while len(_grids) > MAX_GRIDS:
+            _grids.popitem(last=False)
+    return value
+
+
+def get_mercator_grid(lats: np.ndarray, lons: np.ndarray) -> Optional[MercatorGrid]:
+    """
+    Shared Mercator resampling of a regular grid, or None when it cannot be used
+    (longitudes outside -180..180 are left to cartopy, which wraps them).
+    """
+    lats, lons = np.asarray(lats), np.asarray(lons)
+    if lats.ndim != 1 or lons.ndim != 1 or not lats.size or not lons.size:
+        return None
+    if np.nanmax(np.abs(lons)) > 180 or not np.all(np.isfinite(lats)) or not np.all(np.isfinite(lons)):
+        return None
+    return _cached(('grid',) + _signature(lats, lons), lambda: MercatorGrid(lats, lons))
+
+
+def get_mercator_coords(lats: np.ndarray, lons: np.ndarray) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """Shared Mercator (x, y) of 2D curvilinear coordinates, or None when they cannot be used."""
+    lats, lons = np.asarray(lats), np.asarray(lons)
+    if lats.shape != lons.shape or lats.ndim != 2 or np.nanmax(np.abs(lons)) > 180:
+        return None
+    return _cached(('coords',) + _signature(lats, lons), lambda: lonlat_to_mercator(lons, lats))
@@ -0,0 +1,313 @@
+"""
+Multi-resolution overview pyramids of 2D/3D/4D fields.
+
+Each variable gets block-mean overview levels (2x2, 4x4 and 8x8 cells) of every
+2D slice, stored in a local Zarr store with a multiscale layout::
+
+    <dataset folder>/.ncdashboard_pyramid_<hash>.zarr/
+        <variable>/2        (..., ny // 2, nx // 2)
+        <variable>/4        (..., ny // 4, nx // 4)
+        <variable>/8        (..., ny // 8, nx // 8)
+        <variable>/built    (...)  1 once the levels of a slice are written
+
+Levels are written either offline (``ncdashboard.py --build-pyramid``) or on
+demand, the first time a slice is displayed zoomed out. When rendering, the
+coarsest level that still has at least one cell per canvas pixel is used, so a
+full-domain view reads about 1/64 of the data.
+
+Zarr is an optional dependency: without it pyramids are simply disabled.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import shutil
+import threading
+from typing import Optional, Sequence
+
+import numpy as np
+import xarray as xr
+from loguru import logger
+
+from model.data_loader import CACHE_DIR, PathLike, dataset_directory, dataset_fingerprint, resolve_files
+
+PYRAMID_FACTORS = (2, 4, 8)
+# Spatial chunk size of the stored levels
+CHUNK = 1024
+
+
+def block_mean_levels(values: np.ndarray, factors: Sequence[int] = PYRAMID_FACTORS) -> dict[int, np.ndarray]:
+    """
+    Compute NaN-aware block means of a 2D array for each factor.
+
+    Coarser levels are aggregated from the sums/counts of the finer ones, so
+    every level is the exact mean of the valid cells it covers.
+
+    Args:
+        values: 2D array.
+        factors: Increasing block sizes, each a multiple of the previous one.
+
+    Returns:
+        Dict factor -> float32 array (NaN where a block has no valid cell).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    levels = {}
+    sums, counts, previous = values, np.isfinite(values).astype(np.int64), 1
+    sums = np.where(np.isfinite(sums), sums, 0)
+    for factor in factors:
+        step = factor // previous
+        ny, nx = sums.shape[-2] // step, sums.shape[-1] // step
+        sums = sums[..., :ny * step, :nx * step].reshape(ny, step, nx, step).sum(axis=(1, 3))
+        counts = counts[..., :ny * step, :nx * step].reshape(ny, step, nx, step).sum(axis=(1, 3))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            levels[factor] = np.where(counts > 0, sums / counts, np.nan).astype(np.float32)
+        previous = factor
+    return levels
+
+
+def coarsen_coord(coord: np.ndarray, factor: int) -> np.ndarray:
+    """Block-mean a 1D or 2D coordinate array the same way as the data."""
+    coord = np.asarray(coord, dtype=np.float64)
+    if coord.ndim == 1:
+        n = coord.size // factor
+        return coord[:n * factor].reshape(n, factor).mean(axis=1)
+    ny, nx = coord.shape[0] // factor, coord.shape[1] // factor
+    return coord[:ny * factor, :nx * factor].reshape(ny, factor, nx, factor).mean(axis=(1, 3))
+
+
+def choose_factor(window_shape: tuple[int, int], canvas: tuple[int, int],
+                  factors: Sequence[int] = PYRAMID_FACTORS) -> int:
+    """
+    Coarsest factor that still gives at least one cell per canvas pixel.
+
+    Args:
+        window_shape: (ny, nx) of the full-resolution window being displayed.
+        canvas: (height, width) of the canvas in pixels (pixel ratio included).
+
+    Returns:
+        The chosen factor, or 1 to read at full resolution.
+    """
+    ny, nx = window_shape
+    height, width = canvas
+    best = 1
+    for factor in factors:
+        if ny / factor >= height and nx / factor >= width:
+            best = factor
+    return best
+
+
+class VariablePyramid:
+    """Overview levels of one variable inside a pyramid store."""
+
+    def __init__(self, group, data: xr.DataArray, factors: Sequence[int] = PYRAMID_FACTORS):
+        """
+        Args:
+            group: Zarr group of the variable.
+            data: Full-resolution DataArray (spatial dims last).
+            factors: Block sizes of the levels.
+        """
+        self.group = group
+        self.lead_shape = tuple(data.shape[:-2]) or (1,)
+        self.ny, self.nx = data.shape[-2], data.shape[-1]
+        self.factors = tuple(f for f in factors if self.ny // f >= 2 and self.nx // f >= 2)
+        self._lock = threading.Lock()
+
+        lead_chunks = (1,) * len(self.lead_shape)
+        self.levels = {}
+        for f in self.factors:
+            shape = self.lead_shape + (self.ny // f, self.nx // f)
+            chunks = lead_chunks + (min(CHUNK, shape[-2]), min(CHUNK, shape[-1]))
+            self.levels[f] = group.require_array(str(f), shape=shape, chunks=chunks,
+                                                 dtype='float32', fill_value=np.nan)
+        self.built_array = group.require_array('built', shape=self.lead_shape, chunks=lead_chunks,
+                                               dtype='uint8', fill_value=0)
+        # Kept in memory so renders never hit the store just to check for a level
+        self._built = {tuple(int(i) for i in idx) for idx in zip(*np.nonzero(self.built_array[...]))}
+        group.attrs['multiscales'] = [{
+            'version': '0.4',
+            'datasets': [{'path': str(f), 'factor': f} for f in self.factors],
+            'type': 'block_mean',
+        }]
+
+    def _key(self, lead_idx: tuple) -> tuple:
+        return tuple(int(i) for i in lead_idx) if lead_idx else (0,)
+
+    def has(self, lead_idx: tuple) -> bool:
+        """True when the levels of the slice at ``lead_idx`` (e.g. (t,) or (t, z)) are stored."""
+        return self._key(lead_idx) in self._built
+
+    def write(self, lead_idx: tuple, values: np.ndarray) -> None:
+        """
+        Compute and store all levels of one full-resolution 2D slice.
+
+        Args:
+            lead_idx: Indices over the leading dims, () for 2D variables.
+            values: Full 2D slice.
+        """
+        if not self.factors:
+            return
+        key = self._key(lead_idx)
+        for f, level in block_mean_levels(values, self.factors).items():
+            self.levels[f][key + (slice(None), slice(None))] = level
+        self.built_array[key] = 1
+        with self._lock:
+            self._built.add(key)
+
+    def read(self, lead_idx: tuple, factor: int, window: Optional[tuple[slice, slice]] = None):
+        """
+        Read a level of one slice, restricted to a full-resolution index window.
+
+        Args:
+            lead_idx: Indices over the leading dims, () for 2D variables.
+            factor: Level to read (one of ``self.factors``).
+            window: (lat_slice, lon_slice) in full-resolution indices, or None.
+
+        Returns:
+            Tuple (values, (lat_slice, lon_slice)) with the slices in level indices.
+        """
+        level = self.levels[factor]
+        ny, nx = level.shape[-2], level.shape[-1]
+        if window is None:
+            lat_sl, lon_sl = slice(0, ny), slice(0, nx)
+        else:
+            lat_sl = slice(window[0].start // factor, min(ny, math.ceil(window[0].stop / factor)))
+            lon_sl = slice(window[1].start // factor, min(nx, math.ceil(window[1].stop / factor)))
+        values = level[self._key(lead_idx) + (lat_sl, lon_sl)]
+        return values, (lat_sl, lon_sl)
+
+    def resize(self, data: xr.DataArray) -> None:
+        """Grow the levels to the leading shape of ``data`` (new time steps were appended)."""
+        lead_shape = tuple(data.shape[:-2]) or (1,)
+        if lead_shape == self.lead_shape:
+            return
+        for f, level in self.levels.items():
+            level.resize(lead_shape + level.shape[-2:])
+        self.built_array.resize(lead_shape)
+        self.lead_shape = lead_shape
+
+    def invalidate(self, stale_steps: Optional[set] = None) -> None:
+        """
+        Forget the levels of slices whose data changed.
+
+        Args:
+            stale_steps: Indices along the first leading dim, or None for every slice.
+        """
+        with self._lock:
+            stale = [k for k in self._built if stale_steps is None or k[0] in stale_steps]
+            for key in stale:
+                self._built.discard(key)
+        for key in stale:
+            self.built_array[key] = 0
+
+
+class PyramidStore:
+    """Zarr store holding the pyramids of every variable of a dataset."""
+
+    def __init__(self, path: PathLike, regex: str = '', root: Optional[str] = None):
+        """
+        Args:
+            path: Dataset path (directory, file or list of files).
+            regex: File pattern when path is a directory.
+            root: Folder for the store (defaults to the data folder, or
+                ~/.cache/ncdashboard when it is unknown or read-only).
+        """
+        import zarr
+
+        files = resolve_files(path, regex)
+        fingerprint = dataset_fingerprint(files)
+        name_hash = hashlib.sha1('\n'.join(files).encode()).hexdigest()[:12]
+        if root is None:
+            root = dataset_directory(files, path)
+            if not os.access(root, os.W_OK):
+                root = CACHE_DIR
+        os.makedirs(root, exist_ok=True)
+        self.store_path = os.path.join(root, f".ncdashboard_pyramid_{name_hash}.zarr")
+
+        group = zarr.open_group(self.store_path, mode='a')
+        if group.attrs.get('fingerprint') not in (None, fingerprint):
+            logger.info(f"Files changed since {self.store_path} was built, discarding old pyramid")
+            shutil.rmtree(self.store_path, ignore_errors=True)
+            group = zarr.open_group(self.store_path, mode='a')
+        group.attrs['fingerprint'] = fingerprint
+        self.path = path
+        self.regex = regex
+        self.group = group
+        self._variables: dict[str, VariablePyramid] = {}
+        self._lock = threading.Lock()
+
+    def variable(self, var_name: str, data: xr.DataArray) -> VariablePyramid:
+        """Return (creating if needed) the pyramid of ``var_name``."""
+        with self._lock:
+            pyramid = self._variables.get(var_name)
+            if pyramid is None:
+                pyramid = VariablePyramid(self.group.require_group(var_name), data)
+                self._variables[var_name] = pyramid
+            return pyramid
+
+    def refresh(self, data: xr.Dataset, stale_steps: Optional[set] = None) -> None:
+        """
+        Follow the dataset after files were added or rewritten while the server runs.
+
+        Args:
+            data: The reopened dataset.
+            stale_steps: Indices along the first leading dim whose data changed (None = all).
+        """
+        self.group.attrs['fingerprint'] = dataset_fingerprint(resolve_files(self.path, self.regex))
+        with self._lock:
+            variables = dict(self._variables)
+        for var_name, pyramid in variables.items():
+            if var_name not in data:
+                continue
+            pyramid.resize(data[var_name])
+            pyramid.invalidate(stale_steps)
+
+    def build(self, data: xr.Dataset, variables: Optional[Sequence[str]] = None) -> None:
+        """
+        Write every missing level of every 2D/3D/4D variable (offline build).
+
+        Args:
+            data: The opened dataset.
+            variables: Names to build (defaults to every numeric variable with 2+ dims).
+        """
+        if variables is None:
+            variables = [v for v, da in data.data_vars.items()
+                         if da.ndim >= 2 and np.issubdtype(da.dtype, np.number)]
+        for var in variables:
+            da = data[var]
+            pyramid = self.variable(var, da)
+            indices = list(np.ndindex(*da.shape[:-2])) if da.ndim > 2 else [()]
+            todo = [idx for idx in indices if not pyramid.has(idx)]
+            logger.info(f"Building pyramid of {var}: {len(todo)}/{len(indices)} slices")
+            for count, idx in enumerate(todo, 1):
+                pyramid.write(idx, da[idx].values if idx else da.values)
+                if count % 50 == 0 or count == len(todo):
+                    logger.info(f"  {var}: {count}/{len(todo)} slices")
+        logger.info(f"Pyramid written to {self.store_path}")
+
+
+_stores: dict[str, Optional[PyramidStore]] = {}
+_stores_lock = threading.Lock()
+
+
+def get_pyramid_store(path: PathLike, regex: str = '', root: Optional[str] = None) -> Optional[PyramidStore]:
+    """
+    Return the process-wide pyramid store of a dataset, or None if Zarr is not installed.
+
+    Args:
+        path: Dataset path (directory, file or list of files).
+        regex: File pattern when path is a directory.
+        root: Optional folder for the store.
+    """
+    key = f"{path}|{regex}"
+    with _stores_lock:
+        if key not in _stores:
+            try:
+                _stores[key] = PyramidStore(path, regex, root=root)
+            except ImportError:
+                logger.warning("zarr is not installed: overview pyramids are disabled (pip install zarr)")
+                _stores[key] = None
+            except Exception as e:
+                logger.warning(f"Could not open overview pyramid for {path}: {e}")
+                _stores[key] = None
+        return _stores[key]
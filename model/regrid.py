@@ -0,0 +1,218 @@
+"""
+Regridding of curvilinear grids (2D lat/lon, e.g. WRF) to a regular lon/lat raster.
+
+``gv.QuadMesh`` is much slower to rasterize than ``gv.Image``. A ``Regridder``
+computes, once per grid, which source cells (and weights) feed each cell of a
+regular raster covering the domain; every slice is then regridded with a single
+vectorized gather, and renderers use the Image path.
+
+Weights are cached on disk (``~/.cache/ncdashboard/regrid``) keyed by a hash of
+the grid, so they are computed only once per grid across restarts.
+
+Two methods are available:
+
+* ``nearest``: the closest source cell.
+* ``bilinear``: the four source cells around the point, with weights from the
+  fractional grid indices (obtained by inverting the local grid Jacobian).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+from scipy.spatial import cKDTree
+
+REGRID_METHODS = ('nearest', 'bilinear')
+REGRID_VERSION = 1
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ncdashboard', 'regrid')
+
+
+def grid_hash(lats: np.ndarray, lons: np.ndarray, method: str) -> str:
+    """Hash identifying a curvilinear grid and a regridding method."""
+    h = hashlib.sha1(f"{REGRID_VERSION}|{method}|{lats.shape}".encode())
+    h.update(np.ascontiguousarray(lats, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(lons, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+class Regridder:
+    """Precomputed gather indices and weights from a curvilinear grid to a regular raster."""
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, method: str = 'bilinear',
+                 target_lats: Optional[np.ndarray] = None, target_lons: Optional[np.ndarray] = None,
+                 indices: Optional[np.ndarray] = None, weights: Optional[np.ndarray] = None):
+        """
+        Args:
+            lats: 2D source latitudes (ny, nx).
+            lons: 2D source longitudes (ny, nx).
+            method: 'nearest' or 'bilinear'.
+            target_lats, target_lons, indices, weights: Precomputed tables (see ``load``);
+                computed from the grid when omitted.
+        """
+        if method not in REGRID_METHODS:
+            raise ValueError(f"Unknown regrid method '{method}', expected one of {REGRID_METHODS}")
+        self.method = method
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.shape = self.lats.shape
+        if indices is None:
+            target_lats, target_lons, indices, weights = self._compute()
+        self.target_lats = target_lats
+        self.target_lons = target_lons
+        # (k, ny_t * nx_t) flat source indices and weights, k = 1 (nearest) or 4 (bilinear).
+        # Cells outside the source domain have all-zero weights.
+        self.indices = indices
+        self.weights = weights
+
+    @property
+    def target_shape(self) -> tuple[int, int]:
+        return self.target_lats.size, self.target_lons.size
+
+    def _compute(self):
+        ny, nx = self.shape
+        finite = np.isfinite(self.lats) & np.isfinite(self.lons)
+        target_lats = np.linspace(self.lats[finite].min(), self.lats[finite].max(), ny)
+        target_lons = np.linspace(self.lons[finite].min(), self.lons[finite].max(), nx)
+
+        # Work in a local plane (degrees of longitude shrink with latitude)
+        scale = np.cos(np.radians(np.mean(target_lats)))
+        sx, sy = np.where(finite, self.lons, 1e9) * scale, np.where(finite, self.lats, 1e9)
+        tx, ty = np.meshgrid(target_lons * scale, target_lats)
+        tx, ty = tx.ravel(), ty.ravel()
+
+        tree = cKDTree(np.column_stack([sx.ravel(), sy.ravel()]))
+        _, nearest = tree.query(np.column_stack([tx, ty]))
+        i, j = np.divmod(nearest, nx)
+
+        # Fractional grid indices from the local Jacobian of (x, y) w.r.t. (i, j)
+        dx_di, dx_dj = (g[i, j] for g in np.gradient(sx, axis=(0, 1)))
+        dy_di, dy_dj = (g[i, j] for g in np.gradient(sy, axis=(0, 1)))
+        ex, ey = tx - sx[i, j], ty - sy[i, j]
+        det = dx_di * dy_dj - dx_dj * dy_di
+        with np.errstate(divide='ignore', invalid='ignore'):
+            di = (ex * dy_dj - dx_dj * ey) / det
+            dj = (dx_di * ey - ex * dy_di) / det
+        fi, fj = i + di, j + dj
+        # Points more than half a cell outside the grid are outside the domain
+        valid = (np.isfinite(fi) & np.isfinite(fj) & (np.abs(di) <= 1.5) & (np.abs(dj) <= 1.5)
+                 & (fi >= -0.5) & (fi <= ny - 0.5) & (fj >= -0.5) & (fj <= nx - 0.5))
+
+        if self.method == 'nearest':
+            indices = nearest[np.newaxis, :].astype(np.int32)
+            weights = valid[np.newaxis, :].astype(np.float32)
+        else:
+            fi = np.clip(np.nan_to_num(fi), 0, ny - 1)
+            fj = np.clip(np.nan_to_num(fj), 0, nx - 1)
+            i0 = np.minimum(np.floor(fi).astype(np.int64), max(ny - 2, 0))
+            j0 = np.minimum(np.floor(fj).astype(np.int64), max(nx - 2, 0))
+            wi, wj = fi - i0, fj - j0
+            i1, j1 = np.minimum(i0 + 1, ny - 1), np.minimum(j0 + 1, nx - 1)
+            indices = np.stack([i0 * nx + j0, i1 * nx + j0, i0 * nx + j1, i1 * nx + j1]).astype(np.int32)
+            weights = np.stack([(1 - wi) * (1 - wj), wi * (1 - wj), (1 - wi) * wj, wi * wj])
+            weights = (weights * valid).astype(np.float32)
+        return target_lats, target_lons, indices, weights
+
+    def _target_box(self, window: tuple[slice, slice]) -> tuple[slice, slice]:
+        """Rows/cols of the regular raster covering a window of the source grid."""
+        lats = self.lats[window]
+        lons = self.lons[window]
+        r0 = max(0, int(np.searchsorted(self.target_lats, np.nanmin(lats), side='right')) - 1)
+        r1 = int(np.searchsorted(self.target_lats, np.nanmax(lats), side='left')) + 1
+        c0 = max(0, int(np.searchsorted(self.target_lons, np.nanmin(lons), side='right')) - 1)
+        c1 = int(np.searchsorted(self.target_lons, np.nanmax(lons), side='left')) + 1
+        return slice(r0, min(r1, self.target_lats.size)), slice(c0, min(c1, self.target_lons.size))
+
+    def regrid(self, values: np.ndarray, window: Optional[tuple[slice, slice]] = None):
+        """
+        Regrid a slice (or a window of it) to the regular raster.
+
+        Args:
+            values: 2D values over the full grid, or over ``window``.
+            window: (lat_slice, lon_slice) of the source grid ``values`` covers, or None.
+
+        Returns:
+            Tuple (values, lats, lons) with 2D float32 values and 1D ascending coordinates.
+        """
+        values = np.asarray(values)
+        if window is None:
+            rows, cols = slice(0, self.target_lats.size), slice(0, self.target_lons.size)
+            local, weights = self.indices, self.weights
+        else:
+            rows, cols = self._target_box(window)
+            cells = (np.arange(rows.start, rows.stop)[:, None] * self.target_lons.size
+                     + np.arange(cols.start, cols.stop)[None, :]).ravel()
+            i, j = np.divmod(self.indices[:, cells], self.shape[1])
+            li, lj = i - window[0].start, j - window[1].start
+            inside = (li >= 0) & (li < values.shape[0]) & (lj >= 0) & (lj < values.shape[1])
+            local = np.where(inside, li * values.shape[1] + lj, 0)
+            weights = np.where(inside, self.weights[:, cells], 0)
+
+        # One gather; missing values (and cells outside the window) get no weight
+        gathered = values.reshape(-1)[local].astype(np.float32)
+        missing = ~np.isfinite(gathered)
+        weights = np.where(missing, 0, weights)
+        total = weights.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = np.where(total > 0, (np.where(missing, 0, gathered) * weights).sum(axis=0) / total, np.nan)
+        shape = (rows.stop - rows.start, cols.stop - cols.start)
+        return out.astype(np.float32).reshape(shape), self.target_lats[rows], self.target_lons[cols]
+
+    def save(self, path: str) -> None:
+        """Write the tables atomically."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, target_lats=self.target_lats, target_lons=self.target_lons,
+                     indices=self.indices, weights=self.weights)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, lats: np.ndarray, lons: np.ndarray, method: str) -> 'Regridder':
+        with np.load(path) as tables:
+            return cls(lats, lons, method, target_lats=tables['target_lats'],
+                       target_lons=tables['target_lons'], indices=tables['indices'],
+                       weights=tables['weights'])
+
+
+_regridders: dict[str, Regridder] = {}
+_regridders_lock = threading.Lock()
+
+
+def get_regridder(lats: np.ndarray, lons: np.ndarray, method: str = 'bilinear',
+                  cache_dir: str = CACHE_DIR) -> Regridder:
+    """
+    Return the regridder of a curvilinear grid, loading its weights from disk or computing them.
+
+    Args:
+        lats: 2D source latitudes.
+        lons: 2D source longitudes.
+        method: 'nearest' or 'bilinear'.
+        cache_dir: Folder of the on-disk weights cache.
+    """
+    lats, lons = np.asarray(lats), np.asarray(lons)
+    key = grid_hash(lats, lons, method)
+    with _regridders_lock:
+        regridder = _regridders.get(key)
+        if regridder is not None:
+            return regridder
+        path = os.path.join(cache_dir, f"{key}.npz")
+        if os.path.exists(path):
+            try:
+                regridder = Regridder.load(path, lats, lons, method)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable regrid weights {path}: {e}")
+        if regridder is None:
+            regridder = Regridder(lats, lons, method)
+            logger.info(f"Computed {method} regrid weights for a {lats.shape} grid")
+            try:
+                regridder.save(path)
+            except OSError as e:
+                logger.warning(f"Could not cache regrid weights in {cache_dir}: {e}")
+        _regridders[key] = regridder
+        return regridder
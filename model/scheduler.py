@@ -0,0 +1,276 @@
+"""
+Process-wide scheduler of background render and compute work.
+
+Sessions do not start their own threads for background work. Slice prefetch,
+animation pre-rendering and rasterization, pyramid builds and statistics are
+queued here and run on one small pool of worker threads:
+
+* by priority class: ``VISIBLE`` > ``PREFETCH`` > ``PRERENDER`` > ``STATS``;
+* within a class, round-robin over the sessions, so a session pre-rendering a long
+  animation does not starve the others;
+* while a figure is being rendered on screen (``with scheduler.visible():``), no
+  ``PRERENDER`` or ``STATS`` task is started, so they do not compete with it for
+  the GIL and the HDF5 lock.
+
+Long jobs are submitted as generators (``submit_steps``): every step is a task of
+its own, queued again behind the work of the other sessions, so the job yields
+the workers between steps and stops at the next one once it is cancelled (node
+closed or session ended).
+"""
+from __future__ import annotations
+
+import functools
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, InvalidStateError
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Callable, Hashable, Iterator, Optional
+
+from loguru import logger
+
+DEFAULT_BACKGROUND_WORKERS = 2
+# Session of the work shared by every session (e.g. dataset statistics), which is
+# not cancelled when a session ends
+SHARED_SESSION = 'shared'
+
+
+class Priority(IntEnum):
+    """Priority classes, most urgent first."""
+    VISIBLE = 0
+    PREFETCH = 1
+    PRERENDER = 2
+    STATS = 3
+
+
+def current_session() -> Optional[str]:
+    """Id of the Bokeh session being served by this thread (None outside a session)."""
+    try:
+        import panel as pn
+        doc = pn.state.curdoc
+        context = getattr(doc, 'session_context', None) if doc is not None else None
+        return getattr(context, 'id', None)
+    except Exception:
+        return None
+
+
+def visible_render(method):
+    """
+    Decorator of DynamicMap callbacks: the render counts as ``VISIBLE`` work, so no
+    pre-rendering or statistics task starts while it runs (see ``RenderScheduler.visible``).
+    Stream values are passed by keyword, as HoloViews does for ``**kwargs`` callbacks.
+    """
+    @functools.wraps(method)
+    def wrapper(self, **kwargs):
+        with get_scheduler().visible():
+            return method(self, **kwargs)
+    return wrapper
+
+
+class _Task:
+    __slots__ = ('fn', 'priority', 'owner', 'session', 'future')
+
+    def __init__(self, fn, priority, owner, session, future):
+        self.fn = fn
+        self.priority = priority
+        self.owner = owner
+        self.session = session
+        self.future = future
+
+
+class RenderScheduler:
+    """Priority queue of background tasks with per-session round-robin, run on a thread pool."""
+
+    def __init__(self, max_workers: int = DEFAULT_BACKGROUND_WORKERS):
+        """
+        Args:
+            max_workers: Number of worker threads shared by every session.
+        """
+        self.max_workers = max(1, int(max_workers))
+        # Per priority class: queued tasks by session, in round-robin order
+        self._queues: dict[Priority, OrderedDict] = {p: OrderedDict() for p in Priority}
+        # Jobs of submit_steps still running, with their (owner, session)
+        self._chains: dict[Future, tuple] = {}
+        self._cond = threading.Condition()
+        self._visible = 0
+        self._running = 0
+        for i in range(self.max_workers):
+            threading.Thread(target=self._worker, daemon=True, name=f'ncdash-worker-{i}').start()
+
+    def submit(self, fn: Callable[[], object], priority: Priority = Priority.PREFETCH,
+               owner: Hashable = None, session: Hashable = None) -> Future:
+        """
+        Queue a task.
+
+        Args:
+            fn: Callable run on a worker thread.
+            priority: Priority class of the task.
+            owner: Usually the node id, to cancel its work when the node is closed.
+            session: Session of the task (defaults to the session of the calling thread).
+
+        Returns:
+            Future of the result of ``fn``.
+        """
+        future = Future()
+        self._queue(_Task(fn, Priority(priority), owner, self._session(session), future))
+        return future
+
+    def submit_steps(self, steps: Iterator, priority: Priority = Priority.PRERENDER,
+                     owner: Hashable = None, session: Hashable = None) -> Future:
+        """
+        Queue a long job as a generator; each ``next()`` runs as a separate task.
+
+        Args:
+            steps: Generator doing one bounded piece of work per step.
+            priority: Priority class of every step.
+            owner: Usually the node id, to cancel the job when the node is closed.
+            session: Session of the job (defaults to the session of the calling thread).
+
+        Returns:
+            Future resolved (with the generator's return value) once it is exhausted,
+            or cancelled with the job.
+        """
+        done = Future()
+        priority, session = Priority(priority), self._session(session)
+
+        def step():
+            if done.cancelled():
+                steps.close()
+                self._finish(done)
+                return
+            try:
+                next(steps)
+            except StopIteration as stop:
+                self._finish(done, result=stop.value)
+                return
+            except BaseException as e:
+                self._finish(done, error=e)
+                raise
+            self._queue(_Task(step, priority, owner, session, Future()))
+
+        with self._cond:
+            self._chains[done] = (owner, session)
+        self._queue(_Task(step, priority, owner, session, Future()))
+        return done
+
+    def _finish(self, done: Future, result=None, error=None) -> None:
+        with self._cond:
+            self._chains.pop(done, None)
+        try:
+            if error is not None:
+                done.set_exception(error)
+            else:
+                done.set_result(result)
+        except InvalidStateError:
+            pass  # cancelled meanwhile
+
+    @staticmethod
+    def _session(session):
+        return session if session is not None else current_session()
+
+    def _queue(self, task: _Task) -> None:
+        with self._cond:
+            self._queues[task.priority].setdefault(task.session, deque()).append(task)
+            self._cond.notify()
+
+    def cancel(self, owner: Hashable) -> int:
+        """Cancel the queued tasks and step jobs of ``owner`` (running steps finish). Returns the count."""
+        return self._cancel(lambda task_owner, session: task_owner == owner)
+
+    def cancel_session(self, session: Hashable) -> int:
+        """Cancel every queued task and step job of a session (e.g. when it is closed)."""
+        return self._cancel(lambda owner, task_session: task_session == session)
+
+    def _cancel(self, match) -> int:
+        cancelled = 0
+        with self._cond:
+            for sessions in self._queues.values():
+                for session, tasks in list(sessions.items()):
+                    keep = deque()
+                    for task in tasks:
+                        if match(task.owner, task.session):
+                            cancelled += task.future.cancel()
+                        else:
+                            keep.append(task)
+                    if keep:
+                        sessions[session] = keep
+                    else:
+                        del sessions[session]
+            for done, (owner, session) in list(self._chains.items()):
+                if match(owner, session):
+                    del self._chains[done]
+                    cancelled += done.cancel()
+        return cancelled
+
+    @contextmanager
+    def visible(self):
+        """Marks a render of a visible figure: PRERENDER and STATS tasks wait until it ends."""
+        with self._cond:
+            self._visible += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._visible -= 1
+                self._cond.notify_all()
+
+    def _next_task(self) -> Optional[_Task]:
+        """Highest priority queued task, taking sessions in turn (call with the lock held)."""
+        for priority, sessions in self._queues.items():
+            if priority >= Priority.PRERENDER and self._visible:
+                return None
+            while sessions:
+                session, tasks = next(iter(sessions.items()))
+                task = tasks.popleft()
+                if tasks:
+                    sessions.move_to_end(session)
+                else:
+                    del sessions[session]
+                if task.future.set_running_or_notify_cancel():
+                    return task
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+                self._running += 1
+            try:
+                result = task.fn()
+            except BaseException as e:
+                logger.warning(f"Background task of {task.owner} failed: {e}")
+                task.future.set_exception(e)
+            else:
+                task.future.set_result(result)
+            finally:
+                with self._cond:
+                    self._running -= 1
+
+    def stats(self) -> dict:
+        """Queued tasks per priority class and running tasks."""
+        with self._cond:
+            queued = {p.name: sum(len(t) for t in sessions.values()) for p, sessions in self._queues.items()}
+            return {"queued": queued, "running": self._running, "jobs": len(self._chains),
+                    "workers": self.max_workers}
+
+
+_scheduler: Optional[RenderScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(max_workers: Optional[int] = None) -> RenderScheduler:
+    """
+    Return the process-wide scheduler, creating it on first use.
+
+    Args:
+        max_workers: Worker threads used when the scheduler is created.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RenderScheduler(max_workers or DEFAULT_BACKGROUND_WORKERS)
+            logger.info(f"Created background scheduler ({_scheduler.max_workers} workers)")
+        return _scheduler
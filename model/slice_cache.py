@@ -0,0 +1,251 @@
+"""
+Bounded LRU cache of 2D slices read from the dataset.
+
+One cache exists per dataset (path + regex) and is shared by every node and
+every session that plots variables from those files, so flipping back and forth
+between slices that were already on screen costs no I/O.
+
+Entries are keyed by ``(variable, time_idx, depth_idx)`` plus the index window
+that was read (``None`` for the full lat/lon slice). A lookup for a window is
+also served from any cached window of the same slice that covers it.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Hashable, Optional
+
+import numpy as np
+from loguru import logger
+
+DEFAULT_SLICE_CACHE_MB = 512
+
+# (y0, y1, x0, x1) in index space of the full slice, or None for the full slice
+WindowKey = Optional[tuple[int, int, int, int]]
+
+
+def window_key(window: Optional[tuple[slice, slice]]) -> WindowKey:
+    """
+    Convert a (lat_slice, lon_slice) window into a hashable cache key.
+
+    Args:
+        window: Tuple of index slices as returned by ``compute_index_window``, or None.
+
+    Returns:
+        Tuple (y0, y1, x0, x1) or None for the full slice.
+    """
+    if window is None:
+        return None
+    lat_sl, lon_sl = window
+    return (int(lat_sl.start), int(lat_sl.stop), int(lon_sl.start), int(lon_sl.stop))
+
+
+class SliceCache:
+    """Thread-safe LRU cache of numpy slices with a memory budget."""
+
+    def __init__(self, max_bytes: int = DEFAULT_SLICE_CACHE_MB * 1024 ** 2):
+        """
+        Args:
+            max_bytes: Memory budget. Least recently used slices are evicted above it.
+        """
+        self.max_bytes = int(max_bytes)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Lookups served by a load of the same key already in flight
+        self.coalesced = 0
+        self._entries: OrderedDict = OrderedDict()
+        # Cached windows per slice so covering windows can be found quickly
+        self._windows: dict[Hashable, set] = {}
+        # (slice_key, window) -> Future of the load in flight
+        self._loading: dict[tuple, Future] = {}
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------ lookup
+    def _lookup(self, slice_key: Hashable, window: WindowKey) -> Optional[np.ndarray]:
+        """Return the cached array for ``window`` (exact or cropped from a covering entry)."""
+        exact = self._entries.get((slice_key, window))
+        if exact is not None:
+            self._entries.move_to_end((slice_key, window))
+            return exact
+
+        for cached in self._windows.get(slice_key, ()):
+            if cached == window:
+                continue
+            arr = self._entries[(slice_key, cached)]
+            if cached is None:
+                if window is None:
+                    continue
+                y0, y1, x0, x1 = window
+            else:
+                if window is None:
+                    continue
+                cy0, cy1, cx0, cx1 = cached
+                if not (cy0 <= window[0] and window[1] <= cy1 and cx0 <= window[2] and window[3] <= cx1):
+                    continue
+                y0, y1 = window[0] - cy0, window[1] - cy0
+                x0, x1 = window[2] - cx0, window[3] - cx0
+            self._entries.move_to_end((slice_key, cached))
+            return arr[..., y0:y1, x0:x1]
+        return None
+
+    def get(self, slice_key: Hashable, window: WindowKey = None) -> Optional[np.ndarray]:
+        """
+        Look up a slice (or a window of it) without loading.
+
+        Args:
+            slice_key: Tuple (variable, time_idx, depth_idx).
+            window: Window key from ``window_key`` or None for the full slice.
+
+        Returns:
+            The cached array or None on a miss.
+        """
+        with self._lock:
+            arr = self._lookup(slice_key, window)
+            if arr is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return arr
+
+    def contains(self, slice_key: Hashable, window: WindowKey = None) -> bool:
+        """Return True if the slice/window can be served from memory (does not touch counters)."""
+        with self._lock:
+            return self._lookup(slice_key, window) is not None
+
+    def put(self, slice_key: Hashable, window: WindowKey, array: np.ndarray) -> None:
+        """
+        Store a slice, evicting least recently used entries to stay within budget.
+
+        Arrays larger than the whole budget are not cached.
+        """
+        array = np.asarray(array)
+        nbytes = array.nbytes
+        if nbytes > self.max_bytes:
+            return
+        array.setflags(write=False)
+        with self._lock:
+            key = (slice_key, window)
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = array
+            self._windows.setdefault(slice_key, set()).add(window)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes and self._entries:
+                self._evict_oldest()
+
+    def get_or_load(self, slice_key: Hashable, window: WindowKey,
+                    loader: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Return a cached slice or call ``loader`` and cache its result.
+
+        The loader runs outside the lock so slow reads never block other lookups.
+        Concurrent calls for the same slice and window (a prefetch and the render
+        it anticipated, two sessions) wait for the load in flight instead of
+        reading it again; they get its error if it fails.
+        """
+        key = (slice_key, window)
+        with self._lock:
+            arr = self._lookup(slice_key, window)
+            if arr is not None:
+                self.hits += 1
+                return arr
+            pending = self._loading.get(key)
+            if pending is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                self._loading[key] = loading = Future()
+        if pending is not None:
+            return pending.result()
+        try:
+            arr = np.asarray(loader())
+            self.put(slice_key, window, arr)
+        except BaseException as e:
+            loading.set_exception(e)
+            raise
+        else:
+            loading.set_result(arr)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        return arr
+
+    # -------------------------------------------------------------- eviction
+    def _evict_oldest(self) -> None:
+        (slice_key, window), arr = self._entries.popitem(last=False)
+        self._drop_window(slice_key, window)
+        self.current_bytes -= arr.nbytes
+        self.evictions += 1
+
+    def _drop_window(self, slice_key: Hashable, window: WindowKey) -> None:
+        windows = self._windows.get(slice_key)
+        if windows is not None:
+            windows.discard(window)
+            if not windows:
+                del self._windows[slice_key]
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Drop every entry whose slice key matches ``predicate``.
+
+        Args:
+            predicate: Called with each (variable, time_idx, depth_idx) key.
+
+        Returns:
+            Number of entries removed.
+        """
+        with self._lock:
+            stale = [k for k in self._entries if predicate(k[0])]
+            for slice_key, window in stale:
+                self.current_bytes -= self._entries.pop((slice_key, window)).nbytes
+                self._drop_window(slice_key, window)
+            return len(stale)
+
+    def clear(self) -> None:
+        """Remove all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._windows.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and memory usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_caches: dict[str, SliceCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_slice_cache(dataset_key: str, max_mb: Optional[float] = None) -> SliceCache:
+    """
+    Return the process-wide slice cache for a dataset, creating it if needed.
+
+    Args:
+        dataset_key: Identifies the dataset (e.g. path + regex). Sessions on the
+            same files share one cache.
+        max_mb: Memory budget in MB used when the cache is created.
+
+    Returns:
+        The shared SliceCache.
+    """
+    with _caches_lock:
+        cache = _caches.get(dataset_key)
+        if cache is None:
+            budget = DEFAULT_SLICE_CACHE_MB if max_mb is None else max_mb
+            cache = SliceCache(int(budget * 1024 ** 2))
+            _caches[dataset_key] = cache
+            logger.info(f"Created slice cache for {dataset_key} ({budget} MB)")
+        return cache
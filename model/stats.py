@@ -0,0 +1,237 @@
+"""
+Streaming statistics used to pick color limits without reading whole variables.
+
+``QuantileSketch`` is a fixed-size histogram whose range doubles (by merging
+adjacent bins) whenever new values fall outside it, so it can be fed chunk by
+chunk without knowing the data range in advance. Quantile error is bounded by
+the bin width.
+"""
+from __future__ import annotations
+
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Generator, Hashable, Optional, Sequence
+
+import numpy as np
+import xarray as xr
+from loguru import logger
+
+from model.scheduler import Priority, get_scheduler
+
+DEFAULT_QUANTILES = (0.02, 0.98)
+
+
+class QuantileSketch:
+    """Approximate quantiles over a stream of values with constant memory."""
+
+    def __init__(self, n_bins: int = 2048):
+        """
+        Args:
+            n_bins: Number of histogram bins (must be even).
+        """
+        if n_bins % 2:
+            raise ValueError("n_bins must be even")
+        self.n_bins = n_bins
+        self.counts = np.zeros(n_bins, dtype=np.float64)
+        self.lo: Optional[float] = None
+        self.width: Optional[float] = None
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values, weights=None) -> None:
+        """
+        Add values (NaNs and infs are ignored).
+
+        Args:
+            values: Array-like of values.
+            weights: Optional per-value weights (same shape as values).
+        """
+        v = np.asarray(values, dtype=np.float64).ravel()
+        w = None if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+        finite = np.isfinite(v)
+        if not finite.all():
+            v = v[finite]
+            w = None if w is None else w[finite]
+        if v.size == 0:
+            return
+
+        vmin, vmax = float(v.min()), float(v.max())
+        if self.lo is None:
+            span = vmax - vmin
+            if span <= 0:
+                span = abs(vmin) * 1e-6 or 1e-6
+            self.lo = vmin
+            # Small pad so vmax falls inside the last bin
+            self.width = span * (1 + 1e-9) / self.n_bins
+        self._grow(vmin, vmax)
+
+        idx = np.clip(((v - self.lo) / self.width).astype(np.int64), 0, self.n_bins - 1)
+        self.counts += np.bincount(idx, weights=w, minlength=self.n_bins)
+        self.count += float(v.size if w is None else w.sum())
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+
+    def _grow(self, vmin: float, vmax: float) -> None:
+        """Double the covered range (merging bin pairs) until [vmin, vmax] fits."""
+        half = self.n_bins // 2
+        while vmin < self.lo or vmax >= self.lo + self.width * self.n_bins:
+            merged = self.counts.reshape(half, 2).sum(axis=1)
+            self.width *= 2
+            if vmin < self.lo:
+                self.counts = np.concatenate([np.zeros(half), merged])
+                self.lo -= half * self.width
+            else:
+                self.counts = np.concatenate([merged, np.zeros(half)])
+
+    def quantiles(self, qs: Sequence[float]) -> Optional[list[float]]:
+        """
+        Return approximate quantiles (linear interpolation inside bins).
+
+        Args:
+            qs: Quantiles in [0, 1].
+
+        Returns:
+            List of values, or None if no value was added yet.
+        """
+        if self.count <= 0:
+            return None
+        cum = np.cumsum(self.counts)
+        out = []
+        for q in qs:
+            target = q * cum[-1]
+            i = int(np.searchsorted(cum, target, side='left'))
+            i = min(i, self.n_bins - 1)
+            before = cum[i - 1] if i > 0 else 0.0
+            frac = (target - before) / self.counts[i] if self.counts[i] > 0 else 0.0
+            val = self.lo + (i + frac) * self.width
+            out.append(float(min(max(val, self.min), self.max)))
+        return out
+
+
+def leading_units(data: xr.DataArray) -> list[dict]:
+    """All index combinations over the non-spatial (leading) dims of ``data``."""
+    lead_dims = data.dims[:-2]
+    ranges = [range(data.sizes[d]) for d in lead_dims]
+    return [dict(zip(lead_dims, idx)) for idx in itertools.product(*ranges)]
+
+
+def strided_values(data: xr.DataArray, per_slice: int) -> np.ndarray:
+    """Read a 2D (or smaller) field with a spatial stride giving about ``per_slice`` values."""
+    if data.ndim < 2:
+        return np.asarray(data.values)
+    ny, nx = data.shape[-2], data.shape[-1]
+    stride = max(1, int(math.ceil(math.sqrt(ny * nx / max(per_slice, 1)))))
+    sub = data.isel({data.dims[-2]: slice(None, None, stride), data.dims[-1]: slice(None, None, stride)})
+    return np.asarray(sub.values)
+
+
+def sample_quantiles(data: xr.DataArray, quantiles: Sequence[float] = DEFAULT_QUANTILES,
+                     max_samples: int = 250_000) -> Optional[list[float]]:
+    """
+    Quick quantile estimate from the first 2D slice of ``data`` (strided).
+
+    Used for the provisional color range shown while the full sketch runs.
+
+    Args:
+        data: DataArray with spatial dims last.
+        quantiles: Quantiles to compute.
+        max_samples: Approximate number of values read.
+
+    Returns:
+        List of quantile values or None if the slice is all NaN.
+    """
+    units = leading_units(data) if data.ndim > 2 else [{}]
+    first = data.isel(units[0]) if units[0] else data
+    sketch = QuantileSketch()
+    sketch.update(strided_values(first, max_samples))
+    return sketch.quantiles(quantiles)
+
+
+def quantile_steps(data: xr.DataArray, quantiles: Sequence[float] = DEFAULT_QUANTILES,
+                   time_limit: float = 10.0, sample_budget: int = 2_000_000,
+                   slices_per_step: int = 4,
+                   on_update: Optional[Callable[[list[float], float], None]] = None,
+                   stop_event: Optional[threading.Event] = None,
+                   sketch: Optional[QuantileSketch] = None) -> Generator[None, None, Optional[list[float]]]:
+    """
+    Streaming quantile estimate over a whole variable, as scheduler steps (see ``estimate_quantiles``).
+
+    2D slices are visited in a shuffled order (so early estimates already span
+    the whole time/depth range) and read with a spatial stride so the total
+    number of values stays within ``sample_budget``. The generator yields after
+    every ``slices_per_step`` slices and returns the final quantile values.
+
+    Args:
+        data: DataArray with spatial dims last.
+        quantiles: Quantiles to estimate.
+        time_limit: Seconds after which the estimate is returned as is.
+        sample_budget: Approximate maximum number of values read.
+        slices_per_step: Slices read per step.
+        on_update: Called with (quantile values, fraction of slices visited) as
+            the estimate converges (at most twice per second, plus once at the end).
+        stop_event: Set it to abandon the estimate early (e.g. figure closed).
+        sketch: Optional sketch to fill (lets callers keep min/max/count).
+    """
+    sketch = sketch if sketch is not None else QuantileSketch()
+    units = leading_units(data) if data.ndim > 2 else [{}]
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(units))
+    per_slice = max(sample_budget // min(len(units), 256), 1024)
+
+    start = time.monotonic()
+    last_update = 0.0
+    samples = 0
+    done = 0
+
+    def should_stop() -> bool:
+        return ((stop_event is not None and stop_event.is_set())
+                or time.monotonic() - start > time_limit
+                or samples >= sample_budget)
+
+    for first in range(0, len(order), max(slices_per_step, 1)):
+        if should_stop():
+            break
+        for i in order[first:first + max(slices_per_step, 1)]:
+            unit = units[int(i)]
+            try:
+                values = strided_values(data.isel(unit) if unit else data, per_slice)
+            except Exception as e:
+                logger.warning(f"Quantile sketch: failed to read a slice: {e}")
+                continue
+            sketch.update(values)
+            samples += values.size
+            done += 1
+        now = time.monotonic()
+        if on_update is not None and now - last_update >= 0.5:
+            q = sketch.quantiles(quantiles)
+            if q is not None:
+                on_update(q, done / len(units))
+            last_update = now
+        yield
+
+    result = sketch.quantiles(quantiles)
+    logger.info(f"Quantile sketch: {done}/{len(units)} slices, {samples} samples "
+                f"in {time.monotonic() - start:.1f}s -> {result}")
+    if on_update is not None and result is not None and not (stop_event is not None and stop_event.is_set()):
+        on_update(result, done / len(units))
+    return result
+
+
+def estimate_quantiles(data: xr.DataArray, quantiles: Sequence[float] = DEFAULT_QUANTILES,
+                       priority: Priority = Priority.STATS, owner: Hashable = None,
+                       **kwargs) -> Future:
+    """
+    Queue a streaming quantile estimate of ``data`` on the render scheduler.
+
+    The slices are read in steps (see ``quantile_steps``, which takes the other
+    keyword arguments), so the estimate yields to visible renders and is cancelled
+    with ``owner``.
+
+    Returns:
+        Future of the final quantile values (None if no finite value was found).
+    """
+    return get_scheduler().submit_steps(quantile_steps(data, quantiles, **kwargs), priority, owner=owner)
@@ -0,0 +1,302 @@
+"""
+Persistent per-variable statistics (quantiles, min/max, valid fraction).
+
+Statistics are computed once per dataset by a background job (lowest priority of
+the scheduler) started at server startup and written to a JSON sidecar next to
+the data (or in ``~/.cache/ncdashboard`` when that folder is read-only). The
+sidecar is keyed by the dataset fingerprint (file paths, sizes and mtimes), so a
+restart on the same files reads them back instantly and any change to the files
+triggers a recompute.
+
+Values are estimated from a strided sample of every time step (see
+``samples_per_step``), so min/max are those of the sampled values.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Generator, Optional
+
+import numpy as np
+import xarray as xr
+from loguru import logger
+
+from model.scheduler import SHARED_SESSION, Priority, get_scheduler
+from model.data_loader import CACHE_DIR, PathLike, dataset_directory, dataset_fingerprint, resolve_files
+from model.stats import DEFAULT_QUANTILES, QuantileSketch, leading_units, strided_values
+
+STATS_VERSION = 1
+DEFAULT_SAMPLES_PER_STEP = 20_000
+# Time steps of a variable read per scheduler step of the background job
+TIME_STEPS_PER_YIELD = 4
+
+
+def _clean(value) -> Optional[float]:
+    """JSON-safe float (NaN/inf become None)."""
+    if value is None:
+        return None
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def compute_variable_stats(data: xr.DataArray, quantiles=DEFAULT_QUANTILES,
+                           samples_per_step: int = DEFAULT_SAMPLES_PER_STEP,
+                           stop_event: Optional[threading.Event] = None) -> Optional[dict]:
+    """
+    Compute global and per-time-step statistics of one variable.
+
+    Args:
+        data: DataArray with spatial dims last (2D, 3D or 4D).
+        quantiles: Quantile levels to compute.
+        samples_per_step: Approximate number of values read per time step.
+        stop_event: Set it to abandon the computation (returns None).
+
+    Returns:
+        Dict with 'quantile_levels', 'quantiles', 'min', 'max', 'valid_fraction'
+        and, for variables with a leading (time) dim, a 'steps' dict with the
+        same statistics as lists (one entry per index of that dim).
+    """
+    steps = variable_stats_steps(data, quantiles, samples_per_step, stop_event)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+
+def variable_stats_steps(data: xr.DataArray, quantiles=DEFAULT_QUANTILES,
+                         samples_per_step: int = DEFAULT_SAMPLES_PER_STEP,
+                         stop_event: Optional[threading.Event] = None,
+                         time_steps_per_yield: int = TIME_STEPS_PER_YIELD) -> Generator[None, None, Optional[dict]]:
+    """
+    ``compute_variable_stats`` as a generator yielding after every ``time_steps_per_yield``
+    time steps, so a scheduler job can run more urgent work in between. Returns the statistics.
+    """
+    step_dim = data.dims[0] if data.ndim > 2 else None
+    n_steps = data.sizes[step_dim] if step_dim else 1
+    total = QuantileSketch()
+    total_sampled = 0
+    steps = {'dim': step_dim, 'quantiles': [], 'min': [], 'max': [], 'valid_fraction': []}
+
+    for t in range(n_steps):
+        if stop_event is not None and stop_event.is_set():
+            return None
+        step = data.isel({step_dim: t}) if step_dim else data
+        units = leading_units(step) if step.ndim > 2 else [{}]
+        per_plane = max(samples_per_step // len(units), 256)
+        sketch = QuantileSketch()
+        sampled = 0
+        for unit in units:
+            values = strided_values(step.isel(unit) if unit else step, per_plane)
+            sketch.update(values)
+            total.update(values)
+            sampled += values.size
+        total_sampled += sampled
+
+        q = sketch.quantiles(quantiles)
+        steps['quantiles'].append([_clean(v) for v in q] if q is not None else None)
+        steps['min'].append(_clean(sketch.min) if sketch.count else None)
+        steps['max'].append(_clean(sketch.max) if sketch.count else None)
+        steps['valid_fraction'].append(round(sketch.count / sampled, 4) if sampled else 0.0)
+        if (t + 1) % max(time_steps_per_yield, 1) == 0 and t + 1 < n_steps:
+            yield
+
+    q = total.quantiles(quantiles)
+    stats = {
+        'quantile_levels': list(quantiles),
+        'quantiles': [_clean(v) for v in q] if q is not None else None,
+        'min': _clean(total.min) if total.count else None,
+        'max': _clean(total.max) if total.count else None,
+        'valid_fraction': round(total.count / total_sampled, 4) if total_sampled else 0.0,
+    }
+    if step_dim:
+        stats['steps'] = steps
+    return stats
+
+
+class StatsStore:
+    """In-memory view of the statistics sidecar of one dataset."""
+
+    def __init__(self, path: PathLike, regex: str = ''):
+        """
+        Args:
+            path: Dataset path (directory, file or list of files).
+            regex: File pattern when path is a directory.
+        """
+        self.path = path
+        self.regex = regex
+        self.files = resolve_files(path, regex)
+        self.fingerprint = dataset_fingerprint(self.files)
+        self.sidecar_path = self._sidecar_path(path)
+        self._variables: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # Background computation on the scheduler, and the lock held while a step of it runs
+        self._job: Optional[Future] = None
+        self._step_lock = threading.Lock()
+        # Bumped by refresh, so steps of a job started before it stop
+        self._generation = 0
+        self.stop_event = threading.Event()
+        self.load()
+
+    def _sidecar_path(self, path: PathLike) -> str:
+        # Named after the file list (not mtimes) so a dataset keeps a single sidecar
+        name_hash = hashlib.sha1('\n'.join(self.files).encode()).hexdigest()[:12]
+        filename = f".ncdashboard_stats_{name_hash}.json"
+        directory = dataset_directory(self.files, path)
+        if not os.access(directory, os.W_OK):
+            directory = CACHE_DIR
+        return os.path.join(directory, filename)
+
+    def load(self) -> bool:
+        """Read the sidecar if it exists and matches the current files. Returns True on success."""
+        candidates = [self.sidecar_path, os.path.join(CACHE_DIR, os.path.basename(self.sidecar_path))]
+        for candidate in candidates:
+            if not os.path.exists(candidate):
+                continue
+            try:
+                with open(candidate, 'r') as f:
+                    content = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable stats sidecar {candidate}: {e}")
+                continue
+            if content.get('version') != STATS_VERSION or content.get('fingerprint') != self.fingerprint:
+                logger.info(f"Stats sidecar {candidate} is outdated, statistics will be recomputed")
+                continue
+            with self._lock:
+                self._variables = content.get('variables', {})
+            logger.info(f"Loaded statistics for {len(self._variables)} variables from {candidate}")
+            return True
+        return False
+
+    def save(self) -> None:
+        """Write the sidecar atomically (falls back to the user cache folder)."""
+        with self._lock:
+            content = {'version': STATS_VERSION, 'fingerprint': self.fingerprint,
+                       'files': len(self.files), 'variables': dict(self._variables)}
+        for directory in (os.path.dirname(self.sidecar_path), CACHE_DIR):
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(content, f)
+                target = os.path.join(directory, os.path.basename(self.sidecar_path))
+                os.replace(tmp, target)
+                self.sidecar_path = target
+                return
+            except OSError as e:
+                logger.warning(f"Could not write stats sidecar in {directory}: {e}")
+
+    def get(self, var_name: str) -> Optional[dict]:
+        """Statistics of ``var_name`` or None if not computed yet."""
+        return self._variables.get(var_name)
+
+    def all(self) -> dict:
+        """Statistics of every computed variable, by name."""
+        with self._lock:
+            return dict(self._variables)
+
+    def put(self, var_name: str, stats: dict) -> None:
+        """Store the statistics of ``var_name`` (call ``save`` to persist them)."""
+        with self._lock:
+            self._variables[var_name] = stats
+
+    def compute_missing(self, data: xr.Dataset, samples_per_step: int = DEFAULT_SAMPLES_PER_STEP) -> None:
+        """
+        Compute (and save after each variable) the statistics not in the sidecar yet.
+
+        Args:
+            data: The opened dataset.
+            samples_per_step: Approximate number of values read per time step.
+        """
+        for _ in self._compute_steps(data, samples_per_step):
+            pass
+
+    def _compute_steps(self, data: xr.Dataset, samples_per_step: int):
+        """
+        ``compute_missing`` as a generator (see ``start_background``), yielding after every
+        few time steps of a variable (see ``variable_stats_steps``).
+        """
+        start = time.monotonic()
+        generation = self._generation
+        todo = [v for v, da in data.data_vars.items()
+                if da.ndim >= 2 and np.issubdtype(da.dtype, np.number) and self.get(v) is None]
+        for var in todo:
+            steps = variable_stats_steps(data[var], samples_per_step=samples_per_step, stop_event=self.stop_event)
+            while True:
+                with self._step_lock:
+                    if self.stop_event.is_set() or generation != self._generation:
+                        steps.close()
+                        return
+                    try:
+                        next(steps)
+                    except StopIteration as done:
+                        stats = done.value
+                        if stats is None:
+                            return
+                        self.put(var, stats)
+                        self.save()
+                        logger.debug(f"Statistics for {var}: {stats['quantiles']} "
+                                     f"(valid {stats['valid_fraction']:.0%})")
+                        break
+                    except Exception as e:
+                        logger.warning(f"Failed to compute statistics for {var}: {e}")
+                        break
+                yield var
+            yield var
+        if todo:
+            logger.info(f"Computed statistics for {len(todo)} variables in {time.monotonic() - start:.1f}s "
+                        f"-> {self.sidecar_path}")
+
+    def start_background(self, data: xr.Dataset, samples_per_step: int = DEFAULT_SAMPLES_PER_STEP) -> None:
+        """Run ``compute_missing`` on the scheduler, at the lowest priority (no-op if already running)."""
+        if self._job is not None and not self._job.done():
+            return
+        self._job = get_scheduler().submit_steps(self._compute_steps(data, samples_per_step), Priority.STATS,
+                                                 owner=self.sidecar_path, session=SHARED_SESSION)
+
+    def refresh(self, data: xr.Dataset, samples_per_step: int = DEFAULT_SAMPLES_PER_STEP) -> None:
+        """
+        Drop the statistics after files were added or rewritten and recompute them in the background.
+
+        Args:
+            data: The reopened dataset.
+            samples_per_step: Approximate number of values read per time step.
+        """
+        self.stop_event.set()
+        if self._job is not None:
+            self._job.cancel()
+        # Wait for the step being computed, if any
+        with self._step_lock:
+            self._generation += 1
+            self.stop_event.clear()
+        self.files = resolve_files(self.path, self.regex)
+        self.fingerprint = dataset_fingerprint(self.files)
+        with self._lock:
+            self._variables = {}
+        self.start_background(data, samples_per_step)
+
+
+_stores: dict[str, StatsStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_stats_store(path: PathLike, regex: str = '') -> StatsStore:
+    """
+    Return the process-wide statistics store of a dataset, creating (and loading) it if needed.
+
+    Args:
+        path: Dataset path (directory, file or list of files).
+        regex: File pattern when path is a directory.
+    """
+    key = f"{path}|{regex}"
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = StatsStore(path, regex)
+            _stores[key] = store
+        return store
@@ -0,0 +1,108 @@
+"""
+Server-side throttling of viewport (``RangeXY``) events.
+
+Every pan or wheel-zoom step of a Bokeh plot updates its ``RangeXY`` stream. Maps do
+not re-render on each of them: they render from a ``Viewport`` stream fed by a
+``ViewportThrottle``, which
+
+* quantizes the ranges outwards to a grid that follows the zoom level, so small pans
+  map to the same window (and slice cache key) and are dropped when nothing changed;
+* within a server session, forwards at most one event every ``interval_ms``, on the
+  trailing edge, so the last ranges of a drag are always rendered.
+
+Outside a session (tests, exports) events are forwarded at once.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from typing import Optional
+
+import holoviews as hv
+import panel as pn
+import param
+
+DEFAULT_THROTTLE_MS = 150
+# Grid cells per visible range used to quantize the ranges (0 = no quantization)
+DEFAULT_QUANTIZE_STEPS = 256
+
+
+class Viewport(hv.streams.Stream):
+    """Throttled, quantized x/y ranges of a plot (see ``ViewportThrottle``)."""
+
+    x_range = param.Tuple(default=None, length=2, allow_None=True, constant=True)
+    y_range = param.Tuple(default=None, length=2, allow_None=True, constant=True)
+
+
+def quantize_range(bounds: Optional[tuple], steps: int = DEFAULT_QUANTIZE_STEPS) -> Optional[tuple]:
+    """
+    Snap a range outwards to a power-of-two grid of at least ``steps`` cells per range.
+
+    Args:
+        bounds: (low, high) range, or None.
+        steps: Minimum number of grid cells in the range (0 = unchanged).
+
+    Returns:
+        The quantized (low, high), or ``bounds`` unchanged when it is None, empty or not numeric.
+    """
+    if bounds is None or not steps:
+        return bounds
+    try:
+        lo, hi = float(bounds[0]), float(bounds[1])
+    except (TypeError, ValueError):
+        return bounds
+    span = hi - lo
+    if not (math.isfinite(lo) and math.isfinite(hi)) or span <= 0:
+        return bounds
+    step = 2.0 ** math.floor(math.log2(span / steps))
+    return (math.floor(lo / step) * step, math.ceil(hi / step) * step)
+
+
+class ViewportThrottle:
+    """Forwards the ranges of a ``RangeXY`` stream to a ``Viewport`` stream, quantized and throttled."""
+
+    def __init__(self, source: hv.streams.RangeXY, target: Viewport,
+                 interval_ms: float = DEFAULT_THROTTLE_MS, steps: int = DEFAULT_QUANTIZE_STEPS):
+        """
+        Args:
+            source: Stream updated by the plot on every pan/zoom step.
+            target: Stream the renderers depend on.
+            interval_ms: Minimum delay between two forwarded events (0 = no throttling).
+            steps: Quantization grid cells per visible range (see ``quantize_range``).
+        """
+        self.source = source
+        self.target = target
+        self.interval_ms = interval_ms
+        self.steps = steps
+        self.received = 0
+        self.forwarded = 0
+        self._latest = None
+        self._pending = False
+        self._lock = threading.Lock()
+        source.add_subscriber(self._on_range)
+
+    def _on_range(self, x_range=None, y_range=None, **kwargs):
+        view = (quantize_range(x_range, self.steps), quantize_range(y_range, self.steps))
+        self.received += 1
+        doc = pn.state.curdoc
+        if not self.interval_ms or doc is None or doc.session_context is None:
+            self._forward(view)
+            return
+        with self._lock:
+            self._latest = view
+            if self._pending:
+                return
+            self._pending = True
+        doc.add_timeout_callback(self._flush, self.interval_ms)
+
+    def _flush(self):
+        with self._lock:
+            view, self._latest, self._pending = self._latest, None, False
+        if view is not None:
+            self._forward(view)
+
+    def _forward(self, view):
+        if view == (self.target.x_range, self.target.y_range):
+            return
+        self.forwarded += 1
+        self.target.event(x_range=view[0], y_range=view[1])
@@ -0,0 +1,188 @@
+"""
+Viewport helpers: translate the plot's visible x/y ranges (from ``RangeXY``)
+into integer index windows over the lat/lon axes of a field, so that
+renderers only read the part of a slice that is actually on screen.
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+
+# Half the width of the Web Mercator world in meters
+MERCATOR_EXTENT = 20037508.34
+
+
+def mercator_to_lonlat(x: float, y: float) -> tuple[float, float]:
+    """
+    Convert Web Mercator x/y (meters) to lon/lat (degrees).
+
+    Args:
+        x: Easting in meters.
+        y: Northing in meters.
+
+    Returns:
+        Tuple (lon, lat) in degrees.
+    """
+    lon = x * 180.0 / MERCATOR_EXTENT
+    lat = math.degrees(2 * math.atan(math.exp(y * math.pi / MERCATOR_EXTENT)) - math.pi / 2)
+    return lon, lat
+
+
+def point_to_lonlat(x: float, y: float) -> tuple[float, float]:
+    """
+    Normalize a clicked point to lon/lat, with the same heuristic as ``ranges_to_lonlat``
+    (taps on elements drawn in Web Mercator come in meters).
+
+    Returns:
+        Tuple (lon, lat) in degrees.
+    """
+    if abs(x) > 500 or abs(y) > 90:
+        return mercator_to_lonlat(x, y)
+    return x, y
+
+
+def ranges_to_lonlat(x_range: Optional[Sequence[float]],
+                     y_range: Optional[Sequence[float]]) -> Optional[tuple[float, float, float, float]]:
+    """
+    Normalize viewport ranges to a lon/lat bounding box.
+
+    Ranges coming from plots over map tiles are in Web Mercator meters, while
+    ranges restored from older states may already be in degrees. We use the same
+    heuristic as ``AnimationNode._crop_data`` to tell them apart.
+
+    Args:
+        x_range: (x0, x1) viewport range or None.
+        y_range: (y0, y1) viewport range or None.
+
+    Returns:
+        (min_lon, max_lon, min_lat, max_lat) or None if the ranges are unknown.
+    """
+    if x_range is None or y_range is None:
+        return None
+    try:
+        x0, x1 = float(x_range[0]), float(x_range[1])
+        y0, y1 = float(y_range[0]), float(y_range[1])
+    except (TypeError, ValueError, IndexError):
+        return None
+    if not all(np.isfinite([x0, x1, y0, y1])):
+        return None
+
+    if max(abs(x0), abs(x1)) > 500 or max(abs(y0), abs(y1)) > 90:
+        lon0, lat0 = mercator_to_lonlat(x0, y0)
+        lon1, lat1 = mercator_to_lonlat(x1, y1)
+    else:
+        lon0, lat0, lon1, lat1 = x0, y0, x1, y1
+
+    min_lon, max_lon = sorted([lon0, lon1])
+    min_lat, max_lat = sorted([lat0, lat1])
+    return min_lon, max_lon, min_lat, max_lat
+
+
+def _match_lon_convention(lon_vals: np.ndarray, min_lon: float, max_lon: float) -> tuple[float, float]:
+    """Shift a -180..180 viewport into 0..360 when the data uses that convention."""
+    finite = lon_vals[np.isfinite(lon_vals)]
+    if finite.size and finite.min() >= 0 and finite.max() > 180 and min_lon < 0:
+        return min_lon + 360, max_lon + 360
+    return min_lon, max_lon
+
+
+def _axis_window(vals: np.ndarray, lo: float, hi: float, min_size: int = 2,
+                 order: Optional[int] = None) -> slice:
+    """
+    Index window over a 1D coordinate covering the values in [lo, hi].
+
+    Monotonic coordinates (ascending or descending) are resolved with a binary
+    search; anything else falls back to a mask. One extra cell is kept on each
+    side so the rasterized image has no gaps at the edges. ``order`` (+1, -1 or 0,
+    see model/coord_roles.py) skips checking the monotonicity again.
+    """
+    n = vals.size
+    if n <= min_size:
+        return slice(0, n)
+
+    if order is None:
+        diffs = np.diff(vals)
+        order = 1 if np.all(diffs > 0) else (-1 if np.all(diffs < 0) else 0)
+    if order > 0:
+        i0 = int(np.searchsorted(vals, lo, side='left')) - 1
+        i1 = int(np.searchsorted(vals, hi, side='right')) + 1
+    elif order < 0:
+        rev = vals[::-1]
+        j0 = int(np.searchsorted(rev, lo, side='left')) - 1
+        j1 = int(np.searchsorted(rev, hi, side='right')) + 1
+        i0, i1 = n - j1, n - j0
+    else:
+        idx = np.nonzero((vals >= lo) & (vals <= hi))[0]
+        if idx.size == 0:
+            i0 = i1 = int(np.nanargmin(np.abs(vals - (lo + hi) / 2)))
+        else:
+            i0, i1 = int(idx[0]) - 1, int(idx[-1]) + 2
+
+    return _clamp_window(i0, i1, n, min_size)
+
+
+def _clamp_window(i0: int, i1: int, n: int, min_size: int) -> slice:
+    """Clamp [i0, i1) to [0, n) keeping at least ``min_size`` cells."""
+    i0 = max(0, min(i0, n))
+    i1 = max(0, min(i1, n))
+    if i1 - i0 < min_size:
+        center = min(max(i0, 0), n - 1)
+        i0 = max(0, min(center - min_size // 2, n - min_size))
+        i1 = i0 + min_size
+    return slice(i0, i1)
+
+
+def compute_index_window(lats: np.ndarray, lons: np.ndarray,
+                         x_range: Optional[Sequence[float]], y_range: Optional[Sequence[float]],
+                         margin: float = 0.2,
+                         orders: Optional[tuple[int, int]] = None) -> Optional[tuple[slice, slice]]:
+    """
+    Compute the (lat, lon) index window that covers the viewport plus a margin.
+
+    Works for regular grids (1D lat/lon) and curvilinear grids (2D lat/lon with
+    dims [y, x]). For curvilinear grids the window is the index bounding box of
+    every cell that falls inside the padded viewport.
+
+    Args:
+        lats: Latitude values, 1D or 2D.
+        lons: Longitude values, 1D or 2D.
+        x_range: Viewport x range (Web Mercator meters or degrees).
+        y_range: Viewport y range (Web Mercator meters or degrees).
+        margin: Fraction of the viewport size added on every side.
+        orders: Known (lat, lon) ordering of 1D coordinates (+1/-1/0), or None to check it.
+
+    Returns:
+        Tuple (lat_slice, lon_slice) of index slices over the last two dims,
+        or None when the viewport is unknown (read the full slice).
+    """
+    bbox = ranges_to_lonlat(x_range, y_range)
+    if bbox is None:
+        return None
+    min_lon, max_lon, min_lat, max_lat = bbox
+
+    lon_pad = (max_lon - min_lon) * margin
+    lat_pad = (max_lat - min_lat) * margin
+    min_lon, max_lon = _match_lon_convention(np.asarray(lons), min_lon - lon_pad, max_lon + lon_pad)
+    min_lat, max_lat = min_lat - lat_pad, max_lat + lat_pad
+
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
+
+    if lats.ndim == 1 and lons.ndim == 1:
+        lat_order, lon_order = orders if orders is not None else (None, None)
+        return (_axis_window(lats, min_lat, max_lat, order=lat_order),
+                _axis_window(lons, min_lon, max_lon, order=lon_order))
+
+    # Curvilinear grid: bounding box (in index space) of the cells inside the viewport
+    with np.errstate(invalid='ignore'):
+        mask = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+    ny, nx = mask.shape
+    rows = np.nonzero(mask.any(axis=1))[0]
+    cols = np.nonzero(mask.any(axis=0))[0]
+    if rows.size == 0 or cols.size == 0:
+        # Viewport outside the domain: read a tiny window instead of the whole grid
+        return slice(0, min(2, ny)), slice(0, min(2, nx))
+    return (_clamp_window(int(rows[0]) - 1, int(rows[-1]) + 2, ny, 2),
+            _clamp_window(int(cols[0]) - 1, int(cols[-1]) + 2, nx, 2))
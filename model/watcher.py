@@ -0,0 +1,200 @@
+"""
+Directory watcher: picks up files that arrive while the server is running.
+
+The watcher polls the dataset files (paths, sizes, mtimes). When they change
+it reopens the dataset (cheap thanks to the metadata index, only the new
+files are scanned) and notifies its subscribers with a ``DatasetUpdate``:
+the server refreshes the caches shared by every session and each dashboard
+swaps the new data into its open figures, so sessions survive the update.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import weakref
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import numpy as np
+import xarray as xr
+from loguru import logger
+
+from model.data_loader import PathLike, open_dataset, resolve_files
+
+DEFAULT_WATCH_INTERVAL = 60.0
+
+
+@dataclass
+class DatasetUpdate:
+    """What changed between two versions of the dataset."""
+    data: xr.Dataset
+    added_files: list = field(default_factory=list)
+    modified_files: list = field(default_factory=list)
+    removed_files: list = field(default_factory=list)
+    # Leading (time) dimension that grew, and its size before/after the update
+    step_dim: Optional[str] = None
+    old_steps: int = 0
+    new_steps: int = 0
+    # Indices along step_dim whose values may have changed (None = everything)
+    stale_steps: Optional[set] = field(default_factory=set)
+
+
+def _snapshot(files: list[str]) -> dict[str, tuple[int, int]]:
+    snapshot = {}
+    for f in files:
+        try:
+            st = os.stat(f)
+            snapshot[f] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            pass
+    return snapshot
+
+
+def _step_dim(old: xr.Dataset, new: xr.Dataset) -> Optional[str]:
+    """The dimension that grew between two versions of the dataset (if exactly one did)."""
+    grown = [d for d in new.dims if d in old.dims and new.sizes[d] != old.sizes[d]]
+    return grown[0] if len(grown) == 1 else None
+
+
+def _stale_steps(old: xr.Dataset, new: xr.Dataset, step_dim: Optional[str],
+                 modified: list[str], removed: list[str]) -> Optional[set]:
+    """Indices (along step_dim) of the new dataset that may hold different data than before."""
+    if removed:
+        return None
+    if step_dim is not None and step_dim in new.coords:
+        old_values = old[step_dim].values
+        # New steps must come after the existing ones, otherwise every index shifted
+        if not np.array_equal(new[step_dim].values[:old_values.size], old_values):
+            return None
+    if not modified:
+        return set()
+    dim = step_dim or (list(new.dims)[0] if new.dims else None)
+    if dim is None or dim not in new.coords:
+        return None
+    stale = set()
+    for f in modified:
+        try:
+            with xr.open_dataset(f, decode_times=False) as ds:
+                if dim not in ds.coords:
+                    return None
+                stale.update(int(i) for i in np.nonzero(np.isin(new[dim].values, ds[dim].values))[0])
+        except Exception as e:
+            logger.warning(f"Could not read {f} to find changed steps: {e}")
+            return None
+    return stale
+
+
+class DatasetWatcher:
+    """Polls the files of a dataset and publishes new versions of it."""
+
+    def __init__(self, path: PathLike, regex: str, data: xr.Dataset,
+                 interval: float = DEFAULT_WATCH_INTERVAL, **open_kwargs):
+        """
+        Args:
+            path: Dataset path (directory, file or list of files).
+            regex: File pattern when path is a directory.
+            data: Dataset currently shared by the sessions.
+            interval: Seconds between two polls.
+            open_kwargs: Passed to ``open_dataset`` when reopening.
+        """
+        self.path = path
+        self.regex = regex
+        self.data = data
+        self.interval = interval
+        self.open_kwargs = open_kwargs
+        self._files = _snapshot(resolve_files(path, regex))
+        # Dashboards subscribe with bound methods, held weakly so closed sessions go away
+        self._listeners: list = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, listener: Callable[[DatasetUpdate], None]) -> None:
+        """Call ``listener(update)`` on every change (bound methods are held weakly)."""
+        ref = weakref.WeakMethod(listener) if hasattr(listener, '__func__') else (lambda: listener)
+        with self._lock:
+            self._listeners.append(ref)
+
+    def unsubscribe(self, listener: Callable[[DatasetUpdate], None]) -> None:
+        with self._lock:
+            self._listeners = [r for r in self._listeners if r() is not None and r() != listener]
+
+    def start(self) -> None:
+        """Start polling on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='ncdash-watcher')
+        self._thread.start()
+        logger.info(f"Watching {self.path} ({self.regex or 'all files'}) every {self.interval:.0f}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.exception(f"Dataset watcher failed: {e}")
+
+    def check(self) -> Optional[DatasetUpdate]:
+        """
+        Poll the files once and publish an update if they changed.
+
+        Returns:
+            The update, or None when nothing changed.
+        """
+        snapshot = _snapshot(resolve_files(self.path, self.regex))
+        if snapshot == self._files:
+            return None
+        added = sorted(f for f in snapshot if f not in self._files)
+        modified = sorted(f for f in snapshot if f in self._files and snapshot[f] != self._files[f])
+        removed = sorted(f for f in self._files if f not in snapshot)
+
+        new_data = open_dataset(self.path, self.regex, **self.open_kwargs)
+        old_data = self.data
+        step_dim = _step_dim(old_data, new_data)
+        update = DatasetUpdate(
+            data=new_data, added_files=added, modified_files=modified, removed_files=removed,
+            step_dim=step_dim,
+            old_steps=old_data.sizes[step_dim] if step_dim else 0,
+            new_steps=new_data.sizes[step_dim] if step_dim else 0,
+            stale_steps=_stale_steps(old_data, new_data, step_dim, modified, removed),
+        )
+        self.data = new_data
+        self._files = snapshot
+        logger.info(f"Dataset changed: {len(added)} added, {len(modified)} modified, {len(removed)} removed"
+                    + (f"; {step_dim} {update.old_steps} -> {update.new_steps}" if step_dim else ''))
+
+        with self._lock:
+            self._listeners = [r for r in self._listeners if r() is not None]
+            listeners = [r() for r in self._listeners]
+        for listener in listeners:
+            if listener is None:
+                continue
+            try:
+                listener(update)
+            except Exception as e:
+                logger.exception(f"Dataset update listener failed: {e}")
+        return update
+
+
+def is_stale(stale_steps: Optional[set], step: Optional[int]) -> bool:
+    """True if data at ``step`` (index along the grown dim) changed in an update."""
+    return stale_steps is None or (step is not None and step in stale_steps)
+
+
+def invalidate_slices(slice_cache, stale_steps: Optional[set]) -> int:
+    """
+    Drop the cached slices of the steps that changed (slice keys are (variable, time_idx, depth_idx)).
+
+    Returns:
+        Number of entries removed (-1 when the whole cache was cleared).
+    """
+    if stale_steps is None:
+        slice_cache.clear()
+        return -1
+    if not stale_steps:
+        return 0
+    return slice_cache.invalidate(lambda key: key[1] in stale_steps)
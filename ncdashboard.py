@@ -1,8 +1,11 @@
 """NcDashboard Panel Options
 
 Usage:
-  ncdashboard.py  <path> [--regex <regex>] [--state <state_file>] [--port=<port>]
-  ncdashboard.py  --state <state_file> [--port=<port>]
+  ncdashboard.py  <path> [--regex <regex>] [--state <state_file>] [--port=<port>] [--watch]
+  ncdashboard.py  --state <state_file> [--port=<port>] [--watch]
+  ncdashboard.py  <path> [--regex <regex>] --build-pyramid
+  ncdashboard.py  <path> [--regex <regex>] --convert-zarr [--vars <vars>] [--layout <layout>] [--workers <n>]
+  ncdashboard.py  --state <state_file> --export [--figure <id>] [--format <fmt>] [--fps <fps>] [--out <dir>] [--workers <n>]
   ncdashboard.py (-h | --help)
   ncdashboard.py --version
 
@@ -13,6 +16,17 @@ Options:
   --regex <regex>  File pattern (e.g. "*.nc") when path is a directory.
   --state <state_file>  Load dashboard from saved state file (path/regex from file if path not given).
   --port=<port>  Port (overrides config).
+  --watch       Add files that arrive in the dataset folder while the server runs (see performance.watch).
+  --build-pyramid  Write the overview levels (2x, 4x, 8x block means) of every variable and exit.
+  --convert-zarr  Write a rechunked local Zarr copy of the dataset (used automatically while up to date) and exit.
+  --vars <vars>  Comma separated variables to copy with --convert-zarr [default: all].
+  --layout <layout>  Zarr chunking: 'map' (fast 2D slices) or 'timeseries' (fast point series) [default: map].
+  --workers <n>  Parallel dask threads for --convert-zarr, or processes drawing frames for --export (default: number of CPUs).
+  --export      Render the animations of the state file to movies without starting the server, and exit.
+  --figure <id>  Only export the animation with this id (default: every animation of the state).
+  --format <fmt>  Export format: mp4, gif or png (PNG sequence) [default: mp4].
+  --fps <fps>   Frames per second of exported movies [default: 8].
+  --out <dir>   Output folder of --export [default: exports].
 """
 import io
 import json
@@ -51,15 +65,23 @@ hv.config.logo = False
 hv.config.image_rtol = 0.1
 # Disable shared axes so that moving one plot doesn't move others
 hv.plotting.bokeh.ElementPlot.shared_axes = False
+# Maps and frames are rasterized on background threads: prefer numba's OpenMP layer,
+# the TBB one blocks interpreter exit once datashader kernels ran outside the main thread
+if not {'NUMBA_THREADING_LAYER', 'NUMBA_THREADING_LAYER_PRIORITY'} & set(os.environ):
+    import numba
+    numba.config.THREADING_LAYER_PRIORITY = ['omp', 'tbb', 'workqueue']
 
 class NcDashboard:
-    def __init__(self, file_paths, regex, initial_state=None, preloaded_data=None, title=None):
+    def __init__(self, file_paths, regex, initial_state=None, preloaded_data=None, title=None,
+                 perf_config=None, watcher=None):
         """
         file_paths: path to directory or file list.
         regex: file pattern when path is a directory.
         initial_state: optional state dict to restore (from --state file).
         preloaded_data: optional pre-loaded xarray Dataset to avoid re-reading files.
         title: optional custom title to display in the header.
+        perf_config: optional 'performance' section of the config (cache budgets, etc.).
+        watcher: optional DatasetWatcher publishing new versions of the dataset (live append).
         """
         logger.info('Initializing new NcDashboard session...')
         
@@ -94,7 +116,8 @@ class NcDashboard:
         self.template.header.append(link_html)
         
         try:
-            self.ncdash = Dashboard(file_paths, regex, preloaded_data=preloaded_data)
+            self.ncdash = Dashboard(file_paths, regex, preloaded_data=preloaded_data,
+                                    perf_config=perf_config, watcher=watcher)
         except Exception as e:
             logger.error(f"Failed to load data: {e}")
             # Create a simple nice text saying that the files can't be found
@@ -167,6 +190,7 @@ class NcDashboard:
                 # Create a button for each variable for one-click plotting
                 btn = pn.widgets.Button(
                     name=f"{name} {dims}", 
+                    description=self._field_stats_tooltip(field),
                     sizing_mode='stretch_width',
                     stylesheets=[button_style]
                 )
@@ -255,6 +279,16 @@ class NcDashboard:
         for widget in var_widgets:
             self.sidebar_area.append(widget)
 
+    def _field_stats_tooltip(self, field):
+        """Short summary of the precomputed statistics of a variable (None if not available yet)."""
+        stats = self.ncdash.get_field_stats(field)
+        if not stats or not stats.get('quantiles') or None in stats['quantiles']:
+            return None
+        lo, hi = stats['quantiles']
+        return (f"Range (2-98%): {lo:.4g} to {hi:.4g} | "
+                f"min {stats['min']:.4g}, max {stats['max']:.4g} | "
+                f"valid {stats['valid_fraction']:.0%}")
+
     def plot_field(self, field, var_type):
         from model.model_utils import PlotType 
         
@@ -270,10 +304,60 @@ class NcDashboard:
         logger.info("Custom analysis figure created successfully")
 
 
+def build_pyramid(path, regex, perf_cfg):
+    """Offline step: write the overview pyramid of every variable of the dataset."""
+    from model.data_loader import open_dataset
+    from model.pyramid import get_pyramid_store
+
+    store = get_pyramid_store(path, regex, root=perf_cfg.get('pyramid_dir'))
+    if store is None:
+        raise SystemExit(1)
+    with open_dataset(path, regex, use_zarr_copy=perf_cfg.get('use_zarr_copy', True),
+                      use_index=perf_cfg.get('dataset_index', True)) as data:
+        store.build(data)
+
+
+def export_animations(path, regex, state, perf_cfg, args):
+    """Offline step: render the animations of a saved state to MP4/GIF/PNG."""
+    from model.data_loader import open_dataset
+    from model.coord_roles import register_dataset
+    from model.export import export_state
+
+    with open_dataset(path, regex, use_zarr_copy=perf_cfg.get('use_zarr_copy', True),
+                      use_index=perf_cfg.get('dataset_index', True)) as data:
+        data = Dashboard._assign_coordinates(data)
+        register_dataset(data)
+        results = export_state(state, data, args['--out'], figure_id=args.get('--figure'),
+                               fmt=args['--format'], fps=float(args['--fps']),
+                               workers=int(args['--workers']) if args.get('--workers') else None)
+    for result in results:
+        print(f"{result.path}: {result.frames} frames in {result.seconds:.1f} s ({result.fps:.1f} frames/s)")
+    if not results:
+        raise SystemExit(1)
+
+
+def refresh_shared_state(path, regex, perf_cfg, update):
+    """Watcher listener: drop what changed from the caches shared by every session."""
+    from model.slice_cache import get_slice_cache
+    from model.stats_store import get_stats_store
+    from model.pyramid import get_pyramid_store
+    from model.watcher import invalidate_slices
+
+    invalidate_slices(get_slice_cache(f"{path}|{regex}"), update.stale_steps)
+    if perf_cfg.get('stats_sidecar', True):
+        get_stats_store(path, regex).refresh(
+            update.data, samples_per_step=int(perf_cfg.get('stats_samples_per_step', 20000)))
+    if perf_cfg.get('pyramid', 'on_demand') != 'off':
+        store = get_pyramid_store(path, regex, root=perf_cfg.get('pyramid_dir'))
+        if store is not None:
+            store.refresh(update.data, update.stale_steps)
+
+
 def main():
     args = docopt(__doc__, version='NcDashboard Panel 0.0.2')
     config = load_ncdashboard_config()
     server_cfg = config.get('server', {})
+    perf_cfg = config.get('performance', {}) or {}
 
     state_file = args.get('--state')
     
@@ -298,6 +382,21 @@ def main():
         regex = args.get('--regex') or ''
         initial_state = None
 
+    if args.get('--build-pyramid'):
+        build_pyramid(path, regex, perf_cfg)
+        return
+
+    if args.get('--export'):
+        export_animations(path, regex, initial_state, perf_cfg, args)
+        return
+
+    if args.get('--convert-zarr'):
+        from model.data_loader import convert_to_zarr
+        variables = None if args['--vars'] in (None, 'all') else args['--vars'].split(',')
+        workers = int(args['--workers']) if args.get('--workers') else None
+        convert_to_zarr(path, regex, variables=variables, layout=args['--layout'], num_workers=workers)
+        return
+
     # Pre-check if files exist to warn the user early
     search_pattern = os.path.join(str(path), regex) if (path and regex) else path
     if search_pattern and not glob.glob(search_pattern):
@@ -306,23 +405,42 @@ def main():
     # --- Preload data ONCE at server startup ---
     logger.info(f"Preloading dataset from {path} (regex: {regex or 'N/A'})...")
     try:
-        import xarray as xr
-        from os.path import join as pjoin
-        if isinstance(path, list):
-            _preloaded_data = xr.open_mfdataset(path, decode_times=False)
-        else:
-            _preloaded_data = xr.open_mfdataset(pjoin(path, regex), decode_times=False)
+        from model.data_loader import open_dataset
+        _preloaded_data = open_dataset(path, regex, use_zarr_copy=perf_cfg.get('use_zarr_copy', True),
+                                       use_index=perf_cfg.get('dataset_index', True))
         logger.info(f"Dataset preloaded: {list(_preloaded_data.dims)} — {list(_preloaded_data.data_vars)}")
     except Exception as e:
         logger.error(f"Failed to preload data: {e}. Each session will load its own copy.")
         _preloaded_data = None
 
+    # --- Per-variable statistics: read from the sidecar, or computed once in the background ---
+    if _preloaded_data is not None and perf_cfg.get('stats_sidecar', True):
+        from model.stats_store import get_stats_store
+        get_stats_store(path, regex or '').start_background(
+            _preloaded_data, samples_per_step=int(perf_cfg.get('stats_samples_per_step', 20000)))
+
+    # --- Live append: pick up new files without restarting the server ---
+    watcher = None
+    if _preloaded_data is not None and (args.get('--watch') or perf_cfg.get('watch', False)):
+        from functools import partial
+        from model.watcher import DatasetWatcher, DEFAULT_WATCH_INTERVAL
+        watcher = DatasetWatcher(path, regex or '', _preloaded_data,
+                                 interval=float(perf_cfg.get('watch_interval') or DEFAULT_WATCH_INTERVAL),
+                                 use_zarr_copy=perf_cfg.get('use_zarr_copy', True),
+                                 use_index=perf_cfg.get('dataset_index', True))
+        # Shared caches first, then every open session
+        watcher.subscribe(partial(refresh_shared_state, path, regex or '', perf_cfg))
+        watcher.start()
+
     # Custom title from config
     custom_title = server_cfg.get('title')
 
     def make_app():
+        # New sessions start from the latest version of the dataset
+        data = watcher.data if watcher is not None else _preloaded_data
         return NcDashboard(path, regex or '', initial_state=initial_state,
-                           preloaded_data=_preloaded_data, title=custom_title).template
+                           preloaded_data=data, title=custom_title,
+                           perf_config=perf_cfg, watcher=watcher).template
 
     # Websocket origin setup
     ws_origin = [f"{host}:{port}", f"localhost:{port}", f"127.0.0.1:{port}"]
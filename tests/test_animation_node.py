@@ -0,0 +1,144 @@
+import os
+import time
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import model.FigureNode as figure_module
+from model.AnimationNode import AnimationNode
+from model.frame_store import get_frame_store
+from model.model_utils import Resolutions
+from model.prefetch import get_prefetcher
+from model.projection import lonlat_to_mercator
+from model.scheduler import Priority
+
+LATS = np.linspace(-10, 10, 40)
+LONS = np.linspace(-20, 20, 60)
+
+
+def sst_cube(steps, lats=LATS, lons=LONS):
+    return xr.DataArray(np.random.rand(steps, lats.size, lons.size), dims=('time', 'lat', 'lon'), name='sst',
+                        coords={'time': np.arange(float(steps)), 'lat': lats, 'lon': lons})
+
+
+def mercator_view(lon0, lat0, lon1, lat1):
+    (x0, x1), (y0, y1) = lonlat_to_mercator(np.array([lon0, lon1]), np.array([lat0, lat1]))
+    return dict(x_range=(float(x0), float(x1)), y_range=(float(y0), float(y1)), width=100, height=80)
+
+
+def test_animation_uses_shared_store():
+    anim = AnimationNode('anim', sst_cube(5), 'time', Resolutions.HIGH.value, field_name='sst')
+    anim.wait_pre_render()
+    assert len(anim._cache) == 5
+    assert anim.memory_info().startswith('5/5 frames cached')
+
+    img = anim._get_frame(3)
+    np.testing.assert_allclose(img.dimension_values(2, flat=False).size, LATS.size * LONS.size)
+    assert anim._get_frame(3) is img
+
+    before = get_frame_store().stats()['entries']
+    anim.close()
+    assert len(anim._cache) == 0
+    assert get_frame_store().stats()['entries'] == before - 5
+
+
+def test_blocks_follow_chunks():
+    plan = AnimationNode.plan_blocks
+    assert plan(30, (10, 10, 10), frame_bytes=1, max_bytes=25) == [(0, 20), (20, 30)]
+    assert plan(100, (100,), frame_bytes=1, max_bytes=25) == [(0, 25), (25, 50), (50, 75), (75, 100)]
+    assert plan(7, None, frame_bytes=10, max_bytes=1) == [(i, i + 1) for i in range(7)]
+
+
+def test_pre_render_computes_once_per_block():
+    from dask.callbacks import Callback
+
+    data = sst_cube(12).chunk({'time': 4})
+    computes = []
+    with Callback(start=lambda dsk: computes.append(1)):
+        anim = AnimationNode('anim', data, 'time', Resolutions.HIGH.value, field_name='sst')
+        anim.wait_pre_render()
+    assert len(anim._cache) == 12 and len(computes) == 1
+    np.testing.assert_allclose(anim._cache.get(7).values(), data.values[7], rtol=1e-6)
+    anim.close()
+
+
+@pytest.mark.parametrize('ram_mb', [512, 0])
+def test_reduced_cube_is_materialized(monkeypatch, ram_mb):
+    monkeypatch.setattr(AnimationNode, 'MATERIALIZE_RAM_MB', ram_mb)
+    data = sst_cube(6).chunk({'time': 2})
+    anim = AnimationNode('anim', data, 'time', Resolutions.MEDIUM.value, field_name='sst')
+    anim.wait_pre_render()
+
+    assert anim.materialized == 1 and anim.data.chunks is None and anim.data.dtype == np.float32
+    expected = data.coarsen(lat=4, lon=4, boundary='trim').mean().values
+    np.testing.assert_allclose(anim.data.values, expected, rtol=1e-6)
+    path = anim._cube_path
+    assert (path is not None) == (ram_mb == 0)
+    store = anim._cache.store
+    assert store._reserved.get(f"{anim._cache.owner}:cube") == (None if path else anim.data.size * 4)
+    assert ('on disk' if path else 'in RAM') in anim.memory_info()
+    if path is not None:
+        assert os.path.getsize(path) == anim.data.size * 4
+    anim.close()
+    assert path is None or not os.path.exists(path)
+    assert f"{anim._cache.owner}:cube" not in store._reserved
+
+
+def test_rasterized_aggregates_are_cached(monkeypatch):
+    anim = AnimationNode('anim', sst_cube(6), 'time', Resolutions.HIGH.value, field_name='sst')
+    anim.wait_pre_render()
+    view = dict(x_range=(-1e6, 1e6), y_range=(-5e5, 5e5), width=100, height=50)
+    anim._render_frame(value=0, **view)
+    # The other frames are rasterized in the background
+    deadline = time.time() + 30
+    while len(anim._aggregates) < 6 and time.time() < deadline:
+        time.sleep(0.05)
+    assert len(anim._aggregates) == 6 and 'rasterized' in anim.memory_info()
+    expected = anim._rasterize(anim._frame_element(4), anim._view_key(**view))
+
+    def no_rasterize(*args, **kwargs):
+        raise AssertionError("frame rasterized again")
+
+    monkeypatch.setattr(figure_module, 'rasterize', no_rasterize)
+    cached = anim._render_frame(value=4, **view)
+    np.testing.assert_array_equal(cached.dimension_values(2, flat=False), expected.dimension_values(2, flat=False))
+    np.testing.assert_allclose(cached.bounds.lbrt(), expected.bounds.lbrt())
+    monkeypatch.undo()
+
+    # A new viewport drops the old aggregates and falls back to live rasterization
+    zoomed = anim._render_frame(value=4, **dict(view, x_range=(-5e5, 5e5)))
+    assert zoomed.bounds.lbrt()[2] == pytest.approx(5e5)
+    assert anim._aggregate_view == anim._view_key(**dict(view, x_range=(-5e5, 5e5)))
+    anim.close()
+    assert len(anim._aggregates) == 0
+
+
+def test_aggregates_are_rasterized_at_prerender_priority(monkeypatch):
+    anim = AnimationNode('anim', sst_cube(3), 'time', Resolutions.HIGH.value, field_name='sst', pre_render=False)
+    calls = []
+    monkeypatch.setattr(get_prefetcher(), 'schedule', lambda owner, jobs, priority=None: calls.append(priority))
+    anim._schedule_aggregates(anim._view_key(x_range=(-1e6, 1e6), y_range=(-5e5, 5e5), width=100, height=50))
+    assert calls == [Priority.PRERENDER]
+    anim.close()
+
+
+@pytest.mark.parametrize('lons, project_mercator', [(np.linspace(262, 280, 60), True),
+                                                     (np.linspace(-98, -80, 60), False)])
+def test_frames_of_lonlat_animation_are_not_empty(lons, project_mercator):
+    anim = AnimationNode('anim', sst_cube(3, np.linspace(20, 30, 40), lons), 'time', Resolutions.HIGH.value,
+                         field_name='sst')
+    anim.project_mercator = project_mercator
+    anim.wait_pre_render()
+    view = mercator_view(-95, 22, -85, 28)
+    frame = anim._render_frame(value=0, **view)
+    assert frame.dimension_values(2, flat=False).size
+
+    # The other frames are rasterized in the background at the same view
+    deadline = time.time() + 30
+    while len(anim._aggregates) < 3 and time.time() < deadline:
+        time.sleep(0.05)
+    for index in range(3):
+        stored = anim._aggregates.get((index, anim._view_key(**view)))
+        assert stored is not None and np.isfinite(stored.values()).any()
+    anim.close()
@@ -0,0 +1,88 @@
+import base64
+import io
+
+import numpy as np
+import pytest
+import xarray as xr
+from PIL import Image
+
+from model.AnimationNode import AnimationNode
+from model.client_playback import colormap_lut, encode_png, shade, viewport_window
+from model.model_utils import Resolutions
+
+
+@pytest.fixture
+def anim():
+    lats, lons = np.linspace(-10, 10, 40), np.linspace(-20, 20, 80)
+    data = xr.DataArray(np.random.rand(4, 40, 80), dims=('time', 'lat', 'lon'), name='sst',
+                        coords={'time': np.arange(4.0), 'lat': lats, 'lon': lons})
+    node = AnimationNode('anim', data, 'time', Resolutions.HIGH.value, field_name='sst', cmap='viridis')
+    node.wait_pre_render()
+    yield node
+    node.close()
+
+
+def decode(url):
+    return np.asarray(Image.open(io.BytesIO(base64.b64decode(url.split(',', 1)[1]))))
+
+
+def test_shading_and_png():
+    lut = colormap_lut('viridis')
+    assert lut.shape == (256, 4)
+    np.testing.assert_array_equal(colormap_lut(['#000000', '#ffffff'])[[0, -1], :3], [[0, 0, 0], [255, 255, 255]])
+
+    values = np.array([[0.0, 1.0], [np.nan, 0.5]])
+    rgba = shade(values, (0, 1), lut)
+    assert rgba[1, 0, 3] == 0 and rgba[0, 0, 3] == 255
+    np.testing.assert_array_equal(rgba[0, 1], lut[-1])
+    # PNG rows are north first
+    np.testing.assert_array_equal(decode(encode_png(rgba)), rgba[::-1])
+
+
+def test_viewport_window_stride():
+    x, y = np.arange(1000.0), np.arange(500.0)
+    rows, cols = viewport_window(x, y, (100, 300), None, canvas=(100, 100))
+    assert (cols.start, cols.step) == (100, 5) and rows.step == 5
+    assert viewport_window(x, y, (2000, 3000), None, canvas=(100, 100)) is None
+
+
+def test_browser_playback(anim):
+    anim.playback.value = 'Browser'
+    assert anim.client_view.visible and not anim.player_row.visible
+    anim._client_job.result(timeout=30)
+    urls = list(anim._client.stack.data['url'])
+    assert len(urls) == 4 and anim._client.slider.end == 3
+    assert decode(urls[0]).shape[2] == 4
+
+    anim.cmap = 'magma'
+    anim._client_job.result(timeout=30)
+    assert anim._client.stack.data['url'][0] != urls[0]
+
+    anim._client.slider.value = 2
+    anim.playback.value = 'Server'
+    assert anim.player.value == 2 and anim.player_row.visible and not anim.client_view.visible
+
+
+def test_client_pan_is_throttled_and_shaded_off_the_document(anim, monkeypatch):
+    from types import SimpleNamespace
+
+    import panel as pn
+
+    anim.playback.value = 'Browser'
+    anim._client_job.result(timeout=30)
+    timeouts, ticks = [], []
+    doc = SimpleNamespace(session_context=SimpleNamespace(id='s'),
+                          add_timeout_callback=lambda cb, ms: timeouts.append(cb),
+                          add_next_tick_callback=ticks.append)
+    monkeypatch.setattr(type(pn.state), 'curdoc', property(lambda self: doc))
+    urls = list(anim._client.stack.data['url'])
+
+    for dx in range(10):
+        anim._on_client_ranges(SimpleNamespace(x0=dx * 1e4, x1=dx * 1e4 + 1e6, y0=0.0, y1=5e5))
+    assert len(timeouts) == 1 and anim._client_throttle.forwarded == 0
+    timeouts[0]()
+    anim._client_job.result(timeout=30)
+    # The new stack reaches the player on the next tick of the document only
+    assert len(ticks) == 1 and list(anim._client.stack.data['url']) == urls
+    ticks[0]()
+    assert list(anim._client.stack.data['url']) != urls
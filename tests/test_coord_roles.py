@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from model.coord_roles import get_coord_roles, register_dataset, resolve_coord_roles
+from model.model_utils import get_all_coords
+from model.viewport import compute_index_window
+
+
+@pytest.fixture
+def cf_field():
+    # Names the heuristics cannot recognise, described by CF attributes only
+    return xr.DataArray(
+        np.zeros((2, 3, 4, 5)), dims=('t_axis', 'k', 'y', 'x'), name='temp',
+        coords={'t_axis': ('t_axis', [0, 1], {'units': 'hours since 2000-01-01'}),
+                'k': ('k', [0.0, 5.0, 10.0], {'axis': 'Z', 'positive': 'down'}),
+                'y': ('y', np.linspace(30, 20, 4), {'standard_name': 'latitude'}),
+                'x': ('x', np.linspace(-90, -80, 5), {'units': 'degrees_east'})})
+
+
+def test_cf_attributes(cf_field):
+    roles = resolve_coord_roles(cf_field)
+    assert (roles.time, roles.depth, roles.lat, roles.lon) == ('t_axis', 'k', 'y', 'x')
+    assert roles.positions == {'time': 0, 'depth': 1, 'lat': 2, 'lon': 3}
+    assert roles.orders == {'time': 1, 'depth': 1, 'lat': -1, 'lon': 1}
+    assert roles.depth_positive == 'down'
+
+
+def test_names_and_positions_fallback():
+    # WRF-like: dims without coordinates, 2D XLAT/XLONG
+    data = xr.DataArray(np.zeros((2, 4, 5)), dims=('Time', 'south_north', 'west_east'), name='T2',
+                        coords={'XLAT': (('south_north', 'west_east'), np.zeros((4, 5))),
+                                'XLONG': (('south_north', 'west_east'), np.zeros((4, 5)))})
+    roles = resolve_coord_roles(data)
+    assert (roles.time, roles.depth, roles.lat, roles.lon) == ('Time', None, 'XLAT', 'XLONG')
+    assert roles.positions['lat'] is None and roles.positions['time'] == 0
+    assert roles.orders['lat'] == 0
+
+    # Roles of the variable apply to its slices
+    times, depth, lats, lons = roles.coords(data.isel(Time=1))
+    assert times.size == 0 and depth.size == 0
+    assert lats.name == 'XLAT' and lons.name == 'XLONG'
+
+
+def test_registry_resolves_each_variable_once(cf_field):
+    ds = cf_field.to_dataset()
+    roles = register_dataset(ds)
+    assert get_coord_roles(ds['temp']) is roles['temp']
+    times, depth, lats, lons = get_all_coords(ds['temp'])
+    assert (times.name, depth.name, lats.name, lons.name) == ('t_axis', 'k', 'y', 'x')
+
+
+def test_registry_is_bounded_and_keyed_without_values(cf_field, monkeypatch):
+    import model.coord_roles as coord_roles
+
+    monkeypatch.setattr(coord_roles, 'MAX_REGISTERED', 2)
+    monkeypatch.setattr(coord_roles, '_registry', coord_roles.OrderedDict())
+    roles = get_coord_roles(cf_field)
+    # Same layout with other values (e.g. another file of the dataset) reuses the roles
+    shifted = cf_field.assign_coords(x=cf_field['x'] + 1.0, t_axis=cf_field['t_axis'] + 10)
+    assert get_coord_roles(shifted) is roles
+    # Reversed latitudes are a different layout
+    assert get_coord_roles(cf_field.isel(y=slice(None, None, -1))).orders['lat'] == 1
+    for n in range(3):
+        get_coord_roles(cf_field.rename(f'var{n}'))
+    assert len(coord_roles._registry) == 2
+
+
+def test_known_order_gives_same_window(cf_field):
+    lats, lons = cf_field['y'].values, cf_field['x'].values
+    expected = compute_index_window(lats, lons, (-88, -84), (22, 26), margin=0)
+    assert compute_index_window(lats, lons, (-88, -84), (22, 26), margin=0, orders=(-1, 1)) == expected
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from model.data_loader import (convert_to_zarr, dataset_fingerprint, open_dataset, resolve_files,
+                               zarr_chunks)
+
+pytest.importorskip('zarr')
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    rng = np.random.default_rng(2)
+    for i in range(2):
+        ds = xr.Dataset(
+            {'temp': (('time', 'lat', 'lon'), rng.random((3, 20, 30))),
+             'salt': (('time', 'lat', 'lon'), rng.random((3, 20, 30)))},
+            coords={'time': np.arange(3) + 3 * i, 'lat': np.linspace(18, 31, 20), 'lon': np.linspace(-98, -76, 30)},
+        )
+        ds.to_netcdf(tmp_path / f'data_{i:02d}.nc')
+    return tmp_path
+
+
+def test_fingerprint_changes_with_files(dataset_dir):
+    files = resolve_files(str(dataset_dir), '*.nc')
+    assert len(files) == 2
+    before = dataset_fingerprint(files)
+    (dataset_dir / 'data_02.nc').write_bytes(b'')
+    assert dataset_fingerprint(resolve_files(str(dataset_dir), '*.nc')) != before
+
+
+def test_chunk_layouts():
+    data = xr.DataArray(np.zeros((10, 5, 300, 400)), dims=('time', 'depth', 'lat', 'lon'))
+    assert zarr_chunks(data, 'map') == {'time': 1, 'depth': 1, 'lat': 300, 'lon': 400}
+    assert zarr_chunks(data, 'timeseries') == {'time': 10, 'depth': 1, 'lat': 64, 'lon': 64}
+
+
+def test_open_dataset_prefers_current_zarr_copy(dataset_dir):
+    store = convert_to_zarr(str(dataset_dir), '*.nc', variables=['temp'], layout='map')
+    data = open_dataset(str(dataset_dir), '*.nc')
+    # temp comes from the copy (one time step per chunk), salt from the NetCDF files
+    assert data['temp'].chunks[0] == (1,) * 6
+    assert data['temp'].encoding.get('source') != data['salt'].encoding.get('source')
+    source = xr.open_mfdataset(str(dataset_dir / '*.nc'), decode_times=False)
+    np.testing.assert_array_equal(data['temp'].values, source['temp'].values)
+
+    # Touching a source file makes the copy stale
+    data_file = dataset_dir / 'data_00.nc'
+    st = os.stat(data_file)
+    os.utime(data_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert open_dataset(str(dataset_dir), '*.nc')['temp'].chunks[0] != (1,) * 6
+    assert os.path.isdir(store)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from model.dataset_index import DatasetIndex, _FileHandles, open_indexed
+
+
+def write_file(directory, i):
+    rng = np.random.default_rng(i)
+    ds = xr.Dataset(
+        {'temp': (('time', 'depth', 'lat', 'lon'), rng.random((2, 3, 4, 5)), {'units': 'degC'}),
+         'bathy': (('lat', 'lon'), np.full((4, 5), float(i)))},
+        coords={'time': [2 * i, 2 * i + 1], 'forecast': ('time', [10.0 * i, 10.0 * i + 5]), 'depth': [0.0, 10.0, 20.0],
+                'lat': np.arange(4.0), 'lon': np.arange(5.0)},
+    )
+    ds.to_netcdf(directory / f'data_{i:02d}.nc')
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    # Written in reverse order so file names do not match the time order
+    for i in (2, 0, 1):
+        write_file(tmp_path, i)
+    return tmp_path
+
+
+def test_indexed_dataset_matches_open_mfdataset(dataset_dir):
+    data = open_indexed(str(dataset_dir), '*.nc')
+    reference = xr.open_mfdataset(str(dataset_dir / '*.nc'), decode_times=False, data_vars='all')
+
+    assert data['temp'].dims == reference['temp'].dims
+    assert data['bathy'].dims == reference['bathy'].dims
+    assert data['temp'].attrs['units'] == 'degC'
+    np.testing.assert_array_equal(data['time'].values, reference['time'].values)
+    np.testing.assert_array_equal(data['forecast'].values, reference['forecast'].values)
+    for key in [np.s_[:], np.s_[3], np.s_[1:6:2], np.s_[2:5, 1, 1:3]]:
+        np.testing.assert_array_equal(data['temp'][key].values, reference['temp'][key].values)
+        np.testing.assert_array_equal(data['bathy'][key].values, reference['bathy'][key].values)
+
+
+def test_evicted_handle_is_closed_by_its_last_reader(dataset_dir, monkeypatch):
+    closed = []
+    monkeypatch.setattr(xr.Dataset, 'close', lambda self: closed.append(self))
+    handles = _FileHandles(max_open=1)
+    with handles.reading(str(dataset_dir / 'data_00.nc')) as first:
+        with handles.reading(str(dataset_dir / 'data_01.nc')):
+            pass
+        # Evicted by the second file, but still being read
+        assert closed == []
+        first['temp'].values
+    assert closed == [first]
+
+    handles.close(str(dataset_dir / 'data_01.nc'))
+    assert len(closed) == 2
+
+
+def test_only_new_files_are_scanned(dataset_dir):
+    assert DatasetIndex(str(dataset_dir), '*.nc').refresh() == 3
+    assert DatasetIndex(str(dataset_dir), '*.nc').refresh() == 0
+
+    write_file(dataset_dir, 3)
+    index = DatasetIndex(str(dataset_dir), '*.nc')
+    assert index.refresh() == 1
+    assert open_indexed(str(dataset_dir), '*.nc').sizes['time'] == 8
+
+
+def test_unsupported_layout_falls_back(dataset_dir):
+    # Files that differ in a non-concatenated dim cannot be combined from the index alone
+    xr.Dataset({'temp': (('time', 'depth', 'lat', 'lon'), np.zeros((2, 2, 4, 5)))},
+               coords={'time': [10, 11], 'depth': [0.0, 5.0], 'lat': np.arange(4.0),
+                       'lon': np.arange(5.0)}).to_netcdf(dataset_dir / 'data_09.nc')
+    index = DatasetIndex(str(dataset_dir), '*.nc')
+    index.refresh()
+    assert index.concat_dim() is None
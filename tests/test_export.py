@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import xarray as xr
+from PIL import Image
+
+from model.AnimationNode import AnimationNode
+from model.export import export_animation, export_state
+from model.model_utils import Resolutions
+
+
+@pytest.fixture
+def dataset():
+    lats, lons = np.linspace(-10, 10, 30), np.linspace(-20, 20, 50)
+    temp = np.random.rand(5, 2, 30, 50)
+    return xr.Dataset({'temp': (('time', 'depth', 'lat', 'lon'), temp)},
+                      coords={'time': np.arange(5.0), 'depth': [0.0, 10.0], 'lat': lats, 'lon': lons})
+
+
+def test_export_gif_and_png(tmp_path, dataset):
+    node = AnimationNode('anim', dataset['temp'].isel(depth=0), 'time', Resolutions.HIGH.value,
+                         field_name='temp', cmap='viridis', pre_render=False)
+    done = []
+    result = export_animation(node, str(tmp_path / 'anim.gif'), fps=5, workers=2, size=(200, 300),
+                              progress=lambda n, total: done.append((n, total)))
+    assert result.frames == 5 and result.fps > 0 and done[-1] == (5, 5)
+    with Image.open(result.path) as gif:
+        assert gif.n_frames == 5 and gif.size == (300, 200)
+
+    result = export_animation(node, str(tmp_path / 'frames'), fmt='png', workers=1, size=(200, 300))
+    assert sorted(p.name for p in (tmp_path / 'frames').iterdir())[-1] == 'frame_000004.png'
+    node.close()
+
+
+def test_export_state_animations(tmp_path, dataset):
+    state = {'figures': [
+        {'id': 'temp', 'plot_type': 'FourD', 'field_name': 'temp', 'parent_id': 'root', 'depth_idx': 1},
+        {'id': 'temp_anim', 'plot_type': 'FourD_Animation', 'field_name': 'temp', 'parent_id': 'temp',
+         'animation_coord': 'time', 'spatial_res': Resolutions.HIGH.value, 'cmap': 'magma', 'clim': [0, 1]},
+    ]}
+    results = export_state(state, dataset, str(tmp_path), fmt='gif', workers=1, size=(100, 150))
+    assert [r.path for r in results] == [str(tmp_path / 'temp_anim.gif')]
+    assert results[0].frames == 5
+    assert export_state(state, dataset, str(tmp_path), figure_id='other', fmt='gif') == []
+
+
+def test_export_state_depth_animation_at_saved_time(tmp_path, dataset, monkeypatch):
+    import model.export as export_module
+
+    exported = []
+    monkeypatch.setattr(export_module, 'export_animation',
+                        lambda node, path, **kwargs: exported.append(node.data.values.copy()))
+    state = {'figures': [
+        {'id': 'temp', 'plot_type': 'FourD', 'field_name': 'temp', 'parent_id': 'root',
+         'third_coord_idx': 3, 'depth_idx': 0},
+        {'id': 'temp_depth', 'plot_type': 'FourD_Animation', 'field_name': 'temp', 'parent_id': 'temp',
+         'animation_coord': 'depth', 'spatial_res': Resolutions.HIGH.value},
+    ]}
+    export_state(state, dataset, str(tmp_path), fmt='gif', workers=1)
+    np.testing.assert_allclose(exported[0], dataset['temp'].isel(time=3).values)
+
+
+def test_export_button_runs_on_the_scheduler(tmp_path, dataset, monkeypatch):
+    node = AnimationNode('anim', dataset['temp'].isel(depth=0), 'time', Resolutions.HIGH.value,
+                         field_name='temp', cmap='viridis', pre_render=False)
+    monkeypatch.setattr(AnimationNode, 'EXPORT_DIR', str(tmp_path))
+    node.export_format.value = 'gif'
+    node._on_export(None)
+    assert node.export_button.disabled
+    node._export_job.result(timeout=60)
+    assert not node.export_button.disabled and node.export_download.visible
+    assert (tmp_path / 'anim.gif').exists()
+    node.close()
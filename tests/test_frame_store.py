@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from model.frame_store import FrameStore, encode_frame
+
+LATS = np.linspace(-10, 10, 40)
+LONS = np.linspace(-20, 20, 60)
+
+
+@pytest.fixture
+def frame():
+    values = np.add.outer(LATS, LONS)
+    values[0, :5] = np.nan
+    return values
+
+
+@pytest.mark.parametrize('compression, atol', [('none', 0), ('zstd', 0), ('quantize', 1e-3)])
+def test_codecs_round_trip(frame, compression, atol):
+    stored = encode_frame(frame, LATS, LONS, compression)
+    values = stored.values()
+    assert values.dtype == np.float32 and values.shape == frame.shape
+    np.testing.assert_allclose(values, frame, atol=atol + 1e-5, equal_nan=True)
+    if compression != 'none':
+        assert stored.nbytes < frame.astype(np.float32).nbytes
+
+
+def test_budget_is_shared_across_animations(frame):
+    frame_bytes = encode_frame(frame, LATS, LONS).nbytes
+    store = FrameStore(max_bytes=3 * frame_bytes, compression='none')
+    a, b = store.frames('a'), store.frames('b')
+    a.put(0, frame, LATS, LONS)
+    a.put(1, frame, LATS, LONS)
+    b.put(0, frame, LATS, LONS)
+    assert a.get(0) is not None  # a/0 becomes the most recently used
+    b.put(1, frame, LATS, LONS)
+
+    assert 1 not in a and 0 in a and len(b) == 2
+    assert a.evictions == 1 and a.nbytes == frame_bytes
+    assert store.stats()['bytes'] <= store.max_bytes
+
+    b.clear()
+    assert len(b) == 0 and store.stats()['entries'] == 1
+
+
+def test_reservations_share_the_budget(frame):
+    frame_bytes = encode_frame(frame, LATS, LONS).nbytes
+    store = FrameStore(max_bytes=4 * frame_bytes, compression='none')
+    a = store.frames('a')
+    for i in range(4):
+        a.put(i, frame, LATS, LONS)
+    # A cube held outside the store makes the frames room for it
+    assert store.reserve('cube', 2 * frame_bytes)
+    assert len(a) == 2 and a.evictions == 2
+    assert store.stats()['bytes'] + store.stats()['reserved_bytes'] <= store.max_bytes
+    # Reservations are limited to a share of the budget
+    assert not store.reserve('other', frame_bytes)
+    store.unreserve('cube')
+    assert store.reserved_bytes == 0
+
+
+
+def test_demote_compresses_a_raw_frame(frame):
+    store = FrameStore(compression='quantize')
+    a = store.frames('a')
+    a.put(0, frame, LATS, LONS, compression='none')
+    raw_bytes = a.nbytes
+    assert a.get(0).codec == 'none'
+
+    assert a.demote(0) and a.get(0).codec == 'quantize'
+    assert a.nbytes == store.stats()['bytes'] < raw_bytes
+    np.testing.assert_allclose(a.get(0).values(), frame, atol=1e-3, equal_nan=True)
+    assert not a.demote(0) and not a.demote(1)
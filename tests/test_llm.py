@@ -91,6 +91,16 @@ class TestPromptBuilder:
         assert "lat" in prompt.lower()
         assert "lon" in prompt.lower()
 
+    def test_precomputed_stats_included(self, sample_dataarray):
+        """Test that precomputed variable statistics are added to the prompt."""
+        stats = {'temperature': {'quantiles': [271.5, 301.25], 'min': 260.0, 'max': 310.0,
+                                 'valid_fraction': 0.75}}
+        builder = PromptBuilder(sample_dataarray, stats=stats)
+        prompt = builder.build_prompt("Test request")
+        
+        assert "301.2" in prompt
+        assert "75%" in prompt
+
 
 class TestCodeExecutor:
     """Tests for CodeExecutor class."""
@@ -89,3 +89,28 @@ def test_fourd_node_create_figure(mock_osm, mock_4d_data):
     node = FourDNode("test_4d", mock_4d_data, time_idx=0, depth_idx=0, field_name='temp')
     fig = node.create_figure()
     assert fig is not None
+
+def test_animation_auto_resolution():
+    from model.AnimationNode import AnimationNode
+    from model.model_utils import Resolutions
+
+    assert AnimationNode.auto_coarsen_factor((400, 600), (100, 160), pixel_ratio=1) == 4
+    assert AnimationNode.auto_coarsen_factor((40, 60), (100, 160), pixel_ratio=2) == 1
+
+    lats, lons = np.linspace(-20, 20, 400), np.linspace(-30, 30, 600)
+    da = xr.DataArray(np.random.rand(2, 400, 600), dims=('time', 'lat', 'lon'), name='temp',
+                      coords={'time': np.arange(2), 'lat': lats, 'lon': lons})
+    parent = ThreeDNode("parent", da, field_name='temp')
+    parent.plot_size_stream.event(height=50, width=80)
+
+    anim = AnimationNode("anim", da, 'time', Resolutions.AUTO.value, field_name='temp', parent=parent)
+    anim.wait_pre_render()
+    assert anim.coarsen == 4 and anim.data.sizes['lat'] == 100
+
+    # A zoomed-in start shows the same canvas with fewer cells: full resolution
+    zoomed = AnimationNode("zoom", da, 'time', Resolutions.AUTO.value, field_name='temp', parent=parent,
+                           x_range=(-5, 5), y_range=(-4, 4))
+    zoomed.wait_pre_render()
+    assert zoomed.coarsen == 1 and zoomed.data.sizes['lat'] < 150
+    anim.close()
+    zoomed.close()
@@ -0,0 +1,61 @@
+import cartopy.crs as ccrs
+import geoviews as gv
+import numpy as np
+import pytest
+import xarray as xr
+
+from model.projection import MERCATOR, MercatorGrid, get_mercator_grid, lonlat_to_mercator
+from model.ThreeDNode import ThreeDNode
+from model.viewport import mercator_to_lonlat, point_to_lonlat
+
+
+@pytest.fixture
+def field():
+    lats = np.linspace(60, -10, 71)  # descending, like many ocean products
+    lons = np.linspace(-100, -30, 141)
+    values = np.add.outer(lats, np.zeros_like(lons))  # value = latitude
+    return xr.DataArray(np.stack([values, values + 1]), dims=('time', 'lat', 'lon'), name='sst',
+                        coords={'time': [0, 1], 'lat': lats, 'lon': lons})
+
+
+def test_matches_cartopy():
+    lons, lats = np.array([-120.0, 0.0, 45.5]), np.array([-60.0, 0.0, 30.25])
+    x, y = lonlat_to_mercator(lons, lats)
+    expected = MERCATOR.transform_points(ccrs.PlateCarree(), lons, lats)
+    np.testing.assert_allclose(x, expected[:, 0], rtol=1e-6)
+    np.testing.assert_allclose(y, expected[:, 1], rtol=1e-6, atol=1e-3)
+    assert point_to_lonlat(x[2], y[2]) == pytest.approx((45.5, 30.25))
+    assert point_to_lonlat(45.5, 30.25) == (45.5, 30.25)
+
+
+def test_resampling_to_uniform_axes(field):
+    lats, lons = field['lat'].values, field['lon'].values
+    x, y, values = MercatorGrid(lats, lons).project(field.values[0])
+    assert values.shape == (lats.size, lons.size)
+    assert np.allclose(np.diff(y), y[1] - y[0]) and y[1] > y[0]
+    # Each row holds the source row nearest to its Mercator latitude
+    row_lats = np.array([mercator_to_lonlat(0, v)[1] for v in y])
+    assert np.max(np.abs(values[:, 0] - row_lats)) <= 0.5 + 1e-6
+    # Longitudes are linear in Mercator: no resampling
+    np.testing.assert_allclose(x, lonlat_to_mercator(lons, 0 * lons)[0])
+
+
+def test_grid_is_shared_and_skips_wrapped_longitudes(field):
+    lats, lons = field['lat'].values, field['lon'].values
+    assert get_mercator_grid(lats, lons) is get_mercator_grid(lats.copy(), lons.copy())
+    assert get_mercator_grid(lats, np.linspace(0, 359, 360)) is None
+
+
+def test_nodes_render_in_mercator(field):
+    node = ThreeDNode('sst', field, field_name='sst')
+    img = node._render_plot()
+    assert isinstance(img, gv.Image) and img.crs == MERCATOR
+    assert node.data is field
+
+    # Without projection the slice stays in PlateCarree; its aggregate is still
+    # resampled to Web Mercator, where the viewport ranges are
+    node.project_mercator = False
+    values = field.isel(time=0).values
+    lonlat = node._geo_element(values, field['lat'].values, field['lon'].values, ['lon', 'lat'], ['sst'])
+    assert isinstance(lonlat.crs, ccrs.PlateCarree)
+    assert node._render_plot().crs == MERCATOR
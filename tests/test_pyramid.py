@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from model.pyramid import PyramidStore, block_mean_levels, choose_factor
+from model.ThreeDNode import ThreeDNode
+
+zarr = pytest.importorskip('zarr')
+
+
+@pytest.fixture
+def cube(tmp_path):
+    values = np.random.default_rng(3).random((3, 64, 96))
+    values[:, :8, :8] = np.nan
+    data = xr.DataArray(values, dims=('time', 'lat', 'lon'), name='temp',
+                        coords={'time': np.arange(3), 'lat': np.linspace(18, 31, 64),
+                                'lon': np.linspace(-98, -76, 96)})
+    data.to_dataset().to_netcdf(tmp_path / 'cube.nc')
+    return data
+
+
+def test_block_means_ignore_nan():
+    values = np.arange(16, dtype=float).reshape(4, 4)
+    values[0, 0] = np.nan
+    levels = block_mean_levels(values, factors=(2, 4))
+    assert levels[2][0, 0] == pytest.approx((1 + 4 + 5) / 3)
+    assert levels[4][0, 0] == pytest.approx(np.nanmean(values))
+
+
+def test_choose_factor_keeps_one_cell_per_pixel():
+    assert choose_factor((4000, 8000), (500, 1000)) == 8
+    assert choose_factor((1200, 2400), (500, 1000)) == 2
+    assert choose_factor((600, 800), (500, 1000)) == 1
+
+
+def test_write_and_read_window(tmp_path, cube):
+    store = PyramidStore(str(tmp_path), 'cube.nc')
+    pyramid = store.variable('temp', cube)
+    assert not pyramid.has((1,))
+    pyramid.write((1,), cube[1].values)
+    assert pyramid.has((1,))
+
+    values, (lat_sl, lon_sl) = pyramid.read((1,), 4, (slice(8, 32), slice(16, 48)))
+    expected = block_mean_levels(cube[1].values, (2, 4, 8))[4][2:8, 4:12]
+    np.testing.assert_allclose(values, expected)
+    # Built flags survive reopening the store
+    assert PyramidStore(str(tmp_path), 'cube.nc').variable('temp', cube).has((1,))
+
+
+def test_store_without_files_is_not_written_to_working_directory(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    monkeypatch.setattr('model.data_loader.CACHE_DIR', str(cache_dir))
+    monkeypatch.chdir(tmp_path)
+    store = PyramidStore('')
+    assert store.store_path.startswith(str(cache_dir))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['cache']
+
+
+def test_zoomed_out_render_reads_overview(tmp_path, cube):
+    pyramid = PyramidStore(str(tmp_path), 'cube.nc').variable('temp', cube)
+    pyramid.write((0,), cube[0].values)
+    node = ThreeDNode('test_pyramid', cube, third_coord_idx=0, field_name='temp')
+    node.pyramid = pyramid
+
+    img = node._render_plot(width=12, height=8)
+    # 64x96 cells on a 16x24 pixel canvas (pixel ratio 2) -> 4x4 blocks
+    assert img.dimension_values(2, flat=False).shape == (16, 24)
+    img = node._render_plot(width=400, height=300)
+    assert img.dimension_values(2, flat=False).shape == (64, 96)
+
+
+def test_refresh_grows_levels_and_drops_stale_slices(tmp_path, cube):
+    store = PyramidStore(str(tmp_path), 'cube.nc')
+    pyramid = store.variable('temp', cube)
+    for t in range(3):
+        pyramid.write((t,), cube[t].values)
+
+    grown = xr.concat([cube, cube[:2].assign_coords(time=[3, 4])], dim='time')
+    store.refresh(grown.to_dataset(), stale_steps={1})
+    assert pyramid.lead_shape == (5,)
+    assert pyramid.levels[2].shape[0] == 5
+    assert [pyramid.has((t,)) for t in range(5)] == [True, False, True, False, False]
+    pyramid.write((4,), grown[4].values)
+    assert pyramid.has((4,))
@@ -0,0 +1,79 @@
+import geoviews as gv
+import numpy as np
+import pytest
+import xarray as xr
+
+from model.regrid import Regridder, get_regridder
+from model.ThreeDNode import ThreeDNode
+
+
+def linear(lons, lats):
+    return 2.0 * lons + 0.3 * lats
+
+
+@pytest.fixture
+def rotated_grid():
+    # 20 degrees rotated grid, like a Lambert conformal WRF domain
+    j, i = np.meshgrid(np.arange(60), np.arange(40))
+    theta = np.radians(20)
+    lons = -100 + 0.05 * (j * np.cos(theta) - i * np.sin(theta))
+    lats = 20 + 0.05 * (j * np.sin(theta) + i * np.cos(theta))
+    return lats, lons
+
+
+@pytest.mark.parametrize('method, tolerance', [('nearest', 0.08), ('bilinear', 1e-3)])
+def test_regrid_linear_field(rotated_grid, method, tolerance):
+    lats, lons = rotated_grid
+    values, tlats, tlons = Regridder(lats, lons, method).regrid(linear(lons, lats))
+    assert values.shape == (tlats.size, tlons.size)
+    assert np.all(np.diff(tlats) > 0) and np.all(np.diff(tlons) > 0)
+
+    expected = linear(*np.meshgrid(tlons, tlats))
+    inside = np.isfinite(values)
+    # Corners of the bounding box are outside the rotated domain
+    assert 0.4 < inside.mean() < 0.9
+    errors = np.abs(values - expected)[inside]
+    assert np.percentile(errors, 90) < tolerance
+
+
+def test_window_matches_full_regrid(rotated_grid):
+    lats, lons = rotated_grid
+    regridder = Regridder(lats, lons, 'bilinear')
+    full, tlats, tlons = regridder.regrid(linear(lons, lats))
+    window = (slice(10, 30), slice(15, 45))
+    part, plats, plons = regridder.regrid(linear(lons, lats)[window], window)
+    rows = np.searchsorted(tlats, plats)
+    cols = np.searchsorted(tlons, plons)
+    both = np.isfinite(part) & np.isfinite(full[np.ix_(rows, cols)])
+    assert both.sum() > 100
+    # Only cells on the edge of the window (partly fed from outside it) may differ
+    close = np.isclose(part[both], full[np.ix_(rows, cols)][both], atol=1e-3)
+    assert close.mean() > 0.85
+
+
+def test_weights_are_cached_on_disk(tmp_path, rotated_grid):
+    lats, lons = rotated_grid
+    first = get_regridder(lats, lons, 'nearest', cache_dir=str(tmp_path))
+    assert len(list(tmp_path.glob('*.npz'))) == 1
+    loaded = Regridder.load(next(tmp_path.glob('*.npz')).as_posix(), lats, lons, 'nearest')
+    np.testing.assert_array_equal(loaded.indices, first.indices)
+
+
+def test_curvilinear_node_renders_image(rotated_grid):
+    lats, lons = rotated_grid
+    data = xr.DataArray(np.stack([linear(lons, lats)] * 2), dims=('Time', 'south_north', 'west_east'),
+                        name='T2', coords={'XLAT': (('south_north', 'west_east'), lats),
+                                           'XLONG': (('south_north', 'west_east'), lons)})
+    node = ThreeDNode('t2', data, field_name='T2')
+    # Element handed to datashader by the render (which returns the aggregate)
+    elements = []
+    rasterize_element = node._rasterize
+    node._rasterize = lambda element, view: rasterize_element(elements.append(element) or element, view)
+
+    assert isinstance(node._render_plot(), gv.Image)
+    assert isinstance(elements[-1], gv.Image)
+
+    node.regrid_method = None
+    node._regridders = {}
+    node._render_plot()
+    assert isinstance(elements[-1], gv.QuadMesh)
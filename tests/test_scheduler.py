@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from model.scheduler import Priority, RenderScheduler
+
+
+@pytest.fixture
+def scheduler():
+    """One worker, held busy until ``release`` is set so the queue order can be set up."""
+    scheduler = RenderScheduler(max_workers=1)
+    release = threading.Event()
+    blocker = scheduler.submit(release.wait, Priority.VISIBLE, session='s0')
+    yield scheduler, release
+    release.set()
+    blocker.result(timeout=10)
+
+
+def test_priority_then_sessions_in_turn(scheduler):
+    scheduler, release = scheduler
+    order = []
+    futures = [scheduler.submit(lambda n=name: order.append(n), priority, session=session)
+               for name, priority, session in [
+                   ('stats', Priority.STATS, 'a'),
+                   ('pre-a1', Priority.PRERENDER, 'a'),
+                   ('pre-a2', Priority.PRERENDER, 'a'),
+                   ('pre-b1', Priority.PRERENDER, 'b'),
+                   ('fetch', Priority.PREFETCH, 'b'),
+                   ('visible', Priority.VISIBLE, 'a'),
+               ]]
+    release.set()
+    for future in futures:
+        future.result(timeout=10)
+    assert order == ['visible', 'fetch', 'pre-a1', 'pre-b1', 'pre-a2', 'stats']
+
+
+def test_cancel_owner_and_session(scheduler):
+    scheduler, release = scheduler
+    ran = []
+    a = scheduler.submit(lambda: ran.append('a'), owner='node-a', session='s1')
+    b = scheduler.submit(lambda: ran.append('b'), owner='node-b', session='s1')
+    c = scheduler.submit(lambda: ran.append('c'), owner='node-c', session='s2')
+    assert scheduler.cancel('node-a') == 1
+    assert scheduler.cancel_session('s1') == 1
+    release.set()
+    c.result(timeout=10)
+    assert a.cancelled() and b.cancelled() and ran == ['c']
+
+
+def test_step_jobs_interleave_and_cancel(scheduler):
+    scheduler, release = scheduler
+    order = []
+
+    def steps(name, n):
+        for i in range(n):
+            order.append(f"{name}{i}")
+            yield
+        return name
+
+    long_job = scheduler.submit_steps(steps('a', 3), Priority.PRERENDER, owner='a', session='s1')
+    other = scheduler.submit_steps(steps('b', 2), Priority.PRERENDER, owner='b', session='s2')
+    release.set()
+    assert long_job.result(timeout=10) == 'a' and other.result(timeout=10) == 'b'
+    # A step of each session in turn, not the whole long job first
+    assert order == ['a0', 'b0', 'a1', 'b1', 'a2']
+
+    gate = threading.Event()
+    stopped = scheduler.submit_steps((gate.wait() for _ in range(100)), owner='c')
+    scheduler.cancel('c')
+    gate.set()
+    assert stopped.cancelled()
+    assert scheduler.submit(lambda: 1).result(timeout=10) == 1
+    assert scheduler.stats()['jobs'] == 0
+
+
+def test_visible_render_holds_background_work():
+    scheduler = RenderScheduler(max_workers=1)
+    with scheduler.visible():
+        pre = scheduler.submit(lambda: 'pre', Priority.PRERENDER)
+        fetch = scheduler.submit(lambda: 'fetch', Priority.PREFETCH)
+        assert fetch.result(timeout=10) == 'fetch'
+        assert not pre.done()
+    assert pre.result(timeout=10) == 'pre'
+
+
+def test_closing_a_node_keeps_same_id_work_of_other_session(tmp_path):
+    import numpy as np
+    import xarray as xr
+    from model.pyramid import PyramidStore
+    from model.ThreeDNode import ThreeDNode
+    from model.scheduler import get_scheduler
+
+    pytest.importorskip('zarr')
+    data = xr.DataArray(np.random.rand(2, 16, 16), dims=('time', 'lat', 'lon'), name='temp',
+                        coords={'time': np.arange(2), 'lat': np.arange(16.), 'lon': np.arange(16.)})
+    data.to_dataset().to_netcdf(tmp_path / 'cube.nc')
+    scheduler, release = get_scheduler(), threading.Event()
+    blockers = [scheduler.submit(release.wait, Priority.VISIBLE) for _ in range(scheduler.max_workers)]
+
+    # The same figure id in two sessions, each with a statistics task and a pyramid build queued
+    nodes, stats = [], []
+    for session in ('s1', 's2'):
+        node = ThreeDNode('temp', data, field_name='temp')
+        node.pyramid = PyramidStore(str(tmp_path / 'cube.nc'), root=str(tmp_path / session)).variable('temp', data)
+        node._schedule_pyramid_build((0,))
+        stats.append(scheduler.submit(lambda: 'clim', Priority.STATS, owner=node.owner, session=session))
+        nodes.append(node)
+    nodes[0].close()
+    release.set()
+    for blocker in blockers:
+        blocker.result(timeout=10)
+
+    assert stats[0].cancelled() and stats[1].result(timeout=10) == 'clim'
+    deadline = time.time() + 10
+    while not nodes[1].pyramid.has((0,)) and time.time() < deadline:
+        time.sleep(0.05)
+    assert nodes[1].pyramid.has((0,)) and not nodes[0].pyramid.has((0,))
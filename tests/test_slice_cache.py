@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from model.slice_cache import SliceCache, window_key
+
+
+def test_hit_miss_counters():
+    cache = SliceCache(max_bytes=10_000)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return np.ones((10, 10))
+
+    cache.get_or_load(('temp', 0, None), None, loader)
+    cache.get_or_load(('temp', 0, None), None, loader)
+    assert len(loads) == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_concurrent_loads_of_a_slice_read_it_once():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache = SliceCache(max_bytes=10_000)
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        started.set()
+        release.wait(10)
+        return np.ones((10, 10))
+
+    with ThreadPoolExecutor(4) as pool:
+        first = pool.submit(cache.get_or_load, ('temp', 0, None), None, loader)
+        started.wait(10)
+        others = [pool.submit(cache.get_or_load, ('temp', 0, None), None, loader) for _ in range(3)]
+        while cache.stats()['coalesced'] < 3:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [f.result(10) for f in [first] + others]
+    assert len(loads) == 1 and all(r is results[0] for r in results)
+
+    # A failed load is reported to its waiters and retried by the next lookup
+    def failing():
+        raise OSError('read error')
+
+    with pytest.raises(OSError):
+        cache.get_or_load(('temp', 1, None), None, failing)
+    assert cache.get_or_load(('temp', 1, None), None, lambda: np.zeros((2, 2))).shape == (2, 2)
+
+
+def test_lru_eviction_respects_budget():
+    one_slice = np.zeros((10, 10))  # 800 bytes
+    cache = SliceCache(max_bytes=2 * one_slice.nbytes)
+    cache.put(('temp', 0, None), None, one_slice)
+    cache.put(('temp', 1, None), None, one_slice)
+    # Touch t=0 so t=1 becomes the least recently used entry
+    assert cache.get(('temp', 0, None)) is not None
+    cache.put(('temp', 2, None), None, one_slice)
+
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] <= cache.max_bytes
+    assert cache.contains(('temp', 0, None))
+    assert not cache.contains(('temp', 1, None))
+
+
+def test_window_served_from_covering_entry():
+    cache = SliceCache()
+    full = np.arange(100).reshape(10, 10)
+    cache.put(('temp', 0, None), window_key((slice(2, 8), slice(2, 8))), full[2:8, 2:8])
+
+    inner = cache.get(('temp', 0, None), window_key((slice(3, 5), slice(4, 7))))
+    np.testing.assert_array_equal(inner, full[3:5, 4:7])
+    assert cache.get(('temp', 0, None), window_key((slice(0, 5), slice(0, 5)))) is None
+
+
+def test_invalidate_by_slice_key():
+    cache = SliceCache()
+    cache.put(('temp', 0, None), None, np.zeros((2, 2)))
+    cache.put(('temp', 1, None), None, np.zeros((2, 2)))
+    removed = cache.invalidate(lambda key: key[1] == 1)
+    assert removed == 1
+    assert cache.stats()['entries'] == 1
+
@@ -0,0 +1,61 @@
+import threading
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from model.stats import QuantileSketch, estimate_quantiles, quantile_steps, sample_quantiles
+
+
+@pytest.fixture
+def cube():
+    rng = np.random.default_rng(42)
+    values = rng.normal(20, 5, size=(12, 40, 50))
+    values[:, :3, :] = np.nan  # land mask
+    return xr.DataArray(values, dims=('time', 'lat', 'lon'), name='temp')
+
+
+def test_sketch_matches_numpy_quantiles():
+    values = np.random.default_rng(0).gamma(2.0, 3.0, size=100_000)
+    sketch = QuantileSketch()
+    # Feed in chunks with growing range to exercise the bin merging
+    for chunk in np.array_split(np.sort(values), 10):
+        sketch.update(chunk)
+    lo, hi = sketch.quantiles([0.02, 0.98])
+    assert lo == pytest.approx(np.quantile(values, 0.02), rel=0.02)
+    assert hi == pytest.approx(np.quantile(values, 0.98), rel=0.02)
+
+
+def test_sketch_ignores_nan_and_handles_constant_values():
+    sketch = QuantileSketch()
+    assert sketch.quantiles([0.5]) is None
+    sketch.update(np.array([np.nan, 3.0, 3.0, np.inf]))
+    assert sketch.quantiles([0.02, 0.98]) == [3.0, 3.0]
+
+
+def test_estimate_quantiles_over_cube(cube):
+    updates = []
+    result = estimate_quantiles(cube, on_update=lambda q, frac: updates.append(frac)).result(timeout=30)
+    expected = np.nanquantile(cube.values, [0.02, 0.98])
+    np.testing.assert_allclose(result, expected, rtol=0.02)
+    assert updates and updates[-1] == 1.0
+
+
+def test_estimate_quantiles_stops_when_requested(cube):
+    stop = threading.Event()
+    stop.set()
+    updates = []
+    estimate_quantiles(cube, on_update=lambda q, frac: updates.append(frac), stop_event=stop).result(timeout=30)
+    assert updates == []
+
+
+def test_quantile_steps_read_a_few_slices_each(cube):
+    steps = quantile_steps(cube, slices_per_step=5)
+    assert sum(1 for _ in steps) == 3  # 12 slices, 5 per step
+
+
+def test_sample_quantiles_reads_first_slice(cube):
+    cube = cube.copy()
+    cube[1:] = 1000.0
+    lo, hi = sample_quantiles(cube)
+    assert hi < 100
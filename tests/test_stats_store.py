@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from model.stats_store import StatsStore, compute_variable_stats, variable_stats_steps
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    rng = np.random.default_rng(1)
+    temp = rng.normal(15, 3, size=(4, 20, 30))
+    temp[:, :2, :] = np.nan
+    ds = xr.Dataset(
+        {'temp': (('time', 'lat', 'lon'), temp),
+         'depth': (('lat', 'lon'), rng.uniform(0, 100, size=(20, 30)))},
+        coords={'time': np.arange(4), 'lat': np.linspace(18, 31, 20), 'lon': np.linspace(-98, -76, 30)},
+    )
+    ds.to_netcdf(tmp_path / 'data_01.nc')
+    return tmp_path
+
+
+def test_variable_stats_per_step():
+    values = np.stack([np.full((10, 10), float(t)) for t in range(3)])
+    values[0, :5] = np.nan
+    stats = compute_variable_stats(xr.DataArray(values, dims=('time', 'lat', 'lon')))
+    assert stats['min'] == 0.0 and stats['max'] == 2.0
+    assert stats['steps']['dim'] == 'time'
+    assert stats['steps']['max'] == [0.0, 1.0, 2.0]
+    assert stats['steps']['valid_fraction'][0] == pytest.approx(0.5)
+
+
+def test_variable_stats_yield_every_few_time_steps():
+    data = xr.DataArray(np.random.rand(10, 8, 8), dims=('time', 'lat', 'lon'))
+    steps = variable_stats_steps(data, time_steps_per_yield=4)
+    assert sum(1 for _ in steps) == 2  # after time steps 4 and 8, then the last 2
+
+
+def test_sidecar_round_trip(dataset_dir):
+    store = StatsStore(str(dataset_dir), '*.nc')
+    with xr.open_mfdataset(str(dataset_dir / '*.nc'), decode_times=False) as ds:
+        store.compute_missing(ds)
+    assert os.path.dirname(store.sidecar_path) == str(dataset_dir)
+    assert set(store.all()) == {'temp', 'depth'}
+
+    # A new session reads them back without recomputing
+    reloaded = StatsStore(str(dataset_dir), '*.nc')
+    assert reloaded.get('temp') == store.get('temp')
+    assert reloaded.get('temp')['valid_fraction'] == pytest.approx(0.9, abs=0.05)
+
+
+def test_sidecar_invalidated_when_files_change(dataset_dir):
+    store = StatsStore(str(dataset_dir), '*.nc')
+    with xr.open_mfdataset(str(dataset_dir / '*.nc'), decode_times=False) as ds:
+        store.compute_missing(ds)
+
+    data_file = dataset_dir / 'data_01.nc'
+    st = os.stat(data_file)
+    os.utime(data_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert StatsStore(str(dataset_dir), '*.nc').get('temp') is None
@@ -0,0 +1,257 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import panel as pn
+import pytest
+import xarray as xr
+
+import model.FigureNode as figure_module
+from model.prefetch import get_prefetcher
+from model.projection import lonlat_to_mercator
+from model.scheduler import Priority, get_scheduler
+from model.slice_cache import SliceCache
+from model.ThreeDNode import ThreeDNode
+
+LATS = np.linspace(20, 30, 40)
+
+
+@pytest.fixture
+def make_node():
+    """Builds ThreeDNodes over a random (time, lat, lon) cube, each with its own slice cache."""
+    nodes = []
+
+    def make(steps=3, shape=(10, 10), data=None):
+        if data is None:
+            data = xr.DataArray(np.random.rand(steps, *shape), dims=('time', 'lat', 'lon'), name='temp',
+                                coords={'time': np.arange(steps), 'lat': np.linspace(-30, 30, shape[0]),
+                                        'lon': np.linspace(-40, 40, shape[1])})
+        node = ThreeDNode('temp', data, third_coord_idx=0, field_name='temp')
+        node.slice_cache = SliceCache()
+        nodes.append(node)
+        return node
+
+    yield make
+    for node in nodes:
+        node.close()
+
+
+def fake_session(monkeypatch, **callbacks):
+    """Makes pn.state.curdoc a server session document with the given callbacks."""
+    doc = SimpleNamespace(session_context=SimpleNamespace(id='s'), **callbacks)
+    monkeypatch.setattr(type(pn.state), 'curdoc', property(lambda self: doc))
+
+
+def mercator_view(lon0, lat0, lon1, lat1):
+    (x0, x1), (y0, y1) = lonlat_to_mercator(np.array([lon0, lon1]), np.array([lat0, lat1]))
+    return dict(x_range=(float(x0), float(x1)), y_range=(float(y0), float(y1)), width=100, height=80)
+
+
+@pytest.mark.parametrize('lons, project_mercator', [(np.linspace(262, 280, 60), True),
+                                                     (np.linspace(-98, -80, 60), False)])
+def test_zoomed_map_of_lonlat_element_is_not_empty(lons, project_mercator):
+    # 0..360 longitudes and project_mercator off leave the element in PlateCarree
+    data = xr.DataArray(np.random.rand(2, LATS.size, lons.size), dims=('time', 'lat', 'lon'), name='sst',
+                        coords={'time': [0.0, 1.0], 'lat': LATS, 'lon': lons})
+    node = ThreeDNode('sst', data, field_name='sst')
+    node.project_mercator = project_mercator
+    view = mercator_view(-95, 22, -85, 28)
+    element = node._render_plot(**view)
+
+    values = element.dimension_values(2, flat=False)
+    assert values.size and np.isfinite(values).all()
+    x0, x1 = element.range(0)
+    assert view['x_range'][0] - 1e5 <= x0 < x1 <= view['x_range'][1] + 1e5
+    node.close()
+
+
+def test_threed_node_reuses_cached_slice(make_node):
+    node = make_node()
+    node._render_plot()
+    node.next_slice()
+    node._render_plot()
+    node.prev_slice()
+    # Another canvas: the rasterized aggregate is not cached, the slice is
+    node._render_plot(width=400, height=300)
+
+    stats = node.slice_cache.stats()
+    assert stats['misses'] == 2
+    assert stats['hits'] == 1
+
+
+def test_forward_navigation_prefetches_next_slices(make_node):
+    node = make_node(steps=6)
+    node.prefetch_depth = 2
+
+    node._render_plot()
+    node.next_slice()
+    # Wait for the background reads of t+1 and t+2
+    assert get_prefetcher().wait(node.owner, timeout=10)
+
+    assert node.slice_cache.contains(('temp', 2, None))
+    assert node.slice_cache.contains(('temp', 3, None))
+    assert not node.slice_cache.contains(('temp', 5, None))
+
+
+def test_prefetch_of_same_id_in_two_sessions_is_independent(make_node):
+    nodes = [make_node(steps=6) for _ in range(2)]
+    scheduler, release = get_scheduler(), threading.Event()
+    blockers = [scheduler.submit(release.wait, Priority.VISIBLE) for _ in range(scheduler.max_workers)]
+    for node in nodes:
+        node.prefetch_depth = 2
+        node.next_slice()
+    release.set()
+    for blocker in blockers:
+        blocker.result(timeout=10)
+    # Navigating in the second session did not cancel the first one's prefetch
+    for node in nodes:
+        assert get_prefetcher().wait(node.owner, timeout=10)
+        assert node.slice_cache.contains(('temp', 2, None))
+
+
+def test_visible_read_waits_for_prefetch_of_same_slice(make_node):
+    import dask
+    import dask.array as da
+
+    values = np.random.rand(3, 10, 10)
+    loads, started, release = [], threading.Event(), threading.Event()
+    armed = False
+
+    def read(t):
+        if armed:
+            loads.append(t)
+            started.set()
+            release.wait(10)
+        return values[t]
+
+    cube = da.stack([da.from_delayed(dask.delayed(read)(t), (10, 10), float) for t in range(3)])
+    node = make_node(data=xr.DataArray(cube, dims=('time', 'lat', 'lon'), name='temp',
+                                       coords={'time': np.arange(3), 'lat': np.arange(10.), 'lon': np.arange(10.)}))
+    node.prefetch_depth = 1
+    node._render_plot()
+
+    armed = True
+    node._prefetch_neighbours('time', 1)
+    assert started.wait(10)
+    # The render of the slice being prefetched waits for that read instead of reading it again
+    node.third_coord_idx = 1
+    render = threading.Thread(target=node._render_plot)
+    render.start()
+    deadline = time.time() + 10
+    while node.slice_cache.stats()['coalesced'] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    render.join(10)
+    assert get_prefetcher().wait(node.owner, timeout=10)
+    assert loads == [1] and node.slice_cache.stats()['coalesced'] == 1
+
+
+def test_navigation_clicks_coalesce_into_latest_render(make_node, monkeypatch):
+    node = make_node(steps=12)
+    node.get_controls()
+    first = node._render_plot()
+    renders = []
+    node.update_stream.add_subscriber(lambda **kwargs: renders.append(node.third_coord_idx))
+
+    # In a server session clicks only update the label until the debounce timeout fires
+    timeouts = []
+    fake_session(monkeypatch, add_timeout_callback=lambda cb, ms: timeouts.append(cb))
+    for _ in range(10):
+        node.next_slice()
+    assert node._nav_labels['time'].object == '10 (11/12)'
+    assert len(timeouts) == 1 and renders == []
+    timeouts[0]()
+    assert renders == [10]
+
+    # A render overtaken by a newer click keeps the element on screen instead of reading
+    read = node._read_field
+
+    def read_then_click(*args, **kwargs):
+        node.next_slice()
+        return read(*args, **kwargs)
+
+    monkeypatch.setattr(node, '_read_field', read_then_click)
+    assert node._render_plot() is first
+    assert node._rendered_generation != node._nav_generation
+
+
+def test_cold_read_renders_coarse_then_fine(make_node, monkeypatch):
+    node = make_node(shape=(120, 160))
+    ticks = []
+    fake_session(monkeypatch, add_next_tick_callback=ticks.append, add_timeout_callback=lambda cb, ms: None)
+    renders = []
+    node.update_stream.add_subscriber(lambda **kwargs: renders.append(node.third_coord_idx))
+    view = dict(width=80, height=60)
+
+    # Slow reads: the 100 ms target only allows a strided version first
+    node._read_rate = 1e5
+    coarse = node._render_plot(**view)
+    assert node._fine_pass.result(timeout=10) is True
+    assert node.slice_cache.contains(('temp', 0, None))
+    ticks.pop()()
+    assert renders == [0]
+    fine = node._render_plot(**view)
+    # Same extent, at the resolution of the strided read first
+    assert coarse.dimension_values(2).size * 4 == fine.dimension_values(2).size
+    np.testing.assert_allclose(coarse.bounds.lbrt(), fine.bounds.lbrt(), rtol=0.05)
+    # Once the slice is in memory it is rendered at once
+    assert node._render_plot(**dict(view, width=60)) is not None and not ticks
+
+    # The full pass is dropped when the user moved on before it ran
+    node._read_rate = 1e5
+    scheduler, release = get_scheduler(), threading.Event()
+    blockers = [scheduler.submit(release.wait, Priority.VISIBLE) for _ in range(scheduler.max_workers)]
+    node.next_slice()
+    node._render_plot(**view)
+    node.next_slice()
+    release.set()
+    for blocker in blockers:
+        blocker.result(timeout=10)
+    assert node._fine_pass.result(timeout=10) is False
+    assert not node.slice_cache.contains(('temp', 1, None)) and not ticks
+
+
+def test_map_returns_to_viewport_from_aggregate_cache(make_node, monkeypatch):
+    node = make_node(shape=(40, 60))
+    full = dict(x_range=(-2e6, 2e6), y_range=(-1e6, 1e6), width=100, height=50)
+    first = node._render_plot(**full)
+    node._render_plot(**dict(full, x_range=(-1e6, 1e6)))
+    assert len(node._aggregates) == 2
+
+    def no_read(*args, **kwargs):
+        raise AssertionError("slice read or rasterized again")
+
+    # Back to the first viewport ("reset"): served without touching the data
+    monkeypatch.setattr(node, '_read_field', no_read)
+    monkeypatch.setattr(figure_module, 'rasterize', no_read)
+    cached = node._render_plot(**full)
+    # Aggregates are stored as float32
+    np.testing.assert_allclose(cached.dimension_values(2, flat=False), first.dimension_values(2, flat=False), rtol=1e-6)
+    np.testing.assert_allclose(cached.bounds.lbrt(), first.bounds.lbrt())
+    assert cached.crs == first.crs
+    monkeypatch.undo()
+
+    # Another slice or new data miss the cache
+    node.next_slice()
+    node._render_plot(**full)
+    assert len(node._aggregates) == 3
+    node.update_data(node.data)
+    assert len(node._aggregates) == 0
+
+
+def test_aggregate_on_screen_is_kept_uncompressed(make_node):
+    node = make_node(shape=(40, 60))
+    compression = node._aggregates.store.compression
+    full = dict(x_range=(-2e6, 2e6), y_range=(-1e6, 1e6), width=100, height=50)
+    node._render_plot(**full)
+    full_key = node._render_key
+    node._render_plot(**dict(full, x_range=(-1e6, 1e6)))
+    zoomed_key = node._render_key
+    assert node._aggregates.get(zoomed_key).codec == 'none'
+    assert node._aggregates.get(full_key).codec == compression
+
+    # Going back swaps them
+    node._render_plot(**full)
+    assert node._aggregates.get(full_key).codec == 'none'
+    assert node._aggregates.get(zoomed_key).codec == compression
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import holoviews as hv
+import panel as pn
+import pytest
+
+from model.throttle import Viewport, ViewportThrottle, quantize_range
+
+
+@pytest.fixture
+def server_doc(monkeypatch):
+    """Fake session document collecting the timeout callbacks instead of running them."""
+    timeouts = []
+    doc = SimpleNamespace(session_context=SimpleNamespace(id='s'),
+                          add_timeout_callback=lambda cb, ms: timeouts.append(cb))
+    monkeypatch.setattr(type(pn.state), 'curdoc', property(lambda self: doc))
+    return timeouts
+
+
+def test_quantize_range_snaps_outwards():
+    lo, hi = quantize_range((-1000.3, 9000.7), steps=100)
+    assert lo <= -1000.3 and hi >= 9000.7
+    assert quantize_range((-1000.2, 9000.6), steps=100) == (lo, hi)
+    assert quantize_range(None) is None
+    assert quantize_range((1.0, 1.0)) == (1.0, 1.0)
+    assert quantize_range((0.5, 2.5), steps=0) == (0.5, 2.5)
+
+
+def test_pan_steps_render_once_on_trailing_edge(server_doc):
+    source, target = hv.streams.RangeXY(), Viewport()
+    views = []
+    target.add_subscriber(lambda x_range=None, y_range=None: views.append((x_range, y_range)))
+    throttle = ViewportThrottle(source, target, interval_ms=100, steps=64)
+
+    for dx in range(20):
+        source.event(x_range=(dx * 1000.0, dx * 1000.0 + 1e6), y_range=(0.0, 5e5))
+    assert len(server_doc) == 1 and views == []
+    server_doc[0]()
+    assert views == [(quantize_range((19000.0, 1019000.0), 64), quantize_range((0.0, 5e5), 64))]
+
+    # A pan smaller than a grid cell maps to the same view and is dropped
+    source.event(x_range=(19001.0, 1019001.0), y_range=(0.0, 5e5))
+    server_doc[1]()
+    assert throttle.received == 21 and throttle.forwarded == 1 and len(views) == 1
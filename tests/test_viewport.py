@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from holoviews.util.transform import lon_lat_to_easting_northing
+
+from model.viewport import compute_index_window, ranges_to_lonlat
+
+
+@pytest.fixture
+def regular_grid():
+    lats = np.linspace(18, 31, 131)
+    lons = np.linspace(-98, -76, 221)
+    return lats, lons
+
+
+def test_unknown_viewport_reads_everything(regular_grid):
+    lats, lons = regular_grid
+    assert compute_index_window(lats, lons, None, None) is None
+
+
+def test_mercator_ranges_are_converted():
+    x0, y0 = lon_lat_to_easting_northing(-90, 24)
+    x1, y1 = lon_lat_to_easting_northing(-88, 26)
+    min_lon, max_lon, min_lat, max_lat = ranges_to_lonlat((x0, x1), (y0, y1))
+    assert min_lon == pytest.approx(-90)
+    assert max_lon == pytest.approx(-88)
+    assert min_lat == pytest.approx(24)
+    assert max_lat == pytest.approx(26)
+
+
+def test_regular_window_covers_viewport_with_margin(regular_grid):
+    lats, lons = regular_grid
+    lat_sl, lon_sl = compute_index_window(lats, lons, (-90, -88), (24, 26), margin=0.2)
+    assert lats[lat_sl][0] <= 24 - 0.4 and lats[lat_sl][-1] >= 26 + 0.4
+    assert lons[lon_sl][0] <= -90 - 0.4 and lons[lon_sl][-1] >= -88 + 0.4
+    # Much smaller than the full grid
+    assert (lat_sl.stop - lat_sl.start) < lats.size / 2
+    assert (lon_sl.stop - lon_sl.start) < lons.size / 4
+
+
+def test_descending_latitudes(regular_grid):
+    lats, lons = regular_grid
+    lat_sl, _ = compute_index_window(lats[::-1], lons, (-90, -88), (24, 26), margin=0.0)
+    window = lats[::-1][lat_sl]
+    assert window.max() >= 26 and window.min() <= 24
+
+
+def test_curvilinear_window(regular_grid):
+    lats, lons = regular_grid
+    lon2d, lat2d = np.meshgrid(lons, lats)
+    lat_sl, lon_sl = compute_index_window(lat2d, lon2d, (-90, -88), (24, 26), margin=0.0)
+    assert lat2d[lat_sl, lon_sl].min() <= 24 and lat2d[lat_sl, lon_sl].max() >= 26
+    assert lon2d[lat_sl, lon_sl].min() <= -90 and lon2d[lat_sl, lon_sl].max() >= -88
+
+
+def test_viewport_outside_domain_returns_small_window(regular_grid):
+    lats, lons = regular_grid
+    lat_sl, lon_sl = compute_index_window(lats, lons, (10, 20), (-60, -50))
+    assert lat_sl.stop - lat_sl.start == 2
+    assert lon_sl.stop - lon_sl.start == 2
@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from model.ThreeDNode import ThreeDNode
+from model.slice_cache import SliceCache
+from model.watcher import DatasetWatcher, invalidate_slices, is_stale
+
+
+def write_file(directory, i, offset=0.0):
+    ds = xr.Dataset(
+        {'sst': (('time', 'lat', 'lon'), np.full((2, 4, 5), float(i) + offset))},
+        coords={'time': [2 * i, 2 * i + 1], 'lat': np.arange(4.0), 'lon': np.arange(5.0)},
+    )
+    # Written aside and moved in place, like a model run delivering its output
+    path = directory / f'data_{i:02d}.nc'
+    ds.to_netcdf(directory / 'incoming.tmp')
+    os.replace(directory / 'incoming.tmp', path)
+    # Make sure the rewrite is visible even on coarse mtime filesystems
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + i + int(offset * 1e9) + 1))
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    for i in range(3):
+        write_file(tmp_path, i)
+    return tmp_path
+
+
+@pytest.fixture
+def watcher(dataset_dir):
+    data = xr.open_mfdataset(str(dataset_dir / '*.nc'), decode_times=False)
+    return DatasetWatcher(str(dataset_dir), '*.nc', data, interval=3600)
+
+
+def test_appended_file_grows_dataset(dataset_dir, watcher):
+    updates = []
+    watcher.subscribe(updates.append)
+    assert watcher.check() is None
+
+    write_file(dataset_dir, 3)
+    update = watcher.check()
+    assert updates == [update]
+    assert update.added_files == [str(dataset_dir / 'data_03.nc')]
+    assert (update.step_dim, update.old_steps, update.new_steps) == ('time', 6, 8)
+    # Existing steps are untouched
+    assert update.stale_steps == set()
+    assert watcher.data.sizes['time'] == 8
+    np.testing.assert_array_equal(watcher.data['sst'][7].values, 3.0)
+
+
+def test_rewritten_file_marks_its_steps_stale(dataset_dir, watcher):
+    write_file(dataset_dir, 1, offset=10.0)
+    update = watcher.check()
+    assert update.modified_files == [str(dataset_dir / 'data_01.nc')]
+    assert update.stale_steps == {2, 3}
+    np.testing.assert_array_equal(watcher.data['sst'][2].values, 11.0)
+
+    os.remove(dataset_dir / 'data_00.nc')
+    assert watcher.check().stale_steps is None
+
+
+def test_bound_listeners_are_weak(dataset_dir, watcher):
+    class Session:
+        def __init__(self):
+            self.updates = []
+
+        def on_update(self, update):
+            self.updates.append(update)
+
+    session = Session()
+    watcher.subscribe(session.on_update)
+    write_file(dataset_dir, 3)
+    watcher.check()
+    assert len(session.updates) == 1
+
+    del session
+    write_file(dataset_dir, 4)
+    watcher.check()
+    assert watcher._listeners == []
+
+
+def test_invalidate_slices_only_drops_stale_steps():
+    cache = SliceCache()
+    for t in range(3):
+        cache.put(('sst', t, None), None, np.zeros(4))
+    assert invalidate_slices(cache, {1}) == 1
+    assert cache.contains(('sst', 0, None)) and not cache.contains(('sst', 1, None))
+    invalidate_slices(cache, None)
+    assert cache.stats()['entries'] == 0
+    assert is_stale(None, 0) and is_stale({2}, 2) and not is_stale({2}, None)
+
+
+def test_threed_node_extends_animation(dataset_dir, watcher):
+    node = ThreeDNode('sst', watcher.data['sst'], third_coord_idx=1, field_name='sst')
+    node.add_node_callback = node.add_child
+    node._animate_callback('time')
+    anim = node.get_children()[0]
+    anim.wait_pre_render()
+    assert anim.player.end == 5 and len(anim._cache) == 6
+
+    counter = node.update_stream.counter
+    write_file(dataset_dir, 3)
+    update = watcher.check()
+    node.update_data(update.data['sst'], update.stale_steps)
+    anim.wait_pre_render()
+
+    assert len(node.data[node.coord_names[0]]) == 8
+    assert node.update_stream.counter == counter  # current slice did not change
+    assert anim.player.end == 7 and len(anim._cache) == 8